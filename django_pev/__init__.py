@@ -1,5 +1,6 @@
 # mypy: ignore-errors
 from .utils import explain  # NOQA
+from .utils.budget import QueryBudget  # NOQA
 
 try:
     import importlib.metadata as importlib_metadata  # type: ignore[import]
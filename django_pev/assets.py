@@ -0,0 +1,84 @@
+"""Third party assets of the embedded PEV page.
+
+The assets are loaded from django_pev's static files when vendored with
+`python manage.py pev_vendor_assets` (done when building the package), otherwise from their CDN.
+Vendored files are served by the project's static files server, eg. with hashed names by
+ManifestStaticFilesStorage so they can be cached indefinitely.
+"""
+
+import functools
+import urllib.request
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+VENDOR_DIR = Path(__file__).parent / "static"
+
+# Versions are pinned so that vendoring at build time is reproducible
+VUE_VERSION = "3.2.45"
+PEV2_VERSION = "1.11.0"
+BOOTSTRAP_VERSION = "5.3.2"
+
+
+@dataclass(frozen=True)
+class Asset:
+    cdn_url: str
+    # Path of the vendored file within the static files
+    path: str
+
+
+ASSETS = {
+    "vue.js": Asset(
+        cdn_url=f"https://unpkg.com/vue@{VUE_VERSION}/dist/vue.global.prod.js",
+        path="django_pev/vendor/vue/vue.global.prod.js",
+    ),
+    "pev2.js": Asset(
+        cdn_url=f"https://unpkg.com/pev2@{PEV2_VERSION}/dist/pev2.umd.js",
+        path="django_pev/vendor/pev2/pev2.umd.js",
+    ),
+    "pev2.css": Asset(
+        cdn_url=f"https://unpkg.com/pev2@{PEV2_VERSION}/dist/pev2.css",
+        path="django_pev/vendor/pev2/pev2.css",
+    ),
+    "bootstrap.css": Asset(
+        cdn_url=f"https://unpkg.com/bootstrap@{BOOTSTRAP_VERSION}/dist/css/bootstrap.min.css",
+        path="django_pev/vendor/bootstrap/bootstrap.min.css",
+    ),
+}
+
+
+@functools.cache
+def is_vendored(name: str) -> bool:
+    return finders.find(ASSETS[name].path) is not None
+
+
+def asset_url(name: str) -> str:
+    """Returns the URL of a vendored asset, or its CDN URL when it was not vendored.
+
+    With `DJANGO_PEV_OFFLINE_ASSETS` the static URL is always used so no page ever reaches a CDN.
+    """
+    asset = ASSETS[name]
+    if getattr(settings, "DJANGO_PEV_OFFLINE_ASSETS", False) or is_vendored(name):
+        return static(asset.path)
+    return asset.cdn_url
+
+
+def missing_assets(directory: Path = VENDOR_DIR) -> list[Path]:
+    """The vendored files missing from `directory`, checked before the package is built"""
+    return [directory / asset.path for asset in ASSETS.values() if not (directory / asset.path).is_file()]
+
+
+def vendor_assets(directory: Path = VENDOR_DIR) -> list[Path]:
+    """Downloads every asset into `directory`, the static files of django_pev by default"""
+    paths = []
+    for asset in ASSETS.values():
+        path = directory / asset.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with urllib.request.urlopen(asset.cdn_url) as response:
+            path.write_bytes(response.read())
+        paths.append(path)
+    is_vendored.cache_clear()
+    return paths
@@ -1,19 +1,41 @@
+import http.client
 import json
-import urllib
-import urllib.request
-from dataclasses import dataclass
+import logging
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
 
-API_URL = "https://explain.dalibo.com/new.json"
+from django.conf import settings
+
+from .exceptions import PevUploadError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PEV_URL = "https://explain.dalibo.com"
+# Responses worth retrying, the server is restarting or rate limiting
+RETRY_STATUSES = {429, 502, 503, 504}
+# Uploads are not idempotent, they are only retried when the server did not take the plan
+UPLOAD_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+def get_pev_url() -> str:
+    """The root of the dalibo compatible server plans are uploaded to, `DJANGO_PEV_PEV_URL`"""
+    return getattr(settings, "DJANGO_PEV_PEV_URL", DEFAULT_PEV_URL).rstrip("/")
 
 
 @dataclass
 class PevResponse:
     id: str
     delete_key: str
+    pev_url: str = field(default_factory=get_pev_url)
 
     @property
     def url(self) -> str:
-        return f"https://explain.dalibo.com/plan/{self.id}"
+        return f"{self.pev_url}/plan/{self.id}"
 
     @property
     def delete_url(self) -> str:
@@ -21,23 +43,110 @@ class PevResponse:
 
     def delete(self) -> None:
         """Deletes the plan from explain.dalibo"""
-        urllib.request.urlopen(urllib.request.Request(self.delete_url))
+        pev_client.request("GET", self.delete_url)
 
     def __repr__(self) -> str:
         return f"PevResult(url={self.url})"
 
 
-def upload_sql_plan(query: str, plan: str, title: str) -> PevResponse:
-    """Uploads a sql plan to explain.dalibo for visualization"""
-    payload = json.dumps({"title": title, "plan": json.dumps(plan), "query": query}).encode()
-    with urllib.request.urlopen(
-        urllib.request.Request(
-            API_URL,
-            headers={
-                "Content-Type": "application/json",
-            },
-            data=payload,
+class PevClient:
+    """Sends requests to dalibo compatible servers over keep-alive connections.
+
+    Each thread keeps one connection per server. Requests time out after `DJANGO_PEV_UPLOAD_TIMEOUT`
+    seconds and are retried `DJANGO_PEV_UPLOAD_RETRIES` times, with an exponential backoff, on
+    connection errors and on 429/5xx responses. Requests which are not idempotent (uploads) are only
+    retried when they could not be sent, or on 429/503 responses, so a plan is never uploaded twice.
+    """
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+
+    def get_connection(self, scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+        connections: dict[tuple[str, str], http.client.HTTPConnection] = self.local.__dict__.setdefault(
+            "connections", {}
         )
-    ) as response:
-        data = json.loads(response.read())
-        return PevResponse(id=data["id"], delete_key=data["deleteKey"])
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            connection = connections[(scheme, netloc)] = connection_class(netloc, timeout=timeout)
+        return connection
+
+    def close(self) -> None:
+        """Closes the connections of the current thread"""
+        for connection in self.local.__dict__.pop("connections", {}).values():
+            connection.close()
+
+    def request(self, method: str, url: str, body: bytes | None = None) -> bytes:
+        """Sends a request and returns the body of its response, raising PevUploadError when it fails"""
+        timeout: float = getattr(settings, "DJANGO_PEV_UPLOAD_TIMEOUT", 10)
+        retries: int = getattr(settings, "DJANGO_PEV_UPLOAD_RETRIES", 2)
+        parsed = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(("", "", parsed.path or "/", parsed.query, ""))
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        idempotent = method in IDEMPOTENT_METHODS
+
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+            connection = self.get_connection(parsed.scheme, parsed.netloc, timeout)
+            try:
+                if connection.sock is None:
+                    connection.connect()
+            except OSError as e:
+                # Nothing was sent, any request can be retried
+                connection.close()
+                error = PevUploadError(f"{method} {url} failed: {e!r}")
+                continue
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # The server may have closed a kept alive connection, reconnect on the next attempt
+                connection.close()
+                error = PevUploadError(f"{method} {url} failed: {e!r}")
+                if not idempotent:
+                    # The server may have taken the request before failing
+                    raise error from e
+                continue
+            if response.status in (RETRY_STATUSES if idempotent else UPLOAD_RETRY_STATUSES):
+                error = PevUploadError(f"{method} {url} failed with status {response.status}")
+                continue
+            if response.status >= 400:
+                raise PevUploadError(f"{method} {url} failed with status {response.status}")
+            return data
+        raise error
+
+
+pev_client = PevClient()
+
+
+def upload_sql_plan(query: str, plan: Any, title: str) -> PevResponse:
+    """Uploads a sql plan to explain.dalibo (or `DJANGO_PEV_PEV_URL`) for visualization"""
+    pev_url = get_pev_url()
+    payload = json.dumps({"title": title, "plan": json.dumps(plan), "query": query}).encode()
+    data = json.loads(pev_client.request("POST", f"{pev_url}/new.json", body=payload))
+    return PevResponse(id=data["id"], delete_key=data["deleteKey"], pev_url=pev_url)
+
+
+def upload_sql_plans(plans: list[tuple[str, Any, str]], workers: int = 4) -> list[PevResponse | PevUploadError]:
+    """Uploads many `(query, plan, title)` concurrently.
+
+    Returns the response of each plan in order, or the error of the plans that could not be uploaded.
+    """
+
+    def upload(args: tuple[str, Any, str]) -> PevResponse | PevUploadError:
+        try:
+            return upload_sql_plan(*args)
+        except PevUploadError as e:
+            logger.warning(str(e))
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(upload, plans))
+
+
+def delete_plans(responses: list[PevResponse], workers: int = 4) -> None:
+    """Deletes many uploaded plans concurrently"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(PevResponse.delete, responses))
@@ -2,3 +2,21 @@ class PevException(Exception):
     """Base Exception"""
 
     pass
+
+
+class QueryBudgetExceeded(PevException, AssertionError):
+    """Raised when the queries of an `explain()` block exceed its QueryBudget"""
+
+    pass
+
+
+class QueryBudgetWarning(UserWarning):
+    """Warned when the queries of an `explain()` block exceed its QueryBudget"""
+
+    pass
+
+
+class PevUploadError(PevException):
+    """Raised when a plan could not be uploaded to, or deleted from, the PEV server"""
+
+    pass
@@ -0,0 +1,64 @@
+import json
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .utils.captured_requests import get_cache_key
+from .utils.plans import parse_plan
+
+if TYPE_CHECKING:
+    from .utils import Explain
+
+
+@dataclass
+class LocalPevResponse:
+    """A plan rendered by the embedded PEV page of this site, the local counterpart of PevResponse"""
+
+    id: str
+
+    @property
+    def url(self) -> str:
+        path = f"{reverse('django_pev:embedded-pev')}?explain_id={self.id}"
+        return f"{getattr(settings, 'DJANGO_PEV_BASE_URL', '').rstrip('/')}{path}"
+
+    def delete(self) -> None:
+        """Deletes the plan from the cache"""
+        cache.delete(get_cache_key(self.id))
+
+    def __repr__(self) -> str:
+        return f"LocalPevResult(url={self.url})"
+
+
+def store_local_plan(
+    query: "Explain", analyze: bool = True, url: str = "", title: str = "", record: bool = False
+) -> LocalPevResponse:
+    """Explains the query and stores its plan in the cache for the embedded PEV page.
+
+    With `record` the plan is also recorded in the plan history of the query's fingerprint, otherwise the
+    page compares it with the plans already recorded.
+    """
+    # Imported here as the models can not be imported while the app registry loads django_pev.utils
+    from .utils import plan_history
+
+    json_plan = query.json_plan(analyze=analyze)
+    response = LocalPevResponse(id=str(uuid.uuid4()))
+    context = {
+        "explain_id": response.id,
+        "url": url,
+        "title": title,
+        "plan": json.dumps(json_plan),
+        "parsed_plan": parse_plan(json_plan),
+        "snapshot": plan_history.record_plan(query, analyze=analyze, url=url) if record else None,
+        "query": query,
+        "optimization_prompt": query.optimization_prompt(analyze=analyze),
+    }
+    cache.set(
+        get_cache_key(response.id),
+        context,
+        timeout=getattr(settings, "DJANGO_PEV_CACHE_TIMEOUT", 60 * 60 * 24),
+    )
+    return response
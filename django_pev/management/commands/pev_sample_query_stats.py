@@ -0,0 +1,34 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS
+
+from django_pev.utils.query_history import prune_query_stats_samples, record_query_stats_sample
+
+
+class Command(BaseCommand):
+    help = (
+        "Records a sample of the pg_stat_statements counters, to view the load of each statement over a recent "
+        "window on the queries page. Run it periodically (eg. every 5 minutes) or with --interval."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to sample (default: default)")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Keep sampling every this many seconds rather than sampling once",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            sample = record_query_stats_sample(options["database"])
+            if sample is None:
+                raise CommandError("pg_stat_statements is not installed")
+            pruned = prune_query_stats_samples()
+            self.stdout.write(f"Recorded {len(sample.counters)} statements, pruned {pruned} old samples")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
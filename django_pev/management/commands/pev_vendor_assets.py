@@ -0,0 +1,33 @@
+from pathlib import Path
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from django_pev.assets import VENDOR_DIR, missing_assets, vendor_assets
+
+
+class Command(BaseCommand):
+    help = "Downloads the assets of the embedded PEV page (pev2, vue, bootstrap) into django_pev's static files"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--output",
+            type=Path,
+            default=VENDOR_DIR,
+            help="Static files directory to download the assets to (default: django_pev/static)",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only check that every asset was downloaded, failing otherwise (run before building the package)",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["check"]:
+            missing = missing_assets(options["output"])
+            if missing:
+                raise CommandError(f"Missing vendored assets: {', '.join(str(path) for path in missing)}")
+            self.stdout.write("Every asset is vendored")
+            return
+        for path in vendor_assets(options["output"]):
+            self.stdout.write(f"Downloaded {path}")
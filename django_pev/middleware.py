@@ -0,0 +1,75 @@
+import logging
+import random
+import time
+from collections.abc import Callable
+from typing import Any
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpRequest, HttpResponse
+
+from .utils import explain
+from .utils.captured_requests import store_captured_request
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_HEADER = "X-Django-Pev-Capture"
+CAPTURE_HEADER_SALT = "django_pev.capture"
+
+
+def sign_capture_header() -> str:
+    """Returns a value for the `X-Django-Pev-Capture` header that forces a request to be captured"""
+    return signing.TimestampSigner(salt=CAPTURE_HEADER_SALT).sign("capture")
+
+
+class ExplainMiddleware:
+    """Captures the queries of live requests and stores a summary of their ExplainSet for the explain view.
+
+    A request is stored when it is sampled (`DJANGO_PEV_SAMPLE_RATE`, 0 by default), takes longer
+    than `DJANGO_PEV_SLOW_REQUEST_THRESHOLD` seconds, or carries a `X-Django-Pev-Capture` header
+    signed with `sign_capture_header()`. When a latency threshold is set every request is captured
+    so that slow ones can be kept, the cost of which is bounded by `DJANGO_PEV_EXPLAIN_KWARGS`
+    (passed to `explain()`).
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+        self.sample_rate: float = getattr(settings, "DJANGO_PEV_SAMPLE_RATE", 0.0)
+        self.slow_request_threshold: float | None = getattr(settings, "DJANGO_PEV_SLOW_REQUEST_THRESHOLD", None)
+        self.capture_header_max_age: int = getattr(settings, "DJANGO_PEV_CAPTURE_HEADER_MAX_AGE", 60 * 60)
+        self.explain_kwargs: dict[str, Any] = {
+            "max_queries": 1000,
+            **getattr(settings, "DJANGO_PEV_EXPLAIN_KWARGS", {}),
+        }
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        reason = self.get_capture_reason(request)
+        if reason is None and self.slow_request_threshold is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with explain(url=request.get_full_path(), **self.explain_kwargs) as explain_set:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        if reason is None and self.slow_request_threshold is not None and duration >= self.slow_request_threshold:
+            reason = "slow"
+        if reason is not None:
+            try:
+                store_captured_request(explain_set, request.method or "", response.status_code, duration, reason)
+            except Exception:
+                logger.exception(f"Could not store the queries of {explain_set.url}")
+        return response
+
+    def get_capture_reason(self, request: HttpRequest) -> str | None:
+        """Returns why the request should be stored regardless of its latency, if it should"""
+        header = request.headers.get(CAPTURE_HEADER)
+        if header:
+            try:
+                signing.TimestampSigner(salt=CAPTURE_HEADER_SALT).unsign(header, max_age=self.capture_header_max_age)
+                return "header"
+            except signing.BadSignature:
+                logger.warning(f"Invalid {CAPTURE_HEADER} header")
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
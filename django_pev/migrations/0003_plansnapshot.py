@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("django_pev", "0002_update_extension"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlanSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("fingerprint", models.TextField()),
+                ("fingerprint_hash", models.CharField(max_length=40)),
+                ("db_alias", models.CharField(max_length=100)),
+                ("shape_hash", models.CharField(max_length=40)),
+                ("analyzed", models.BooleanField(default=False)),
+                ("total_cost", models.FloatField()),
+                ("execution_time", models.FloatField(blank=True, null=True)),
+                ("plan", models.JSONField()),
+                ("sql", models.TextField()),
+                ("url", models.TextField(blank=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created", "-id"],
+                "indexes": [models.Index(fields=["fingerprint_hash", "-created"], name="django_pev_plan_fp_created")],
+            },
+        ),
+    ]
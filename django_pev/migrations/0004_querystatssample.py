@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_pev", "0003_plansnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueryStatsSample",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("db_alias", models.CharField(max_length=100)),
+                ("stats_reset", models.DateTimeField(blank=True, null=True)),
+                ("counters", models.JSONField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created", "-id"],
+                "indexes": [models.Index(fields=["db_alias", "-created"], name="django_pev_qss_alias_created")],
+            },
+        ),
+    ]
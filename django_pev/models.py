@@ -1 +1,46 @@
-# Create your models here.
+from django.db import models
+
+
+class PlanSnapshot(models.Model):
+    """A plan of a query fingerprint recorded at a point in time, to track plan regressions"""
+
+    fingerprint = models.TextField()
+    # Fingerprints are too long to index
+    fingerprint_hash = models.CharField(max_length=40)
+    db_alias = models.CharField(max_length=100)
+    shape_hash = models.CharField(max_length=40)
+    analyzed = models.BooleanField(default=False)
+    total_cost = models.FloatField()
+    execution_time = models.FloatField(null=True, blank=True)
+    plan = models.JSONField()
+    sql = models.TextField()
+    url = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created", "-id"]
+        indexes = [models.Index(fields=["fingerprint_hash", "-created"], name="django_pev_plan_fp_created")]
+
+    def __str__(self) -> str:
+        return f"{self.fingerprint[:50]} ({self.created:%Y-%m-%d %H:%M})"
+
+
+class QueryStatsSample(models.Model):
+    """The cumulative pg_stat_statements counters of a database at a point in time.
+
+    Counters are stored compactly as `{queryid: [calls, total_time, rows, shared_blks_hit,
+    shared_blks_dirtied]}`, the difference between two samples gives the load of each statement
+    over the window between them.
+    """
+
+    db_alias = models.CharField(max_length=100)
+    stats_reset = models.DateTimeField(null=True, blank=True)
+    counters = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created", "-id"]
+        indexes = [models.Index(fields=["db_alias", "-created"], name="django_pev_qss_alias_created")]
+
+    def __str__(self) -> str:
+        return f"{self.db_alias} ({self.created:%Y-%m-%d %H:%M})"
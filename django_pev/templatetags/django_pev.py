@@ -0,0 +1,19 @@
+from typing import Any
+
+from django import template
+
+from django_pev.assets import asset_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def pev_asset(name: str) -> str:
+    """URL of a third party asset, see `django_pev.assets`"""
+    return asset_url(name)
+
+
+@register.filter
+def lookup(mapping: dict, key: Any) -> Any:
+    """The value of a key of a dict, eg. `{{ statement_stats|lookup:query.fingerprint }}`"""
+    return mapping.get(key) if mapping else None
@@ -0,0 +1,47 @@
+import functools
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from typing import Any, TypeVar
+
+from .utils import ExplainSet, explain
+from .utils.budget import QueryBudget
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def query_budget(
+    max_queries: int | None = None, max_db_time: float | None = None, max_duplicates: int | None = None
+) -> Callable[[F], F]:
+    """Fails the decorated test (or function) when its queries exceed the budget
+
+    >>> @query_budget(max_queries=10, max_duplicates=3)
+    >>> def test_dashboard(self):
+    >>>     self.client.get("/dashboard/")
+    """
+
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            budget = QueryBudget(max_queries=max_queries, max_db_time=max_db_time, max_duplicates=max_duplicates)
+            with explain(budget=budget):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting that a block of code stays within a query budget
+
+    >>> class DashboardTests(QueryBudgetMixin, TestCase):
+    >>>     def test_dashboard(self):
+    >>>         with self.assertQueryBudget(max_queries=10, max_duplicates=3):
+    >>>             self.client.get("/dashboard/")
+    """
+
+    def assertQueryBudget(
+        self, max_queries: int | None = None, max_db_time: float | None = None, max_duplicates: int | None = None
+    ) -> AbstractContextManager[ExplainSet]:
+        budget = QueryBudget(max_queries=max_queries, max_db_time=max_db_time, max_duplicates=max_duplicates)
+        return explain(budget=budget)
@@ -10,7 +10,10 @@ urlpatterns = [
     path("indexes", views.IndexesView.as_view(), name="indexes"),
     path("live-queries", views.LiveQueriesView.as_view(), name="live-queries"),
     path("queries", views.QueriesView.as_view(), name="queries"),
+    path("queries/text", views.QueryTextView.as_view(), name="query-text"),
     path("explain", views.ExplainView.as_view(), name="explain"),
+    path("captured-requests", views.CapturedRequestsView.as_view(), name="captured-requests"),
+    path("plan-history", views.PlanHistoryView.as_view(), name="plan-history"),
     path("explain-visualize", views.ExplainVisualize.as_view(), name="explain-visualize"),
     path("embedded-pev", views.EmbeddedPev.as_view(), name="embedded-pev"),
 ]
@@ -1,33 +1,52 @@
 import datetime
 import functools
+import itertools
 import logging
+import re
 import time
-import traceback
 import uuid
 import webbrowser
-from contextlib import contextmanager
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from itertools import groupby
-from threading import local
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import psycopg
 import sqlglot
 import sqlglot.errors
 import sqlglot.expressions as exp
-from django.db import connection, connections
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
 from django.db.backends.utils import CursorWrapper
 from django.utils import timezone
 
 from django_pev.dalibo import PevResponse, upload_sql_plan
 from django_pev.exceptions import PevException
 
-from . import indexes
+from .batch_explain import ExplainResult, run_explains
+from .budget import QueryBudget
+from .capture import CapturedQuery, PendingFetch, QueryCapture, result_size
+from .duplicates import DuplicateQuery, MemoizationCandidate, find_duplicates, find_memoization_candidates
+from .fingerprint import normalize_sql
+from .introspection import TableInfo, get_tables
+from .nplusone import NPlusOne, find_nplusones, get_nplusone_threshold
+from .plan_cache import plan_cache, plan_cache_key
+from .plans import Plan, parse_plan
+from .queries import StatementStats, get_capabilities, get_statement_stats
+from .stack import EMPTY_STACK, CapturedStack, StackCapture, StackCaptureMode, default_stack_filter
+
+if TYPE_CHECKING:
+    from django_pev.local_pev import LocalPevResponse
 
 logger = logging.Logger("django_pev")
 
 
-thread_local_query_count = local()
+# The captures of every `explain()` block active in the current context. A ContextVar (rather than a
+# thread local) follows queries into sync_to_async threads and keeps concurrent requests apart.
+active_captures: ContextVar[tuple[QueryCapture, ...]] = ContextVar("django_pev_active_captures", default=())
 
 CursorWrapper._original_execute = CursorWrapper._execute  # type:ignore
 CursorWrapper._original_executemany = CursorWrapper._executemany  # type:ignore
@@ -36,65 +55,193 @@ CursorWrapper._original_executemany = CursorWrapper._executemany  # type:ignore
 class record_sql:
     """Record the SQL query and parameters for use in the explain view"""
 
-    def __init__(self, cursor_wrapper: CursorWrapper, sql: str, params: Any, many: bool = False):
+    def __init__(
+        self,
+        cursor_wrapper: CursorWrapper,
+        sql: str,
+        params: Any,
+        many: bool = False,
+        captures: tuple[QueryCapture, ...] | None = None,
+    ):
         """Record the SQL query and parameters for use in the explain view"""
         self.cursor_wrapper = cursor_wrapper
         self.sql = sql
         self.params = params
         self.many = many
-        self.start_time = time.time()
-        self.stack_trace = ""
+        self.captures = active_captures.get() if captures is None else captures
+        self.started: list[tuple[QueryCapture, int, CapturedStack | None]] = []
+        self.db_alias = ""
+        self.start_time = 0
 
     def __enter__(self):
-        thread_local_query_count.query_count = getattr(thread_local_query_count, "query_count", 0) + 1
-        frame_stack = traceback.extract_stack(limit=100)
-        filtered_frame_stack = [
-            x for x in frame_stack if not ("django_pev" in x.filename or "django/db" in x.filename)
-        ][-10:]
-        self.stack_trace = "".join(traceback.format_list(filtered_frame_stack))
+        self.db_alias = self.cursor_wrapper.db.alias
+        self.started = [
+            (capture, *capture.start())
+            for capture in self.captures
+            if capture.db_alias is None or capture.db_alias == self.db_alias
+        ]
+        self.start_time = time.perf_counter_ns()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        duration = time.time() - self.start_time
-        thread_local_query_count.queries = getattr(thread_local_query_count, "queries", []) + [
-            {
-                "time": duration,
-                "sql": self._interpolated_sql(),
-                "stack_trace": self.stack_trace,
-            }
-        ]
+        execute_ns = time.perf_counter_ns() - self.start_time
+        cursor = self.cursor_wrapper.cursor
+        pgresult = getattr(cursor, "pgresult", None)
+        # Rows of a result set are counted as they are fetched, otherwise count the rows affected
+        rows = max(cursor.rowcount, 0) if pgresult is None or not pgresult.nfields else 0
+        # Measuring the result reads its values, only done for the captures asking for it
+        measure = any(capture.measure_result_size for capture, _, _ in self.started)
+        bytes_received = result_size(pgresult) if measure else 0
+
+        queries = []
+        for capture, index, stack in self.started:
+            query = CapturedQuery(
+                index,
+                self.db_alias,
+                self.sql,
+                self.params,
+                self.many,
+                stack or EMPTY_STACK,
+                execute_ns,
+                0,
+                rows,
+                bytes_received if capture.measure_result_size else 0,
+            )
+            capture.add(query, retained=stack is not None)
+            queries.append((capture, query))
+        self.cursor_wrapper._django_pev_fetch = PendingFetch(queries, pgresult)  # type: ignore[attr-defined]
 
-    def _interpolated_sql(self) -> str:
-        """Render the query with its parameters interpolated, as it was sent to the server.
 
-        mogrify is run on a fresh ClientCursor rather than the live cursor: mogrify
-        resets the cursor's result state, which breaks Django's row fetching if the
-        query's rows haven't been read yet. executemany passes a batch of parameter
-        sets, which mogrify cannot bind, so batch queries stay parameterised.
-        """
-        if self.many:
-            return self.sql
-        with psycopg.ClientCursor(self.cursor_wrapper.cursor.connection) as client_cursor:
-            return client_cursor.mogrify(self.sql, self.params)
+def interpolate_sql(db_alias: str, sql: str, params: Any, many: bool = False) -> str:
+    """Render the query with its parameters interpolated, as it was sent to the server.
+
+    mogrify is run on a fresh ClientCursor rather than a live cursor: mogrify
+    resets the cursor's result state, which breaks Django's row fetching if the
+    query's rows haven't been read yet. executemany passes a batch of parameter
+    sets, which mogrify cannot bind, so batch queries stay parameterised.
+    """
+    if many or params is None:
+        return sql
+    db = connections[db_alias]
+    db.ensure_connection()
+    with psycopg.ClientCursor(db.connection) as client_cursor:
+        return client_cursor.mogrify(sql, params)
 
 
 def _new_execute(self, sql, params, *ignored_wrapper_args):  # type: ignore[no-untyped-def] # fmt: skip
-    with record_sql(self, sql, params):
+    captures = active_captures.get()
+    if not captures:
+        if self._django_pev_fetch is not None:
+            self._django_pev_fetch = None
+        return CursorWrapper._original_execute(self, sql, params, *ignored_wrapper_args)
+    with record_sql(self, sql, params, captures=captures):
         return CursorWrapper._original_execute(self, sql, params, *ignored_wrapper_args)
 
 
 def _new_executemany(self, sql, params, *ignored_wrapper_args):  # type: ignore[no-untyped-def] # fmt: skip
-    with record_sql(self, sql, params, many=True):
+    captures = active_captures.get()
+    if not captures:
+        if self._django_pev_fetch is not None:
+            self._django_pev_fetch = None
         return CursorWrapper._original_executemany(self, sql, params, *ignored_wrapper_args)
+    with record_sql(self, sql, params, many=True, captures=captures):
+        return CursorWrapper._original_executemany(self, sql, params, *ignored_wrapper_args)
+
+
+def _timed_fetch(cursor_wrapper: CursorWrapper, method: str, *args: Any, **kwargs: Any) -> Any:
+    """Calls a fetch method of the cursor, timing it when the cursor's last query was captured"""
+    # Fetch methods are otherwise resolved by CursorWrapper.__getattr__, which wraps database errors
+    fetch = CursorWrapper.__getattr__(cursor_wrapper, method)
+    pending: PendingFetch | None = cursor_wrapper._django_pev_fetch  # type: ignore[attr-defined]
+    if pending is None:
+        return fetch(*args, **kwargs)
+    start_time = time.perf_counter_ns()
+    result = fetch(*args, **kwargs)
+    fetch_ns = time.perf_counter_ns() - start_time
+    rows = (result is not None) if method == "fetchone" else len(result)
+    pending.fetched(fetch_ns, rows, getattr(cursor_wrapper.cursor, "pgresult", None))
+    return result
+
+
+def _new_fetchone(self):  # type: ignore[no-untyped-def]
+    return _timed_fetch(self, "fetchone")
+
+
+def _new_fetchmany(self, *args, **kwargs):  # type: ignore[no-untyped-def]
+    return _timed_fetch(self, "fetchmany", *args, **kwargs)
+
+
+def _new_fetchall(self):  # type: ignore[no-untyped-def]
+    return _timed_fetch(self, "fetchall")
+
+
+# Installed once for the whole process, queries are only recorded for contexts within `explain()`
+CursorWrapper._execute = _new_execute  # type:ignore
+CursorWrapper._executemany = _new_executemany  # type:ignore
+CursorWrapper._django_pev_fetch = None  # type:ignore
+CursorWrapper.fetchone = _new_fetchone  # type:ignore
+CursorWrapper.fetchmany = _new_fetchmany  # type:ignore
+CursorWrapper.fetchall = _new_fetchall  # type:ignore
 
 
 @dataclass(frozen=True)
 class Explain:
+    """A captured query.
+
+    `db_alias` is the database the query was run on, which `explain()` and `visualize()` run against.
+    `duration` is the wall time of the query in seconds: the time spent executing it (`execute_time`)
+    and fetching its rows (`fetch_time`). `rows` counts the rows fetched, or the rows affected by
+    statements without a result, and `bytes_received` the size of the result sent by the server.
+    """
+
     index: int
     duration: float
-    sql: str
-    stack_trace: str
+    raw_sql: str
+    stack: CapturedStack = field(repr=False)
     db_alias: str
     fingerprint: str
+    params: Any = field(default=None, repr=False, hash=False, compare=False)
+    many: bool = False
+    interpolate: bool = True
+    template: "ParsedTemplate | None" = field(default=None, repr=False, compare=False)
+    execute_time: float = 0.0
+    fetch_time: float = 0.0
+    rows: int = 0
+    bytes_received: int = 0
+
+    @functools.cached_property
+    def interpolated_sql(self) -> str:
+        """The query with its parameters interpolated, rendered on first access"""
+        return interpolate_sql(self.db_alias, self.raw_sql, self.params, self.many)
+
+    @functools.cached_property
+    def sql(self) -> str:
+        """The pretty printed query.
+
+        Parameters are interpolated unless capturing with `explain(interpolate=False)`, in which case
+        the placeholders are left in place.
+        """
+        template = self.template or parse_template(self.raw_sql)
+        if template is None:
+            return self.interpolated_sql if self.interpolate else self.raw_sql
+        if not self.interpolate or self.params is None:
+            return template.pretty
+        if template.can_interpolate(self.params, self.many):
+            # Interpolating into the cached pretty template avoids parsing every query
+            with suppress(psycopg.Error):
+                return interpolate_sql(self.db_alias, template.pretty, self.params)
+        try:
+            return sqlglot.transpile(self.interpolated_sql, read="postgres", pretty=True)[0]
+        except sqlglot.errors.ParseError:
+            return self.interpolated_sql
+
+    @property
+    def stack_trace(self) -> str:
+        return self.stack.formatted
+
+    @property
+    def call_site(self) -> int:
+        """A hash of the chain of frames that executed this query"""
+        return self.stack.call_site
 
     def __repr__(self) -> str:
         return f"Explain(duration={self.duration} sql={self.sql[:20]})"
@@ -102,69 +249,112 @@ class Explain:
     def __str__(self) -> str:
         return f"Explain(duration={self.duration} sql={self.sql[:20]})"
 
-    @functools.cache  # noqa
-    def visualize(self, upload_query: bool = False, analyze: bool = True, title: str = "") -> PevResponse:
+    def visualize(
+        self, upload_query: bool = False, analyze: bool = True, title: str = "", local: bool | None = None
+    ) -> "PevResponse | LocalPevResponse":
         """Uploads the query and plan to explain.dalibo
 
         By default we do not embed the SQL query unless `upload_query` is set to True.
 
-        The PevResponse object can be used to delete the uploaded plan.
+        The PevResponse object can be used to delete the uploaded plan. Each call uploads the plan again,
+        only the plan itself is shared through the plan cache by the queries of the same fingerprint.
+
+        With `local` (or the `DJANGO_PEV_LOCAL_VISUALIZE` setting) nothing is uploaded, the plan is
+        rendered by the embedded PEV page of this site instead.
         """
-        with connections[self.db_alias].cursor() as cursor:
-            if analyze:
-                sql = f"EXPLAIN (ANALYZE, COSTS, VERBOSE, BUFFERS, FORMAT JSON) {self.sql}"
-            else:
-                sql = f"EXPLAIN (VERBOSE, FORMAT JSON) {self.sql}"
-            cursor.execute(sql)
-            plan = cursor.fetchone()[0]
-        response = upload_sql_plan(query=self.sql if upload_query else "", plan=plan, title=title)
+        if local is None:
+            local = getattr(settings, "DJANGO_PEV_LOCAL_VISUALIZE", False)
+        if local:
+            from django_pev.local_pev import store_local_plan
+
+            local_response = store_local_plan(self, analyze=analyze, title=title)
+            logging.info(f"View Postgresql Explain @ {local_response.url}")
+            return local_response
+
+        response = upload_sql_plan(query=self.sql if upload_query else "", plan=self.json_plan(analyze), title=title)
         logging.info(f"View Postgresql Explain @ {response.url}")
         return response
 
-    def visualize_in_browser(self, upload_query: bool = False, analyze: bool = True, title: str = "") -> PevResponse:
+    def visualize_in_browser(
+        self, upload_query: bool = False, analyze: bool = True, title: str = "", local: bool | None = None
+    ) -> "PevResponse | LocalPevResponse":
         """Uploads the query and plan t oexplain.dalibo and then open in the browser"""
-        response = self.visualize(upload_query, analyze, title)
+        response = self.visualize(upload_query, analyze, title, local)
         webbrowser.open(response.url)
         return response
 
-    @functools.cache  # noqa
+    def explain_statement(self, analyze: bool = True, json: bool = False) -> str:
+        """Returns the EXPLAIN statement of the query"""
+        if analyze:
+            options = "ANALYZE, COSTS, VERBOSE, BUFFERS"
+        else:
+            options = "VERBOSE"
+        if json:
+            options += ", FORMAT JSON"
+        return f"EXPLAIN ({options}) {self.interpolated_sql}"
+
+    def json_plan(self, analyze: bool = True) -> Any:
+        """Runs explain and returns the JSON plan, as decoded by psycopg"""
+
+        def run_explain() -> Any:
+            with connections[self.db_alias].cursor() as cursor:
+                cursor.execute(self.explain_statement(analyze, json=True))
+                return cursor.fetchone()[0]
+
+        return plan_cache.get_or_set(plan_cache_key("json", self.db_alias, self.fingerprint, analyze), run_explain)
+
+    def query_id(self) -> int | None:
+        """The pg_stat_statements queryid of the query, read from the `Query Identifier` of its EXPLAIN (VERBOSE).
+
+        PostgreSQL (14+) computes it when `compute_query_id` is on, or auto with pg_stat_statements in
+        `shared_preload_libraries`. It only matches the statements run with their parameters interpolated
+        by the client, the default of the psycopg backend. None when it is not computed or the query can
+        not be explained.
+        """
+        try:
+            with transaction.atomic(using=self.db_alias):
+                plan = self.json_plan(analyze=False)
+        except DatabaseError:
+            return None
+        if isinstance(plan, list):
+            plan = plan[0]
+        return plan.get("Query Identifier") or None
+
+    def plan(self, analyze: bool = True) -> Plan:
+        """Runs explain and returns the parsed plan, to find its hotspots and likely problems"""
+        return parse_plan(self.json_plan(analyze))
+
     def explain(self, analyze: bool = True) -> str:
-        """Runs explain and returns the plan as a string"""
-        with connections[self.db_alias].cursor() as cursor:
-            if analyze:
-                sql = f"EXPLAIN (ANALYZE, COSTS, VERBOSE, BUFFERS) {self.sql}"
-            else:
-                sql = f"EXPLAIN (VERBOSE) {self.sql}"
-            cursor.execute(sql)
-            plan = "\n".join(list(x[0] for x in cursor.fetchall()))
-        return plan
-
-    @functools.cache  # noqa
+        """Runs explain and returns the plan as a string.
+
+        Plans are cached in the plan cache, queries of the same fingerprint share their plan.
+        """
+
+        def run_explain() -> str:
+            with connections[self.db_alias].cursor() as cursor:
+                cursor.execute(self.explain_statement(analyze))
+                return "\n".join(list(x[0] for x in cursor.fetchall()))
+
+        return plan_cache.get_or_set(plan_cache_key("explain", self.db_alias, self.fingerprint, analyze), run_explain)
+
     def optimization_prompt(self, analyze: bool = True) -> str:
+        """A prompt asking to optimize the query, with its plan and the schema of its tables.
+
+        The prompt embeds the SQL of this query so it is built on each call, from the plan and tables
+        found in the plan cache.
+        """
         # Extract tables from query
         tables: set[tuple[str, str]] = set()
         query = self.sql
         try:
             parsed = sqlglot.parse_one(query)
             for s_table in parsed.find_all(exp.Table):
-                tables.add((s_table.args.get("schema", "public"), s_table.name))
+                tables.add((s_table.db or "public", s_table.name))
         except Exception as e:
             return f"Error: {str(e)}"
 
-        # Fetch schema and indexes for each table
-        table_schemas = {}
-        table_indexes = {}
-
-        for table_schema, table_name in tables:
-            # Schema: columns and types
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT column_name, data_type, is_nullable FROM information_schema.columns WHERE table_schema = %s AND table_name = %s",
-                    [table_schema, table_name],  # type: ignore
-                )
-                table_schemas[table_name] = cursor.fetchall()
-            # Indexes: reuse get_indexes
-            table_indexes[table_name] = [i for i in indexes.get_indexes() if i.table == table_name]
+        # Fetch the schema, indexes and statistics of every table at once
+        table_infos = sorted(get_tables(tables, using=self.db_alias).values(), key=lambda t: t.table_key)
 
         # Prepare prompt for AI
         plan_json = self.explain(analyze=analyze)
@@ -177,21 +367,26 @@ Current Execution Plan:
 {plan_json}
 
 Table Schemas:
+{chr(10).join(_describe_table(table) for table in table_infos)}
+
+Current Indexes:
 {
             chr(10).join(
-                f"{table}:{chr(10)}"
+                f"{table.table_key}:{chr(10)}"
                 + chr(10).join(
-                    f"- {col}: {dtype} {'(nullable)' if nullable == 'YES' else ''}" for col, dtype, nullable in schema
+                    f"- {idx.name} ({idx.columns_formatted}){'' if idx.valid else ' (invalid)'}"
+                    for idx in table.indexes
                 )
-                for table, schema in table_schemas.items()
+                for table in table_infos
             )
         }
 
-Current Indexes:
+Constraints:
 {
             chr(10).join(
-                f"{table}:{chr(10)}" + chr(10).join(f"- {idx.name} ({idx.columns_formatted})" for idx in indexes)
-                for table, indexes in table_indexes.items()
+                f"{table.table_key}:{chr(10)}"
+                + chr(10).join(f"- {constraint.name}: {constraint.definition}" for constraint in table.constraints)
+                for table in table_infos
             )
         }
 
@@ -221,106 +416,420 @@ Ensure the optimized query maintains the exact same logic and results as the ori
         return ai_prompt
 
 
+def _describe_table(table: TableInfo) -> str:
+    """The columns of a table with their statistics, for the optimization prompt"""
+    lines = [
+        f"{table.table_key} (~{max(table.estimated_rows, 0)} rows, {table.size_bytes // 1024} kB, "
+        f"{table.seq_scan or 0} sequential scans, {table.idx_scan or 0} index scans):"
+    ]
+    for column in table.columns:
+        details = ["nullable"] if column.nullable else []
+        if column.null_frac:
+            details.append(f"{column.null_frac:.0%} null")
+        distinct = column.distinct_values(table.estimated_rows)
+        if distinct is not None:
+            details.append(f"~{distinct:.0f} distinct")
+        lines.append(f"- {column.name}: {column.data_type}" + (f" ({', '.join(details)})" if details else ""))
+    return chr(10).join(lines)
+
+
+@dataclass
+class FingerprintStats:
+    """Exact counters for all captured queries sharing a fingerprint, including evicted queries"""
+
+    fingerprint: str
+    count: int
+    total_duration: float
+    slowest: Explain
+    total_fetch_duration: float = 0.0
+    total_rows: int = 0
+    total_bytes_received: int = 0
+
+
+@dataclass
+class AliasStats:
+    """Exact counters for all captured queries run on a database"""
+
+    db_alias: str
+    count: int = 0
+    total_duration: float = 0.0
+    total_fetch_duration: float = 0.0
+    total_rows: int = 0
+    total_bytes_received: int = 0
+
+
 @dataclass
 class ExplainSet:
     id: str
     url: str
     created: datetime.datetime
     queries: list[Explain] = field(default_factory=list)
+    stats: dict[str, FingerprintStats] = field(default_factory=dict)
+    alias_stats: dict[str, AliasStats] = field(default_factory=dict)
 
     @property
     def n_queries(self) -> int:
+        if self.stats:
+            return sum(s.count for s in self.stats.values())
         return len(self.queries)
 
     def __getitem__(self, index: int) -> Explain:
         return self.queries[index]
 
+    def get_query(self, index: int) -> Explain:
+        """Returns the captured query by its `Explain.index`"""
+        for query in itertools.chain(self.queries, (s.slowest for s in self.stats.values())):
+            if query.index == index:
+                return query
+        raise PevException(f"Query {index} was not retained.")
+
     @property
     def slowest(self) -> Explain:
-        if not self.queries:
+        candidates = self.queries + [s.slowest for s in self.stats.values()]
+        if not candidates:
+            raise PevException("Can not visualize results when there are no results.")
+
+        return max(candidates, key=lambda q: q.duration)
+
+    def _fingerprint_stats(self) -> dict[str, FingerprintStats]:
+        """The stats per fingerprint, computed from the retained queries for sets built without stats"""
+        stats = self.stats
+        if not stats:
+            stats = {}
+            for query in self.queries:
+                s = stats.get(query.fingerprint)
+                if s is None:
+                    s = stats[query.fingerprint] = FingerprintStats(query.fingerprint, 0, 0.0, query)
+                s.count += 1
+                s.total_duration += query.duration
+                s.total_fetch_duration += query.fetch_time
+                s.total_rows += query.rows
+                s.total_bytes_received += query.bytes_received
+                if query.duration > s.slowest.duration:
+                    s.slowest = query
+        return stats
+
+    @property
+    def heaviest(self) -> FingerprintStats:
+        """The fingerprint with the highest wall time (executing and fetching) summed over its queries"""
+        stats = self._fingerprint_stats()
+        if not stats:
             raise PevException("Can not visualize results when there are no results.")
 
-        return sorted(self.queries, key=lambda q: q.duration, reverse=True)[0]
+        return max(stats.values(), key=lambda s: s.total_duration)
+
+    def explain_all(
+        self,
+        analyze: bool = True,
+        top_n: int | None = None,
+        dedupe_by_fingerprint: bool = True,
+        workers: int = 4,
+        statement_timeout: float = 30,
+    ) -> list[ExplainResult]:
+        """Explains the captured queries concurrently and returns their plans, most expensive first.
+
+        With `dedupe_by_fingerprint` the slowest query of each fingerprint is explained once, ranked by
+        the total time of the fingerprint, otherwise every retained query is explained. `top_n` limits
+        the number of queries explained.
+
+        EXPLAINs run on `workers` dedicated connections per database, each within a transaction that is
+        rolled back and with a `statement_timeout` in seconds. As they do not share the transaction of
+        the current connection, uncommitted rows are not visible to them.
+        """
+        if dedupe_by_fingerprint:
+            results = [
+                ExplainResult(query=s.slowest, count=s.count, total_duration=s.total_duration)
+                for s in sorted(self._fingerprint_stats().values(), key=lambda s: s.total_duration, reverse=True)
+            ]
+        else:
+            results = [
+                ExplainResult(query=q, count=1, total_duration=q.duration)
+                for q in sorted(self.queries, key=lambda q: q.duration, reverse=True)
+            ]
+        if top_n is not None:
+            results = results[:top_n]
+
+        run_explains(results, analyze=analyze, workers=workers, statement_timeout=statement_timeout)
+        return results
 
     @property
     def nplusones(self) -> dict[Explain, int]:
+        """Fingerprints repeated more than `DJANGO_PEV_NPLUSONE_THRESHOLD` (3) times, see `find_nplusones()`"""
+        threshold = get_nplusone_threshold()
+        if self.stats:
+            return {s.slowest: s.count for s in self.stats.values() if s.count > threshold}
+
         ret = {}
         for _, group in groupby(sorted(self.queries, key=lambda q: q.fingerprint), key=lambda q: q.fingerprint):
             group_list = list(group)
-            if len(group_list) > 3:
+            if len(group_list) > threshold:
                 ret[group_list[0]] = len(group_list)
         return ret
 
+    def find_nplusones(self, threshold: int | None = None) -> list[NPlusOne]:
+        """Queries repeated more than `threshold` times from the same call site, with the time they wasted
+        and the select_related/prefetch_related lookups that would collapse them into one query.
+        """
+        return find_nplusones(self, threshold)
+
+    def duplicates(self) -> list[DuplicateQuery]:
+        """Identical reads (same SQL and params) run again before any write to their tables, with the time
+        spent on the runs that could have reused a previous result.
+        """
+        return find_duplicates(self)
+
+    def memoization_candidates(self) -> list[MemoizationCandidate]:
+        """The duplicated queries grouped by fingerprint, candidates for caching per request"""
+        return find_memoization_candidates(self)
+
+    def statement_stats(self, top_n: int | None = None) -> dict[str, StatementStats]:
+        """The pg_stat_statements statistics of the captured fingerprints, by fingerprint, the heaviest share
+        of the database time first.
+
+        They tell how often a captured query runs outside of this block and what it costs in aggregate.
+        The queryid of each fingerprint is resolved with an EXPLAIN of its slowest query, see
+        `Explain.query_id()`, for the `top_n` fingerprints with the highest total time. Fingerprints whose
+        queryid is unknown or not in pg_stat_statements are left out.
+        """
+        ranked = sorted(self._fingerprint_stats().values(), key=lambda s: s.total_duration, reverse=True)
+        query_ids: dict[str, dict[str, int]] = {}
+        for s in ranked[:top_n]:
+            db_alias = s.slowest.db_alias
+            if not get_capabilities(db_alias).installed:
+                continue
+            query_id = s.slowest.query_id()
+            if query_id is not None:
+                query_ids.setdefault(db_alias, {})[s.fingerprint] = query_id
+
+        statement_stats = {}
+        for db_alias, by_fingerprint in query_ids.items():
+            found = get_statement_stats(set(by_fingerprint.values()), using=db_alias)
+            statement_stats.update({f: found[q] for f, q in by_fingerprint.items() if q in found})
+        return dict(sorted(statement_stats.items(), key=lambda item: item[1].percent_time, reverse=True))
+
 
 @contextmanager
 def explain(
-    db_alias: str = "default",
+    db_alias: str | None = None,
     trace_limit: int = 10,
     url: str = "",
+    stack_capture: StackCaptureMode = "lazy",
+    stack_depth: int = 100,
+    stack_filter: Callable[[str], bool] = default_stack_filter,
+    interpolate: bool = True,
+    max_queries: int | None = None,
+    sample_rate: float = 1.0,
+    workers: int = 0,
+    parallel_threshold: int = 500,
+    budget: QueryBudget | None = None,
+    measure_result_size: bool = False,
 ):
     """Capture all queries within this context and returns an ExplainSet container.
 
     Captured queries contain timing information, a stack trace and allows for visualization
     with explain.dalibo.com
 
+    Queries are captured on every database and record the alias they ran on, `alias_stats`
+    summarizes them per database. Pass `db_alias` to only capture the queries of one database.
+
     Usage:
     >>> with explain() as queries:
     >>>    User.objects.count()
     >>> result = queries.slowest.visualize(upload_query=True)
     >>> result.delete()
     >>> queries.slowest.explain()
+
+    The stack of each query is captured as raw frames and only formatted when `stack_trace` is read.
+    `stack_capture` switches to "eager" formatting, "hash" (only `call_site` is kept) or "off".
+    `stack_depth` frames are captured, of which the last `trace_limit` frames passing `stack_filter`
+    are shown.
+
+    Only the SQL template and parameters are kept while capturing, the parameters are interpolated
+    the first time `Explain.sql` is read. With `interpolate=False` `Explain.sql` keeps the
+    placeholders, for when only counts and fingerprints are needed.
+
+    For long running blocks `max_queries` bounds the number of retained queries to the most recent
+    ones and `sample_rate` retains only a fraction of them. `n_queries`, `slowest` and `nplusones`
+    are still exact as counters are kept per fingerprint.
+
+    The time spent fetching rows through the cursor is added to the query that produced them, so
+    `slowest` and `heaviest` (the most expensive fingerprint overall) rank queries reading large
+    results by their full cost. `bytes_received` is only estimated with `measure_result_size`, from a
+    sample of the rows of each result, as reading the values costs more than capturing the query.
+
+    With `workers` set, captures of at least `parallel_threshold` distinct SQL templates are normalized
+    and pretty printed in a pool of `workers` processes once the block exits.
+
+    A `budget` raises, warns or logs when the block exceeds its limits:
+    >>> with explain(budget=QueryBudget(max_queries=50, max_db_time=0.2, max_duplicates=3)):
+    >>>    client.get("/dashboard/")
     """
     result = ExplainSet(url=url, created=timezone.now(), id=str(uuid.uuid4()))
-    thread_local_query_count.queries = []
+    capture = QueryCapture(
+        StackCapture(mode=stack_capture, depth=stack_depth, limit=trace_limit, stack_filter=stack_filter),
+        max_queries=max_queries,
+        sample_rate=sample_rate,
+        db_alias=db_alias,
+        measure_result_size=measure_result_size,
+    )
+    token = active_captures.set(active_captures.get() + (capture,))
     try:
-        CursorWrapper._execute = _new_execute  # type:ignore # noqa
-        CursorWrapper._executemany = _new_executemany  # type:ignore
         yield result
     finally:
-        CursorWrapper._execute = CursorWrapper._original_execute  # type:ignore
-        CursorWrapper._executemany = CursorWrapper._original_executemany  # type:ignore
-        queries_after = thread_local_query_count.queries.copy()
-    logger.debug(f"Captured {len(queries_after)} queries")
-
-    for index, q in enumerate(queries_after):
-        try:
-            result.queries.append(
-                Explain(
-                    index=index,
-                    duration=float(q["time"]),
-                    sql=sqlglot.transpile(q["sql"], read="postgres", pretty=True)[0],
-                    stack_trace=q["stack_trace"],
-                    db_alias=db_alias,
-                    fingerprint=generate_fingerprint(q["sql"]) or q["sql"],
-                )
+        active_captures.reset(token)
+    logger.debug(f"Captured {capture.count} queries")
+
+    unescape_percent: dict[str, bool] = {}
+    for (_, sql), template_stats in capture.templates.items():
+        unescape_percent[sql] = unescape_percent.get(sql, False) or (
+            template_stats.slowest is None or template_stats.slowest.params is not None
+        )
+    templates = list(unescape_percent.items())
+    parsed_templates: dict[str, ParsedTemplate | None] = {}
+    if workers > 1 and len(templates) >= parallel_threshold:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            processed = list(
+                executor.map(_process_template, templates, chunksize=max(1, len(templates) // (workers * 4)))
+            )
+        fingerprints = {sql: fingerprint for (sql, _), (fingerprint, _) in zip(templates, processed)}
+        parsed_templates = {sql: parsed for (sql, _), (_, parsed) in zip(templates, processed)}
+    else:
+        fingerprints = {sql: normalize_sql(sql, unescape_percent=unescape) for sql, unescape in templates}
+
+    def to_explain(q: CapturedQuery) -> Explain:
+        return Explain(
+            index=q.index,
+            duration=q.total_ns / 1e9,
+            raw_sql=q.sql,
+            stack=q.stack,
+            db_alias=q.db_alias,
+            fingerprint=fingerprints[q.sql],
+            params=q.params,
+            many=q.many,
+            interpolate=interpolate,
+            template=parsed_templates.get(q.sql),
+            execute_time=q.execute_ns / 1e9,
+            fetch_time=q.fetch_ns / 1e9,
+            rows=q.rows,
+            bytes_received=q.bytes_received,
+        )
+
+    explains = {q.index: to_explain(q) for q in capture.queries}
+    result.queries.extend(explains.values())
+
+    for (alias, sql), template_stats in capture.templates.items():
+        alias_stats = result.alias_stats.get(alias)
+        if alias_stats is None:
+            alias_stats = result.alias_stats[alias] = AliasStats(db_alias=alias)
+        alias_stats.count += template_stats.count
+        alias_stats.total_duration += template_stats.total_ns / 1e9
+        alias_stats.total_fetch_duration += template_stats.fetch_ns / 1e9
+        alias_stats.total_rows += template_stats.rows
+        alias_stats.total_bytes_received += template_stats.bytes_received
+
+        fingerprint = fingerprints[sql]
+        if template_stats.slowest is None:
+            continue
+        slowest = explains.get(template_stats.slowest.index) or to_explain(template_stats.slowest)
+        stats = result.stats.get(fingerprint)
+        if stats is None:
+            result.stats[fingerprint] = FingerprintStats(
+                fingerprint=fingerprint,
+                count=template_stats.count,
+                total_duration=template_stats.total_ns / 1e9,
+                slowest=slowest,
+                total_fetch_duration=template_stats.fetch_ns / 1e9,
+                total_rows=template_stats.rows,
+                total_bytes_received=template_stats.bytes_received,
             )
-        except sqlglot.errors.ParseError as e:
-            logger.warning(f"Error parsing query: {e}")
+        else:
+            stats.count += template_stats.count
+            stats.total_duration += template_stats.total_ns / 1e9
+            stats.total_fetch_duration += template_stats.fetch_ns / 1e9
+            stats.total_rows += template_stats.rows
+            stats.total_bytes_received += template_stats.bytes_received
+            if slowest.duration > stats.slowest.duration:
+                stats.slowest = slowest
 
+    if budget is not None:
+        budget.check(result)
 
-def generate_fingerprint(sql_query: str) -> str | None:
+
+_PLACEHOLDER_RE = re.compile(r"(?<!%)%s")
+# The placeholders of a template are numbered while parsing it, to check sqlglot kept them in order
+_NUMBERED_PLACEHOLDER_RE = re.compile(r"%\(pev_(\d+)\)s")
+
+
+@dataclass(frozen=True)
+class ParsedTemplate:
+    """The pretty printed form of a SQL template"""
+
+    pretty: str
+    placeholders: int
+
+    def can_interpolate(self, params: Any, many: bool = False) -> bool:
+        """Whether params can be bound to the pretty template in place of the original template.
+
+        Only positional params are bound, and only when sqlglot kept every placeholder in order.
+        """
+        return not many and isinstance(params, (list, tuple)) and len(params) == self.placeholders
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_template(sql: str) -> ParsedTemplate | None:
+    """Parses a SQL template (before parameter interpolation) for pretty printing.
+
+    Results are cached as N+1 queries repeat the same handful of templates, repeated templates skip
+    sqlglot entirely. Returns None when sqlglot can not parse the query.
+    """
+    numbers = itertools.count()
+    numbered = _PLACEHOLDER_RE.sub(lambda _: f"%(pev_{next(numbers)})s", sql)
     try:
-        # Parse the query
-        expression_tree = sqlglot.parse_one(sql_query, read="postgres")
+        expression_tree = sqlglot.parse_one(numbered, read="postgres")
+    except sqlglot.errors.ParseError:
+        return None
+    # sqlglot drops or reorders some placeholders (eg. `OFFSET %s LIMIT %s` is printed LIMIT first), the
+    # params of such templates are interpolated before pretty printing instead
+    order = [int(number) for number in _NUMBERED_PLACEHOLDER_RE.findall(expression_tree.sql(dialect="postgres"))]
+    placeholders = len(order) if order == list(range(next(numbers))) else -1
+    for placeholder in expression_tree.find_all(exp.Placeholder):
+        placeholder.set("this", None)
+    return ParsedTemplate(pretty=expression_tree.sql(dialect="postgres", pretty=True), placeholders=placeholders)
 
-        # Define a transformer function to replace literals
-        def replace_literals(node):
-            # Check if the node is a Literal (number, string, boolean, etc.)
-            if isinstance(node, exp.Literal):
-                # Replace the literal with a placeholder.
-                # You could use '?' or a string like '<value>'
-                return exp.Placeholder()  # or exp.Literal.from_arg('<value>')
-            return node  # Return the node unchanged if it's not a literal
 
-        # Apply the transformation across the entire AST
-        fingerprinted_tree = expression_tree.transform(replace_literals)
+def _process_template(template: tuple[str, bool]) -> tuple[str, ParsedTemplate | None]:
+    """Normalizes and pretty prints a SQL template in a worker process"""
+    sql, unescape_percent = template
+    return normalize_sql(sql, unescape_percent=unescape_percent), parse_template(sql)
 
-        # Generate the SQL string back from the modified AST
-        # Use pretty=False and identify=False for canonical representation
-        fingerprint_sql = fingerprinted_tree.sql(pretty=False, identify=False)
 
-        return fingerprint_sql
+def generate_fingerprint(sql_query: str) -> str | None:
+    """Fingerprint a query by replacing literals in its sqlglot AST.
 
+    Superseded by the much faster `fingerprint.normalize_sql`, which also handles statements sqlglot
+    can not parse.
+    """
+    try:
+        # Parse the query
+        expression_tree = sqlglot.parse_one(sql_query, read="postgres")
     except sqlglot.errors.ParseError as e:
-        print(f"Error parsing query: {e}")
+        logger.debug(f"Error parsing query: {e}")
         return None  # Handle parsing errors
+
+    # Define a transformer function to replace literals
+    def replace_literals(node):
+        # Check if the node is a Literal (number, string, boolean, etc.)
+        if isinstance(node, exp.Literal):
+            # Replace the literal with a placeholder.
+            # You could use '?' or a string like '<value>'
+            return exp.Placeholder()  # or exp.Literal.from_arg('<value>')
+        return node  # Return the node unchanged if it's not a literal
+
+    # Apply the transformation across the entire AST
+    fingerprinted_tree = expression_tree.transform(replace_literals)
+
+    # Generate the SQL string back from the modified AST
+    # Use pretty=False and identify=False for canonical representation
+    fingerprint_sql = fingerprinted_tree.sql(pretty=False, identify=False)
+
+    return fingerprint_sql
@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import psycopg
+from django.db import connections
+
+from .plan_cache import MISSING, plan_cache, plan_cache_key
+
+if TYPE_CHECKING:
+    from . import Explain
+
+
+@dataclass
+class ExplainResult:
+    """The plan of a query explained by `ExplainSet.explain_all()`"""
+
+    query: "Explain"
+    # Number of captured queries and their total time, for the fingerprint of the query when deduplicated
+    count: int
+    total_duration: float
+    plan: str = ""
+    error: str = ""
+    explain_duration: float = 0.0
+
+
+def run_explains(results: list[ExplainResult], analyze: bool, workers: int, statement_timeout: float) -> None:
+    """Fills in the plan (or error) of each result, running the EXPLAINs concurrently.
+
+    Plans found in the plan cache are not explained again, and explained plans are added to it.
+    """
+    pending = []
+    for result in results:
+        key = plan_cache_key("explain", result.query.db_alias, result.query.fingerprint, analyze)
+        cached = plan_cache.get(key)
+        if cached is MISSING:
+            pending.append((key, result))
+        else:
+            result.plan = cached
+
+    if pending:
+        _explain_concurrently([result for _, result in pending], analyze, workers, statement_timeout)
+    for key, result in pending:
+        if result.plan:
+            plan_cache.set(key, result.plan)
+
+
+def _explain_concurrently(results: list[ExplainResult], analyze: bool, workers: int, statement_timeout: float) -> None:
+    """Every worker thread opens its own connection to each database it explains queries on, so EXPLAINs
+    neither queue on nor disturb the transaction of the shared Django connection.
+    """
+    # Rendered here as interpolation uses the Django connection of this thread
+    statements = [result.query.explain_statement(analyze) for result in results]
+    conn_params = {
+        alias: connections[alias].get_connection_params() for alias in {result.query.db_alias for result in results}
+    }
+    timeout = f"{max(1, int(statement_timeout * 1000))}ms"
+
+    local = threading.local()
+    opened: list[psycopg.Connection[Any]] = []
+    lock = threading.Lock()
+
+    def get_connection(db_alias: str) -> psycopg.Connection[Any]:
+        worker_connections = local.__dict__.setdefault("connections", {})
+        if db_alias not in worker_connections:
+            connection = psycopg.connect(**conn_params[db_alias], autocommit=True)
+            with lock:
+                opened.append(connection)
+            worker_connections[db_alias] = connection
+        return worker_connections[db_alias]
+
+    def run(result: ExplainResult, statement: str) -> None:
+        start = time.perf_counter()
+        try:
+            connection = get_connection(result.query.db_alias)
+            # Rolled back as EXPLAIN ANALYZE runs the statement, which may modify data
+            with connection.transaction(force_rollback=True), connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [timeout])
+                cursor.execute(statement)  # type: ignore[arg-type]
+                result.plan = "\n".join(row[0] for row in cursor.fetchall())
+        except psycopg.Error as e:
+            result.error = str(e)
+        result.explain_duration = time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(results)))) as executor:
+            list(executor.map(run, results, statements))
+    finally:
+        for connection in opened:
+            connection.close()
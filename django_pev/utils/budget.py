@@ -0,0 +1,92 @@
+import logging
+import warnings
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Literal
+
+from django_pev.exceptions import QueryBudgetExceeded, QueryBudgetWarning
+
+if TYPE_CHECKING:
+    from . import ExplainSet, FingerprintStats
+
+logger = logging.getLogger(__name__)
+
+BudgetAction = Literal["raise", "warn", "log"]
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """Limits on the queries of an `explain()` block.
+
+    - max_queries: number of queries executed
+    - max_db_time: total time in seconds spent executing queries
+    - max_duplicates: number of times a single fingerprint is executed (N+1 queries)
+
+    When exceeded `action` either raises QueryBudgetExceeded (an AssertionError, so tests fail),
+    warns with a QueryBudgetWarning or logs a warning. The report lists the offending fingerprints
+    with the stack trace of their slowest query.
+    """
+
+    max_queries: int | None = None
+    max_db_time: float | None = None
+    max_duplicates: int | None = None
+    action: BudgetAction = "raise"
+    report_limit: int = 5
+
+    def violations(self, explain_set: "ExplainSet") -> list[tuple[str, list["FingerprintStats"]]]:
+        """Returns each exceeded limit with the fingerprints responsible for it"""
+        stats = list(explain_set.stats.values())
+        ret = []
+
+        if self.max_queries is not None and explain_set.n_queries > self.max_queries:
+            ret.append(
+                (
+                    f"{explain_set.n_queries} queries (max {self.max_queries})",
+                    sorted(stats, key=lambda s: s.count, reverse=True)[: self.report_limit],
+                )
+            )
+
+        db_time = sum(s.total_duration for s in stats)
+        if self.max_db_time is not None and db_time > self.max_db_time:
+            ret.append(
+                (
+                    f"{db_time:.3f}s spent in queries (max {self.max_db_time}s)",
+                    sorted(stats, key=lambda s: s.total_duration, reverse=True)[: self.report_limit],
+                )
+            )
+
+        if self.max_duplicates is not None:
+            duplicated = [s for s in stats if s.count > self.max_duplicates]
+            if duplicated:
+                ret.append(
+                    (
+                        f"{len(duplicated)} queries executed more than {self.max_duplicates} times",
+                        sorted(duplicated, key=lambda s: s.count, reverse=True)[: self.report_limit],
+                    )
+                )
+        return ret
+
+    def check(self, explain_set: "ExplainSet") -> None:
+        violations = self.violations(explain_set)
+        if not violations:
+            return
+
+        report = format_budget_report(explain_set, violations)
+        match self.action:
+            case "raise":
+                raise QueryBudgetExceeded(report)
+            case "warn":
+                warnings.warn(report, QueryBudgetWarning, stacklevel=4)
+            case "log":
+                logger.warning(report)
+
+
+def format_budget_report(explain_set: "ExplainSet", violations: list[tuple[str, list["FingerprintStats"]]]) -> str:
+    lines = [f"Query budget exceeded{f' for {explain_set.url}' if explain_set.url else ''}:"]
+    for description, offenders in violations:
+        lines.append(f"- {description}")
+        for stats in offenders:
+            lines.append(f"    {stats.count}x {stats.total_duration:.3f}s {stats.fingerprint}")
+            stack_trace = stats.slowest.stack_trace.rstrip()
+            if stack_trace:
+                lines.extend(f"      {line}" for line in stack_trace.splitlines())
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+import random
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from .stack import CapturedStack, StackCapture
+
+# Results larger than this many rows have their size estimated from an evenly spaced sample of rows
+RESULT_SIZE_SAMPLE_ROWS = 10
+
+
+def result_size(pgresult: Any) -> int:
+    """Returns the size in bytes of the values of a psycopg result, as received from the server"""
+    if pgresult is None or not pgresult.ntuples or not pgresult.nfields:
+        return 0
+    ntuples, fields = pgresult.ntuples, range(pgresult.nfields)
+    get_value = pgresult.get_value
+    sampled = range(0, ntuples, max(1, ntuples // RESULT_SIZE_SAMPLE_ROWS))
+    size = 0
+    for row in sampled:
+        for column in fields:
+            value = get_value(row, column)
+            if value is not None:
+                size += len(value)
+    return size * ntuples // len(sampled)
+
+
+@dataclass(slots=True)
+class CapturedQuery:
+    index: int
+    db_alias: str
+    sql: str
+    params: Any
+    many: bool
+    stack: CapturedStack
+    execute_ns: int = 0
+    fetch_ns: int = 0
+    rows: int = 0
+    bytes_received: int = 0
+
+    @property
+    def total_ns(self) -> int:
+        return self.execute_ns + self.fetch_ns
+
+
+@dataclass(slots=True)
+class TemplateStats:
+    """Exact counters for every query sharing the same SQL template"""
+
+    count: int = 0
+    execute_ns: int = 0
+    fetch_ns: int = 0
+    rows: int = 0
+    bytes_received: int = 0
+    slowest: CapturedQuery | None = None
+
+    @property
+    def total_ns(self) -> int:
+        return self.execute_ns + self.fetch_ns
+
+
+class QueryCapture:
+    """Collects the queries executed within an `explain()` block.
+
+    At most `max_queries` of the most recent queries are retained (all of them when None), and each
+    query is retained with a probability of `sample_rate`. Counts, total time and the slowest query
+    are tracked exactly per SQL template regardless, so `n_queries`, `slowest` and `nplusones` hold
+    after queries are evicted or sampled out. The stack is only captured for sampled queries.
+
+    Queries may be added from several threads, eg. by `sync_to_async` calls made within the block.
+    Only queries run on `db_alias` are captured when it is set. The size of the results is only
+    measured with `measure_result_size`.
+    """
+
+    def __init__(
+        self,
+        stack_capture: StackCapture,
+        max_queries: int | None = None,
+        sample_rate: float = 1.0,
+        db_alias: str | None = None,
+        measure_result_size: bool = False,
+    ):
+        self.stack_capture = stack_capture
+        self.measure_result_size = measure_result_size
+        self.sample_rate = sample_rate
+        self.db_alias = db_alias
+        self.queries: deque[CapturedQuery] = deque(maxlen=max_queries)
+        # Keyed by (db alias, sql)
+        self.templates: dict[tuple[str, str], TemplateStats] = {}
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> tuple[int, CapturedStack | None]:
+        """Returns the index of the query about to run and its stack, or None when not sampled"""
+        with self._lock:
+            index = self.count
+            self.count += 1
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return index, None
+        return index, self.stack_capture.capture()
+
+    def add(self, query: CapturedQuery, retained: bool) -> None:
+        """Adds an executed query, which is only retained in `queries` when it was sampled"""
+        with self._lock:
+            key = (query.db_alias, query.sql)
+            stats = self.templates.get(key)
+            if stats is None:
+                stats = self.templates[key] = TemplateStats()
+            stats.count += 1
+            stats.execute_ns += query.execute_ns
+            stats.rows += query.rows
+            stats.bytes_received += query.bytes_received
+
+            if retained:
+                self.queries.append(query)
+            if stats.slowest is None or query.total_ns > stats.slowest.total_ns:
+                stats.slowest = query
+
+    def add_fetch(self, query: CapturedQuery, fetch_ns: int, rows: int, bytes_received: int) -> None:
+        """Adds the cost of fetching rows of a previously added query"""
+        with self._lock:
+            query.fetch_ns += fetch_ns
+            query.rows += rows
+            query.bytes_received += bytes_received
+            stats = self.templates[(query.db_alias, query.sql)]
+            stats.fetch_ns += fetch_ns
+            stats.rows += rows
+            stats.bytes_received += bytes_received
+            if stats.slowest is not None and query.total_ns > stats.slowest.total_ns:
+                stats.slowest = query
+
+
+class PendingFetch:
+    """The captured queries of a cursor whose rows may still be fetched.
+
+    Attached to the cursor once a query is executed, and replaced by the next query it executes.
+    """
+
+    __slots__ = ("queries", "pgresult", "measure_result_size")
+
+    def __init__(self, queries: list[tuple[QueryCapture, CapturedQuery]], pgresult: Any):
+        self.queries = queries
+        self.pgresult = pgresult
+        self.measure_result_size = any(capture.measure_result_size for capture, _ in queries)
+
+    def fetched(self, fetch_ns: int, rows: int, pgresult: Any) -> None:
+        # A client side cursor receives every row when executing, a server side cursor receives a new
+        # result for each fetch
+        bytes_received = 0
+        if pgresult is not self.pgresult:
+            self.pgresult = pgresult
+            if self.measure_result_size:
+                bytes_received = result_size(pgresult)
+        for capture, query in self.queries:
+            capture.add_fetch(query, fetch_ns, rows, bytes_received if capture.measure_result_size else 0)
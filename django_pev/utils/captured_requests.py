@@ -0,0 +1,106 @@
+import dataclasses
+import datetime
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import Explain, ExplainSet
+
+CAPTURED_REQUESTS_CACHE_KEY = "DJANGO_PEV:CAPTURED_REQUESTS"
+
+
+def get_cache_key(explainset_id: Any) -> str:
+    return f"DJANGO_PEV:EXPLAIN:{explainset_id}"
+
+
+@dataclasses.dataclass
+class CapturedRequest:
+    """Summary of a live request whose ExplainSet was stored by the ExplainMiddleware"""
+
+    explainset_id: str
+    method: str
+    url: str
+    status_code: int
+    duration: float
+    n_queries: int
+    db_time: float
+    n_nplusones: int
+    reason: str
+    created: datetime.datetime
+
+
+def store_explain_set(explain_set: ExplainSet) -> None:
+    """Stores an ExplainSet in the cache so it can be browsed in the explain view"""
+    cache.set(
+        get_cache_key(explain_set.id),
+        explain_set,
+        timeout=getattr(settings, "DJANGO_PEV_CACHE_TIMEOUT", 60 * 60 * 24),
+    )
+
+
+def summarize_explain_set(explain_set: ExplainSet, top_n: int) -> ExplainSet:
+    """A compact copy of an ExplainSet, to be stored for a live request.
+
+    It keeps the exact stats of every fingerprint and database, and only the `top_n` slowest queries
+    with their stacks. The params of the queries kept are interpolated into their SQL, so they can still
+    be explained without storing the params themselves.
+    """
+    compacted: dict[int, Explain] = {}
+
+    def compact(query: Explain) -> Explain:
+        if id(query) not in compacted:
+            compacted[id(query)] = dataclasses.replace(
+                query, raw_sql=query.interpolated_sql, params=None, template=None
+            )
+        return compacted[id(query)]
+
+    slowest = sorted(explain_set.queries, key=lambda q: q.duration, reverse=True)[:top_n]
+    return ExplainSet(
+        id=explain_set.id,
+        url=explain_set.url,
+        created=explain_set.created,
+        queries=[compact(q) for q in sorted(slowest, key=lambda q: q.index)],
+        stats={
+            f: dataclasses.replace(s, slowest=compact(s.slowest)) for f, s in explain_set._fingerprint_stats().items()
+        },
+        alias_stats=explain_set.alias_stats,
+    )
+
+
+def store_captured_request(
+    explain_set: ExplainSet, method: str, status_code: int, duration: float, reason: str
+) -> CapturedRequest:
+    """Stores a summary of the ExplainSet of a live request and adds it to the list of captured requests.
+
+    The summary keeps the `DJANGO_PEV_CAPTURED_REQUEST_QUERIES` (50) slowest queries, see
+    `summarize_explain_set()`. Only the most recent `DJANGO_PEV_MAX_CAPTURED_REQUESTS` are listed. The list is shared between
+    processes through the cache and is updated without locking, so concurrent updates may drop an
+    entry from the list.
+    """
+    store_explain_set(summarize_explain_set(explain_set, getattr(settings, "DJANGO_PEV_CAPTURED_REQUEST_QUERIES", 50)))
+    captured_request = CapturedRequest(
+        explainset_id=explain_set.id,
+        method=method,
+        url=explain_set.url,
+        status_code=status_code,
+        duration=duration,
+        n_queries=explain_set.n_queries,
+        db_time=sum(s.total_duration for s in explain_set.stats.values()),
+        n_nplusones=len(explain_set.nplusones),
+        reason=reason,
+        created=explain_set.created,
+    )
+    max_captured_requests = getattr(settings, "DJANGO_PEV_MAX_CAPTURED_REQUESTS", 100)
+    captured_requests = [captured_request, *get_captured_requests()][:max_captured_requests]
+    cache.set(
+        CAPTURED_REQUESTS_CACHE_KEY,
+        captured_requests,
+        timeout=getattr(settings, "DJANGO_PEV_CACHE_TIMEOUT", 60 * 60 * 24),
+    )
+    return captured_request
+
+
+def get_captured_requests() -> list[CapturedRequest]:
+    """Returns the captured requests, most recent first"""
+    return cache.get(CAPTURED_REQUESTS_CACHE_KEY) or []
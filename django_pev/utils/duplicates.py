@@ -0,0 +1,162 @@
+"""Exact duplicate queries: the same statement run again with the same parameters.
+
+A read is a duplicate when an identical read ran before it on the same database and no statement
+wrote to any of its tables in between, its result could have been memoized for the request. Writes
+whose tables are unknown (eg. statements sqlglot can not parse) and rollbacks invalidate every read.
+"""
+
+import functools
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Literal
+
+import sqlglot.expressions as exp
+
+from .nplusone import parse_sql, query_tables
+
+if TYPE_CHECKING:
+    from . import Explain, ExplainSet
+
+StatementKind = Literal["read", "write", "ignore"]
+
+READS = (exp.Select, exp.Union, exp.Intersect, exp.Except)
+WRITES = (exp.Insert, exp.Update, exp.Delete, exp.Merge)
+IGNORED = (exp.Transaction, exp.Commit)
+# Reads whose result differs between runs or which have side effects. Functions sqlglot knows are
+# matched by their sqlglot name (eg. `random()` is RAND, `gen_random_uuid()` is UUID, `now()` is
+# CURRENT_TIMESTAMP), the others by their name in the query
+VOLATILE_FUNCTIONS = {
+    "nextval",
+    "setval",
+    "random",
+    "rand",
+    "gen_random_uuid",
+    "uuid",
+    "now",
+    "current_timestamp",
+    "current_time",
+    "localtimestamp",
+    "statement_timestamp",
+    "clock_timestamp",
+    "timeofday",
+    "pg_advisory_lock",
+    "pg_try_advisory_lock",
+    "pg_sleep",
+    "txid_current",
+}
+
+
+@dataclass
+class DuplicateQuery:
+    """An identical query (same database, SQL and parameters) run more than once"""
+
+    query: "Explain"
+    tables: frozenset[str]
+    count: int = 0
+    total_duration: float = 0.0
+    # Runs which could have reused the result of a previous run
+    duplicates: int = 0
+    wasted_duration: float = 0.0
+
+
+@dataclass
+class MemoizationCandidate:
+    """A fingerprint whose queries are repeatedly duplicated, worth caching for the duration of a request"""
+
+    fingerprint: str
+    tables: frozenset[str]
+    queries: list[DuplicateQuery] = field(default_factory=list)
+
+    @property
+    def duplicates(self) -> int:
+        return sum(q.duplicates for q in self.queries)
+
+    @property
+    def wasted_duration(self) -> float:
+        return sum(q.wasted_duration for q in self.queries)
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_statement(fingerprint: str) -> tuple[StatementKind, frozenset[str] | None]:
+    """Whether a statement is a memoizable read, a write, or neither, and the tables it touches.
+
+    The tables are None for writes whose tables are unknown.
+    """
+    keyword = fingerprint.lstrip().split(None, 1)[0].upper() if fingerprint.strip() else ""
+    if keyword in ("SAVEPOINT", "RELEASE"):
+        return "ignore", frozenset()
+    expression = parse_sql(fingerprint)
+    if expression is None:
+        return "write", None
+    if isinstance(expression, IGNORED):
+        return "ignore", frozenset()
+    tables = query_tables(fingerprint)
+    if isinstance(expression, READS):
+        if expression.find(*WRITES) is not None:
+            return "write", tables
+        if expression.find(exp.Lock) is not None or any(
+            _function_name(function) in VOLATILE_FUNCTIONS for function in expression.find_all(exp.Func)
+        ):
+            return "ignore", frozenset()
+        return "read", tables
+    if isinstance(expression, (*WRITES, exp.TruncateTable, exp.Create, exp.Drop)):
+        return "write", tables
+    return "write", None
+
+
+def _function_name(function: exp.Func) -> str:
+    if isinstance(function, exp.Anonymous):
+        return function.name.lower()
+    return function.sql_name().lower()
+
+
+def find_duplicates(explain_set: "ExplainSet") -> list[DuplicateQuery]:
+    """Returns the reads which were run again while their result was still valid, most wasteful first.
+
+    Only retained queries are considered, duplicates of queries evicted by `max_queries` or sampled
+    out by `sample_rate` are missed.
+    """
+    groups: dict[tuple[str, str, str], DuplicateQuery] = {}
+    # Reads whose result is still valid, and the reads of each table
+    valid: set[tuple[str, str, str]] = set()
+    by_table: dict[str, set[tuple[str, str, str]]] = {}
+
+    for query in sorted(explain_set.queries, key=lambda q: q.index):
+        kind, tables = classify_statement(query.fingerprint)
+        if kind == "write":
+            if tables is None:
+                valid.clear()
+                by_table.clear()
+            for table in tables or ():
+                valid.difference_update(by_table.pop(table, ()))
+            continue
+        if kind == "ignore" or query.many:
+            continue
+
+        key = (query.db_alias, query.raw_sql, repr(query.params))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = DuplicateQuery(query=query, tables=tables or frozenset())
+        group.count += 1
+        group.total_duration += query.duration
+        if key in valid:
+            group.duplicates += 1
+            group.wasted_duration += query.duration
+        else:
+            valid.add(key)
+            for table in group.tables:
+                by_table.setdefault(table, set()).add(key)
+
+    duplicates = [group for group in groups.values() if group.duplicates]
+    return sorted(duplicates, key=lambda g: g.wasted_duration, reverse=True)
+
+
+def find_memoization_candidates(explain_set: "ExplainSet") -> list[MemoizationCandidate]:
+    """Groups the duplicate queries by fingerprint, most wasteful first"""
+    candidates: dict[str, MemoizationCandidate] = {}
+    for duplicate in find_duplicates(explain_set):
+        fingerprint = duplicate.query.fingerprint
+        candidate = candidates.get(fingerprint)
+        if candidate is None:
+            candidate = candidates[fingerprint] = MemoizationCandidate(fingerprint, duplicate.tables)
+        candidate.queries.append(duplicate)
+    return sorted(candidates.values(), key=lambda c: c.wasted_duration, reverse=True)
@@ -0,0 +1,258 @@
+"""Fingerprinting of SQL queries without parsing them.
+
+Queries are normalized the way pg_stat_statements normalizes query text: constants (and driver
+placeholders such as `%s`) are replaced with `$1`, `$2`... in order of appearance while the rest of
+the text, whitespace included, is kept as is. Savepoint names, unique per savepoint in Django, are
+replaced too. Lists of constants in `IN (...)` are squashed to `IN ($1 /*, ... */)` as PostgreSQL 18
+does, and multi row `VALUES` batches keep only their first row, so queries differing only in the
+number of values share a fingerprint."""
+
+import functools
+import re
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z_0-9]*)?\$.*?\$(?P=tag)?\$)
+    | (?P<string>[Ee]'(?:[^'\\]|''|\\.)*'|(?:[BbXxNn]|[Uu]&)?'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*"|[A-Za-z_\u0080-\uffff][A-Za-z_0-9$\u0080-\uffff]*)
+    | (?P<param>%s|%\([^)]*\)s|\$\d+)
+    | (?P<number>0[xX][0-9A-Fa-f_]+|(?:\d[\d_]*(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<percent>%%)
+    | (?P<op>::|(?:[<>=!~^&|#@*/+-]|%(?![s(%]))+|[(),;.\[\]{}:])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Words after which a `-` starts a negative constant rather than a subtraction
+_PREFIX_KEYWORDS = frozenset(
+    (
+        "select",
+        "where",
+        "and",
+        "or",
+        "not",
+        "by",
+        "then",
+        "else",
+        "when",
+        "in",
+        "is",
+        "limit",
+        "offset",
+        "values",
+        "returning",
+        "set",
+        "on",
+        "as",
+        "case",
+        "between",
+        "like",
+        "ilike",
+        "having",
+        "any",
+        "all",
+        "distinct",
+    )
+)
+
+# Operators ending with `+` or `-` are only split by the lexer when they contain none of these
+_LONG_OPERATOR_CHARS = frozenset("~!@#^&|`?%")
+
+_CONSTANT_KINDS = frozenset(("string", "dollar", "number", "param"))
+_SQUASHED = " /*, ... */"
+
+
+def _tokenize(sql: str, unescape_percent: bool) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    length = len(sql)
+    while position < length:
+        match = _TOKEN_RE.match(sql, position)
+        if match is None:
+            # Unknown character, keep it as an operator
+            tokens.append(("op", sql[position]))
+            position += 1
+            continue
+        kind = match.lastgroup
+        text = match.group()
+        position = match.end()
+        if kind == "percent":
+            kind, text = "op", "%" if unescape_percent else text
+        elif kind == "op" and len(text) > 1 and text[-1] in "+-" and not _LONG_OPERATOR_CHARS & set(text):
+            # Like the PostgreSQL lexer, `=-1` is `=` followed by `-1` rather than a `=-` operator
+            text = text.rstrip("+-") or text[0]
+            position = match.start() + len(text)
+        tokens.append((kind, text))  # type: ignore[arg-type]
+    return tokens
+
+
+def _is_prefix(kind: str | None, text: str) -> bool:
+    """Whether a `-` following this token is a unary minus"""
+    if kind is None:
+        return True
+    if kind == "op":
+        return text not in (")", "]")
+    if kind == "ident":
+        return text.lower() in _PREFIX_KEYWORDS
+    return False
+
+
+def _constant_list_end(tokens: list[tuple[str, str]], start: int) -> tuple[int, int]:
+    """Returns the index of the closing parenthesis of a list of constants opened at `start` and
+    the number of items in the list, or (-1, 0) when the list contains anything but constants."""
+    items = 0
+    expect_item = True
+    index = start + 1
+    while index < len(tokens):
+        kind, text = tokens[index]
+        index += 1
+        if kind in ("space", "comment"):
+            continue
+        if expect_item:
+            if text == "-" and index < len(tokens) and tokens[index][0] == "number":
+                index += 1
+            elif kind not in _CONSTANT_KINDS:
+                return -1, 0
+            items += 1
+            expect_item = False
+        elif text == ",":
+            expect_item = True
+        elif text == ")":
+            return index - 1, items
+        elif text == "::" and index < len(tokens) and tokens[index][0] == "ident":
+            # Constants may carry a type cast eg. '1'::int
+            index += 1
+        else:
+            return -1, 0
+    return -1, 0
+
+
+def _group_end(tokens: list[tuple[str, str]], start: int) -> int:
+    """Returns the index of the parenthesis closing the one opened at `start`"""
+    depth = 0
+    for index in range(start, len(tokens)):
+        text = tokens[index][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    return len(tokens) - 1
+
+
+def _next_significant(tokens: list[tuple[str, str]], start: int) -> int:
+    while start < len(tokens) and tokens[start][0] in ("space", "comment"):
+        start += 1
+    return start
+
+
+def _is_savepoint_name(statement: str, previous_keyword: str, kind: str, text: str) -> bool:
+    """Whether an identifier is the name of a savepoint, after SAVEPOINT, RELEASE [SAVEPOINT] or
+    ROLLBACK [TRANSACTION] TO [SAVEPOINT]. Django names savepoints uniquely, they are constants.
+    """
+    if kind != "ident" or statement not in ("savepoint", "release", "rollback"):
+        return False
+    if previous_keyword == "savepoint":
+        return True
+    return text.lower() != "savepoint" and (
+        (statement == "release" and previous_keyword == "release")
+        or (statement == "rollback" and previous_keyword == "to")
+    )
+
+
+class _Normalizer:
+    def __init__(self, tokens: list[tuple[str, str]]):
+        self.tokens = tokens
+        self.output: list[str] = []
+        self.n_params = 0
+        first = _next_significant(tokens, 0)
+        # The first keyword of the statement
+        self.statement = tokens[first][1].lower() if first < len(tokens) and tokens[first][0] == "ident" else ""
+
+    def param(self) -> str:
+        self.n_params += 1
+        return f"${self.n_params}"
+
+    def run(self, start: int, stop: int) -> None:
+        tokens = self.tokens
+        previous_kind: str | None = None
+        previous_text = ""
+        index = start
+
+        while index < stop:
+            kind, text = tokens[index]
+
+            if kind in ("space", "comment"):
+                self.output.append(text)
+                index += 1
+                continue
+
+            previous_keyword = previous_text.lower() if previous_kind == "ident" else ""
+            if text == "(" and previous_keyword == "in":
+                end, items = _constant_list_end(tokens, index)
+                if items > 1:
+                    self.output.append(f"({self.param()}{_SQUASHED})")
+                    previous_kind, previous_text = "op", ")"
+                    index = end + 1
+                    continue
+
+            if text == "(" and previous_keyword == "values":
+                index = self.values(index)
+                previous_kind, previous_text = "op", ")"
+                continue
+
+            if (
+                text == "-"
+                and _is_prefix(previous_kind, previous_text)
+                and index + 1 < stop
+                and tokens[index + 1][0] == "number"
+            ):
+                index += 1
+                kind = "number"
+
+            if _is_savepoint_name(self.statement, previous_keyword, kind, text):
+                kind = "param"
+
+            self.output.append(self.param() if kind in _CONSTANT_KINDS else text)
+            previous_kind, previous_text = kind, text
+            index += 1
+
+    def values(self, start: int) -> int:
+        """Normalize the first row of a VALUES list and squash the following rows.
+
+        Returns the index of the token following the last row.
+        """
+        end = _group_end(self.tokens, start)
+        self.run(start, end + 1)
+        squashed = False
+        while True:
+            following = _next_significant(self.tokens, end + 1)
+            if following >= len(self.tokens) or self.tokens[following][1] != ",":
+                break
+            row = _next_significant(self.tokens, following + 1)
+            if row >= len(self.tokens) or self.tokens[row][1] != "(":
+                break
+            end = _group_end(self.tokens, row)
+            squashed = True
+        if squashed:
+            self.output.append(_SQUASHED)
+        return end + 1
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_sql(sql: str, unescape_percent: bool = True) -> str:
+    """Normalize a query (or a query template) like pg_stat_statements does.
+
+    >>> normalize_sql('SELECT * FROM "t" WHERE "t"."id" IN (%s, %s) AND "t"."name" = %s LIMIT 21')
+    'SELECT * FROM "t" WHERE "t"."id" IN ($1 /*, ... */) AND "t"."name" = $2 LIMIT $3'
+
+    `unescape_percent` turns the `%%` escapes of a template with parameters into `%`, the text
+    PostgreSQL receives. Pass False for queries executed without parameters.
+    """
+    tokens = _tokenize(sql, unescape_percent)
+    normalizer = _Normalizer(tokens)
+    normalizer.run(0, len(tokens))
+    return "".join(normalizer.output)
@@ -1,9 +1,13 @@
 import dataclasses
+import datetime
+import functools
+import time
 from decimal import Decimal
-from itertools import groupby
 from pathlib import Path
 
-from django.db import connection
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
 
 
 @dataclasses.dataclass
@@ -45,13 +49,17 @@ class IndexInfo:
         return self.columns[: len(columns)] == columns
 
 
-def get_indexes() -> list[IndexInfo]:
-    with connection.cursor() as cursor:
-        sql = (Path(__file__).parent / "index_lookup.sql").read_text()
-        cursor.execute(sql)
-        indexes = list(IndexInfo(*c) for c in cursor.fetchall())
-    _update_indexes_with_duplicated_indexes(indexes)
-    return indexes
+def get_indexes(using: str | None = None) -> list[IndexInfo]:
+    """The indexes of a database (the default one), with the index covering each duplicated index.
+
+    See `get_catalog_snapshot()` to share them within a request.
+    """
+    return get_catalog_snapshot(using, use_cache=False).indexes
+
+
+@functools.cache
+def _index_lookup_sql() -> str:
+    return (Path(__file__).parent / "index_lookup.sql").read_text()
 
 
 def get_total_index_hitrate() -> float:
@@ -70,26 +78,156 @@ def get_total_index_hitrate() -> float:
 
 def _update_indexes_with_duplicated_indexes(
     indexes: list[IndexInfo] | None = None,
-) -> None:
-    """Modifies a list of indexes a reference to the other index that covers it"""
-    indexes = indexes or get_indexes()
-    indexes_by_table = {key: list(group) for key, group in groupby(indexes, lambda i: i.table_key)}
+) -> dict[tuple, "IndexTrie"]:
+    """Modifies a list of indexes a reference to the other index that covers it.
+
+    Returns the tries of the valid indexes, by `_duplicate_key()`.
+    """
+    if indexes is None:
+        indexes = get_indexes()
+    tries: dict[tuple, IndexTrie] = {}
+    for index in indexes:
+        if index.valid:
+            trie = tries.get(_duplicate_key(index))
+            if trie is None:
+                trie = tries[_duplicate_key(index)] = IndexTrie()
+            trie.insert(index)
     for index in indexes:
         if index.valid and not index.primary and not index.unique:
-            for other_index in indexes_by_table[index.table_key]:
-                if (
-                    other_index.valid
-                    and other_index.name != index.name
-                    and other_index.index_covers(index.columns)
-                    and other_index.using == index.using
-                    and other_index.indexprs == index.indexprs
-                    and other_index.indpred == index.indpred
-                ):
-                    index.covered_by = other_index
+            index.covered_by = tries[_duplicate_key(index)].covering(index)
+    return tries
+
+
+def _duplicate_key(index: IndexInfo) -> tuple:
+    """Indexes can only cover each other when they share this key"""
+    return (index.schema, index.table, index.using, index.indexprs, index.indpred)
+
+
+def _keep_first(index: IndexInfo) -> tuple:
+    """Of identical indexes, unique and primary key indexes are kept, then the first by name"""
+    return (not (index.primary or index.unique), index.name)
+
+
+class IndexTrie:
+    """The indexes of a table by leading columns.
+
+    Each node is a prefix of the columns of some indexes, and holds the indexes whose columns are exactly
+    that prefix and the preferred index whose columns extend past it. Finding the index covering another
+    walks its columns once, so duplicates are found in time linear with the number of indexed columns.
+    """
+
+    __slots__ = ("children", "ending", "longer")
+
+    def __init__(self) -> None:
+        self.children: dict[str, IndexTrie] = {}
+        self.ending: list[IndexInfo] = []
+        self.longer: IndexInfo | None = None
+
+    def insert(self, index: IndexInfo) -> None:
+        node = self
+        for column in index.columns:
+            if node.longer is None or _keep_first(index) < _keep_first(node.longer):
+                node.longer = index
+            child = node.children.get(column)
+            if child is None:
+                child = node.children[column] = IndexTrie()
+            node = child
+        node.ending.append(index)
+
+    def find(self, columns: list[str]) -> "IndexTrie | None":
+        """The node of a prefix of columns, None when no index starts with them"""
+        node = self
+        for column in columns:
+            child = node.children.get(column)
+            if child is None:
+                return None
+            node = child
+        return node
+
+    def with_prefix(self, columns: list[str]) -> list[IndexInfo]:
+        """The indexes whose columns start with `columns`"""
+        node = self.find(columns)
+        found: list[IndexInfo] = []
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            found.extend(node.ending)
+            stack.extend(node.children.values())
+        return found
+
+    def covering(self, index: IndexInfo) -> IndexInfo | None:
+        """The index which makes `index` redundant: one on more columns starting with its columns, or an
+        identical index which is kept rather than it.
+        """
+        node = self.find(index.columns)
+        if node is None:
+            return None
+        if node.longer is not None:
+            return node.longer
+        kept = min(node.ending, key=_keep_first)
+        return kept if kept is not index else None
+
+
+@dataclasses.dataclass
+class CatalogSnapshot:
+    """The indexes of a database loaded at once, by table and by leading columns"""
+
+    db_alias: str
+    indexes: list[IndexInfo]
+    taken_at: datetime.datetime
+    by_table: dict[str, list[IndexInfo]] = dataclasses.field(default_factory=dict, repr=False)
+    tries_by_table: dict[str, list[IndexTrie]] = dataclasses.field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_indexes(cls, db_alias: str, indexes: list[IndexInfo]) -> "CatalogSnapshot":
+        """Indexes the indexes and finds the duplicated ones"""
+        snapshot = cls(db_alias=db_alias, indexes=indexes, taken_at=timezone.now())
+        for index in indexes:
+            snapshot.by_table.setdefault(index.table_key, []).append(index)
+        for (schema, table, *_), trie in _update_indexes_with_duplicated_indexes(indexes).items():
+            snapshot.tries_by_table.setdefault(f"{schema}.{table}", []).append(trie)
+        return snapshot
+
+    def table_indexes(self, table: str, schema: str = "public") -> list[IndexInfo]:
+        return self.by_table.get(f"{schema}.{table}", [])
+
+    def indexes_with_prefix(self, table: str, columns: list[str], schema: str = "public") -> list[IndexInfo]:
+        """The valid indexes of a table whose leading columns are `columns`, eg. to support a filter"""
+        return [
+            index for trie in self.tries_by_table.get(f"{schema}.{table}", []) for index in trie.with_prefix(columns)
+        ]
+
+    @property
+    def duplicated_indexes(self) -> list[IndexInfo]:
+        return [i for i in self.indexes if i.is_duplicated]
+
+
+_snapshots: dict[str, tuple[float, CatalogSnapshot]] = {}
+
+
+def get_catalog_snapshot(using: str | None = None, use_cache: bool = True) -> CatalogSnapshot:
+    """The indexes of a database (the default one), loaded once per request.
+
+    With `use_cache` snapshots are reused by the process for `DJANGO_PEV_CATALOG_CACHE_TIMEOUT`
+    seconds (10).
+    """
+    db_alias = using or connection.alias
+    cached = _snapshots.get(db_alias)
+    if use_cache and cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    database = connections[db_alias]
+    with database.cursor() as cursor:
+        cursor.execute(_index_lookup_sql())
+        indexes = list(IndexInfo(*c) for c in cursor.fetchall())
+    snapshot = CatalogSnapshot.from_indexes(db_alias, indexes)
+    timeout = getattr(settings, "DJANGO_PEV_CATALOG_CACHE_TIMEOUT", 10)
+    _snapshots[db_alias] = (time.monotonic() + timeout, snapshot)
+    return snapshot
 
 
 def get_index_stats(indexes: list[IndexInfo] | None = None) -> dict:
-    indexes = indexes or get_indexes()
+    if indexes is None:
+        indexes = get_indexes()
 
     ret = {
         "total_index_hitrate": get_total_index_hitrate() * 100,
@@ -0,0 +1,182 @@
+"""The schema and statistics of a set of tables, fetched in a single round trip.
+
+Used to describe the tables of a query, eg. in `Explain.optimization_prompt()`. Each table is cached
+in the plan cache, so entries are shared by every query mentioning the table and dropped when the
+schema version of the database changes.
+"""
+
+import dataclasses
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .plan_cache import MISSING, plan_cache, plan_cache_key
+
+TABLES_SQL = """
+SELECT
+    n.nspname,
+    c.relname,
+    c.reltuples::bigint,
+    pg_table_size(c.oid),
+    s.seq_scan,
+    s.idx_scan,
+    s.n_live_tup,
+    s.n_dead_tup,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'name', a.attname,
+            'data_type', format_type(a.atttypid, a.atttypmod),
+            'nullable', NOT a.attnotnull,
+            'null_frac', st.null_frac,
+            'n_distinct', st.n_distinct,
+            'correlation', st.correlation
+        ) ORDER BY a.attnum)
+        FROM pg_attribute a
+        LEFT JOIN pg_stats st ON (
+            st.schemaname = n.nspname
+            AND st.tablename = c.relname
+            AND st.attname = a.attname
+            AND st.inherited = (c.relkind = 'p')
+        )
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ), '[]'),
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'name', ic.relname,
+            'columns', ARRAY(
+                SELECT pg_get_indexdef(i.indexrelid, k, true) FROM generate_series(1, i.indnkeyatts) AS k ORDER BY k
+            ),
+            'definition', pg_get_indexdef(i.indexrelid),
+            'unique', i.indisunique,
+            'primary', i.indisprimary,
+            'valid', i.indisvalid
+        ) ORDER BY ic.relname)
+        FROM pg_index i
+        INNER JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = c.oid
+    ), '[]'),
+    COALESCE((
+        SELECT json_agg(json_build_object(
+            'name', con.conname,
+            'type', con.contype,
+            'definition', pg_get_constraintdef(con.oid)
+        ) ORDER BY con.conname)
+        FROM pg_constraint con
+        WHERE con.conrelid = c.oid
+    ), '[]')
+FROM
+    pg_class c
+INNER JOIN
+    pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN
+    pg_stat_all_tables s ON s.relid = c.oid
+WHERE
+    c.relkind IN ('r', 'p', 'm', 'f')
+AND
+    (n.nspname, c.relname) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class ColumnInfo:
+    """A column of a table, with its statistics from pg_stats when the table was analyzed"""
+
+    name: str
+    data_type: str
+    nullable: bool
+    null_frac: float | None = None
+    # Negative values are the opposite of the fraction of distinct rows, see pg_stats
+    n_distinct: float | None = None
+    correlation: float | None = None
+
+    def distinct_values(self, rows: float) -> float | None:
+        """The estimated number of distinct values of the column in a table of `rows` rows"""
+        if self.n_distinct is None:
+            return None
+        return self.n_distinct if self.n_distinct >= 0 else -self.n_distinct * rows
+
+
+@dataclasses.dataclass(frozen=True)
+class TableIndex:
+    name: str
+    columns: list[str]
+    definition: str
+    unique: bool
+    primary: bool
+    valid: bool
+
+    @property
+    def columns_formatted(self) -> str:
+        return ", ".join(self.columns)
+
+
+@dataclasses.dataclass(frozen=True)
+class ConstraintInfo:
+    name: str
+    # p: primary key, f: foreign key, u: unique, c: check, x: exclusion, n: not null
+    type: str
+    definition: str
+
+
+@dataclasses.dataclass(frozen=True)
+class TableInfo:
+    schema: str
+    name: str
+    # Estimated by the last ANALYZE or VACUUM, -1 when the table was never analyzed
+    estimated_rows: int
+    size_bytes: int
+    seq_scan: int | None
+    idx_scan: int | None
+    live_rows: int | None
+    dead_rows: int | None
+    columns: list[ColumnInfo]
+    indexes: list[TableIndex]
+    constraints: list[ConstraintInfo]
+
+    @property
+    def table_key(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+
+def _to_table_info(row: Any) -> TableInfo:
+    schema, name, estimated_rows, size_bytes, seq_scan, idx_scan, live_rows, dead_rows = row[:8]
+    columns, indexes, constraints = row[8:]
+    return TableInfo(
+        schema=schema,
+        name=name,
+        estimated_rows=estimated_rows,
+        size_bytes=size_bytes,
+        seq_scan=seq_scan,
+        idx_scan=idx_scan,
+        live_rows=live_rows,
+        dead_rows=dead_rows,
+        columns=[ColumnInfo(**c) for c in columns],
+        indexes=[TableIndex(**i) for i in indexes],
+        constraints=[ConstraintInfo(**c) for c in constraints],
+    )
+
+
+def get_tables(tables: Iterable[tuple[str, str]], using: str = DEFAULT_DB_ALIAS) -> dict[tuple[str, str], TableInfo]:
+    """The columns, indexes, constraints and statistics of `(schema, table)` pairs of a database.
+
+    Tables missing from the plan cache are fetched in a single query. Names which are not tables (eg.
+    the name of a CTE) are left out.
+    """
+    found: dict[tuple[str, str], TableInfo | None] = {}
+    keys = {table: plan_cache_key("table", using, ".".join(table), False) for table in set(tables)}
+    for table, key in keys.items():
+        cached = plan_cache.get(key)
+        if cached is not MISSING:
+            found[table] = cached
+
+    missing = [table for table in keys if table not in found]
+    if missing:
+        with connections[using].cursor() as cursor:
+            cursor.execute(TABLES_SQL, [[schema for schema, _ in missing], [name for _, name in missing]])
+            fetched = {(row[0], row[1]): _to_table_info(row) for row in cursor.fetchall()}
+        for table in missing:
+            # Names which are not tables are cached too, so they are not looked up again
+            found[table] = fetched.get(table)
+            plan_cache.set(keys[table], found[table])
+    return {table: info for table, info in found.items() if info is not None}
@@ -0,0 +1,198 @@
+"""N+1 detection per call site, with the `select_related`/`prefetch_related` lookups that would fix them.
+
+Repeated queries are grouped by fingerprint and by the chain of frames that ran them, so the same query
+run from two different loops is reported twice. The tables and filtered columns of a repeated query are
+mapped back to Django models to suggest the relation to load up front, eg. a query on `school_teacher`
+filtered by its primary key repeated for every subject is fixed by `Subject.objects.select_related("teacher")`.
+"""
+
+import functools
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Literal
+
+import sqlglot
+import sqlglot.errors
+import sqlglot.expressions as exp
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+
+if TYPE_CHECKING:
+    from . import Explain, ExplainSet
+
+
+@dataclass(frozen=True)
+class OrmSuggestion:
+    """A relation to load with the queryset of `model` rather than once per row"""
+
+    model: type[models.Model]
+    method: Literal["select_related", "prefetch_related"]
+    lookup: str
+
+    def __str__(self) -> str:
+        return f'{self.model.__name__}.objects.{self.method}("{self.lookup}")'
+
+
+@dataclass
+class NPlusOne:
+    """Queries of the same fingerprint repeated from the same call site.
+
+    `call_site` is None when some queries of the fingerprint were not retained (`max_queries` or
+    `sample_rate`), the group then holds every query of the fingerprint.
+    """
+
+    fingerprint: str
+    call_site: int | None
+    count: int
+    total_duration: float
+    query: "Explain"
+    suggestions: list[OrmSuggestion] = field(default_factory=list)
+
+    @property
+    def wasted_duration(self) -> float:
+        """The time spent on all but one query of the group, which a single batched query would save"""
+        return self.total_duration - self.total_duration / self.count
+
+
+def get_nplusone_threshold() -> int:
+    """Queries repeated more than this many times are N+1 queries, `DJANGO_PEV_NPLUSONE_THRESHOLD`"""
+    return getattr(settings, "DJANGO_PEV_NPLUSONE_THRESHOLD", 3)
+
+
+def find_nplusones(explain_set: "ExplainSet", threshold: int | None = None) -> list[NPlusOne]:
+    """Returns the queries repeated more than `threshold` times from a call site, most wasteful first"""
+    if threshold is None:
+        threshold = get_nplusone_threshold()
+
+    retained: dict[str, list[Explain]] = defaultdict(list)
+    for query in explain_set.queries:
+        retained[query.fingerprint].append(query)
+
+    groups = []
+    for stats in explain_set._fingerprint_stats().values():
+        if stats.count <= threshold:
+            continue
+        queries = retained[stats.fingerprint]
+        if len(queries) == stats.count:
+            groups.extend(_group_by_call_site(stats.fingerprint, queries, threshold))
+        else:
+            groups.append(NPlusOne(stats.fingerprint, None, stats.count, stats.total_duration, stats.slowest))
+
+    if groups:
+        # Relations of tables the block already queried are the most likely culprits
+        queried_tables = set().union(*(query_tables(fingerprint) for fingerprint in retained))
+        for group in groups:
+            group.suggestions = suggest_orm_fixes(group.fingerprint, queried_tables - query_tables(group.fingerprint))
+    return sorted(groups, key=lambda g: g.wasted_duration, reverse=True)
+
+
+def _group_by_call_site(fingerprint: str, queries: list["Explain"], threshold: int) -> list[NPlusOne]:
+    by_call_site: dict[int, list[Explain]] = defaultdict(list)
+    for query in queries:
+        by_call_site[query.call_site].append(query)
+    return [
+        NPlusOne(
+            fingerprint,
+            call_site,
+            len(site_queries),
+            sum(q.duration for q in site_queries),
+            max(site_queries, key=lambda q: q.duration),
+        )
+        for call_site, site_queries in by_call_site.items()
+        if len(site_queries) > threshold
+    ]
+
+
+@functools.cache
+def _models_by_table() -> dict[str, type[models.Model]]:
+    return {model._meta.db_table: model for model in apps.get_models(include_auto_created=True)}
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_sql(sql: str) -> Any:
+    """Parses a query with sqlglot, returns None when it can not be parsed"""
+    try:
+        return sqlglot.parse_one(sql, read="postgres")
+    except sqlglot.errors.ParseError:
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def query_tables(sql: str) -> frozenset[str]:
+    """The names of the tables a query reads or writes"""
+    expression = parse_sql(sql)
+    if expression is None:
+        return frozenset()
+    return frozenset(table.name for table in expression.find_all(exp.Table))
+
+
+def _filtered_fields(sql: str) -> list[tuple[type[models.Model], models.Field]]:
+    """The model fields compared to a parameter in the WHERE clause of the query"""
+    expression = parse_sql(sql)
+    select = expression.find(exp.Select) if expression is not None else None
+    where = select.args.get("where") if select is not None else None
+    if select is None or where is None:
+        return []
+
+    tables = {table.alias_or_name: table.name for table in select.find_all(exp.Table)}
+    models_by_table = _models_by_table()
+    filtered = []
+    for condition in where.find_all(exp.EQ, exp.In):
+        column = condition.this
+        if not isinstance(column, exp.Column):
+            continue
+        table = tables.get(column.table) if column.table else next(iter(tables.values()), None)
+        model = models_by_table.get(table or "")
+        if model is None:
+            continue
+        for model_field in model._meta.fields:
+            if getattr(model_field, "column", None) == column.name:
+                filtered.append((model, model_field))
+    return filtered
+
+
+def suggest_orm_fixes(sql: str, queried_tables: frozenset[str] | set[str] = frozenset()) -> list[OrmSuggestion]:
+    """Suggests the select_related/prefetch_related lookups that would load the rows of a repeated query.
+
+    - filtered by primary key: a foreign key pointing to the model is accessed per row, `select_related`
+      its forward relation. Relations from the `queried_tables` are preferred when there are several.
+    - filtered by a foreign key: the reverse relation is accessed per row, `prefetch_related` it
+    - filtered by a foreign key of a many to many table: `prefetch_related` the many to many field
+    """
+    suggestions: list[OrmSuggestion] = []
+    for model, model_field in _filtered_fields(sql):
+        if model_field.primary_key:
+            candidates = [
+                OrmSuggestion(related, "select_related", relation.name)
+                for related in _models_by_table().values()
+                for relation in related._meta.fields
+                if (relation.many_to_one or relation.one_to_one) and relation.related_model is model
+            ]
+            preferred = [s for s in candidates if s.model._meta.db_table in queried_tables]
+            suggestions.extend(preferred or candidates)
+        elif model_field.is_relation and model._meta.auto_created:
+            suggestions.extend(_many_to_many_suggestions(model, model_field))
+        elif model_field.is_relation:
+            accessor = model_field.remote_field.get_accessor_name()  # type: ignore[union-attr]
+            if accessor:
+                method: Literal["select_related", "prefetch_related"] = (
+                    "select_related" if model_field.one_to_one else "prefetch_related"
+                )
+                suggestions.append(OrmSuggestion(model_field.related_model, method, accessor))  # type: ignore[arg-type]
+    return list(dict.fromkeys(suggestions))
+
+
+def _many_to_many_suggestions(through: type[models.Model], model_field: models.Field) -> list[OrmSuggestion]:
+    owner: type[models.Model] = through._meta.auto_created  # type: ignore[assignment]
+    suggestions = []
+    for many_to_many in owner._meta.local_many_to_many:
+        if many_to_many.remote_field.through is not through:  # type: ignore[union-attr]
+            continue
+        if model_field.name == many_to_many.m2m_field_name():  # type: ignore[attr-defined]
+            suggestions.append(OrmSuggestion(owner, "prefetch_related", many_to_many.name))
+        else:
+            accessor = many_to_many.remote_field.get_accessor_name()  # type: ignore[union-attr]
+            if accessor:
+                suggestions.append(OrmSuggestion(many_to_many.related_model, "prefetch_related", accessor))  # type: ignore[arg-type]
+    return suggestions
@@ -0,0 +1,120 @@
+"""A bounded cache of EXPLAIN results shared by every Explain of the same query shape.
+
+Entries are keyed by the kind of result, the database alias, the schema version of that database,
+the analyze flag and the fingerprint of the query, so the plans of an N+1 query are computed once
+whichever of its queries is explained. Entries are kept in process in a LRU of
+`DJANGO_PEV_PLAN_CACHE_SIZE` entries for `DJANGO_PEV_PLAN_CACHE_TIMEOUT` seconds, and are shared
+between processes through the Django cache named by `DJANGO_PEV_PLAN_CACHE_BACKEND` when set.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, TypeVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+T = TypeVar("T")
+
+# Schema versions are looked up at most once per this many seconds per database
+SCHEMA_VERSION_TTL = 60
+
+MISSING = object()
+
+
+class PlanCache:
+    """A thread safe LRU cache whose entries expire after a timeout"""
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self) -> int:
+        return getattr(settings, "DJANGO_PEV_PLAN_CACHE_SIZE", 256)
+
+    @property
+    def timeout(self) -> float:
+        return getattr(settings, "DJANGO_PEV_PLAN_CACHE_TIMEOUT", 60 * 10)
+
+    @property
+    def backend(self) -> str | None:
+        return getattr(settings, "DJANGO_PEV_PLAN_CACHE_BACKEND", None)
+
+    def get(self, key: str) -> Any:
+        """Returns the cached value, or `MISSING`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+        if self.backend is not None:
+            value = caches[self.backend].get(key, MISSING)
+            if value is not MISSING:
+                self._set_local(key, value)
+            return value
+        return MISSING
+
+    def set(self, key: str, value: Any) -> None:
+        self._set_local(key, value)
+        if self.backend is not None:
+            caches[self.backend].set(key, value, timeout=self.timeout)
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: str, compute: Callable[[], T]) -> T:
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Clears the entries of this process, entries in the Django cache expire on their own"""
+        with self._lock:
+            self._entries.clear()
+        _schema_versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+plan_cache = PlanCache()
+
+_schema_versions: dict[str, tuple[float, str]] = {}
+
+
+def get_schema_version(db_alias: str) -> str:
+    """Returns a version of the schema of a database that changes when migrations are applied"""
+    cached = _schema_versions.get(db_alias)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    with connections[db_alias].cursor() as cursor:
+        cursor.execute("SELECT to_regclass('django_migrations') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT count(*), max(id) FROM django_migrations")
+            count, max_id = cursor.fetchone()
+            version = f"{count}.{max_id}"
+        else:
+            # Not managed by Django migrations
+            version = "0"
+    _schema_versions[db_alias] = (time.monotonic() + SCHEMA_VERSION_TTL, version)
+    return version
+
+
+def plan_cache_key(kind: str, db_alias: str, fingerprint: str, analyze: bool, *extra: Hashable) -> str:
+    digest = hashlib.sha1(repr((fingerprint, extra)).encode()).hexdigest()
+    return f"DJANGO_PEV:PLAN:{kind}:{db_alias}:{get_schema_version(db_alias)}:{int(analyze)}:{digest}"
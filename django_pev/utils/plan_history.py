@@ -0,0 +1,74 @@
+import hashlib
+from typing import TYPE_CHECKING, Any
+
+from django.db import connections, router
+
+from django_pev.models import PlanSnapshot
+
+from .plans import PlanChange, diff_plans, parse_plan
+
+if TYPE_CHECKING:
+    from . import Explain, ExplainSet
+
+
+def fingerprint_hash(fingerprint: str) -> str:
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def record_plan(query: "Explain", analyze: bool = False, url: str = "") -> PlanSnapshot:
+    """Stores the current plan of a query so changes to the plan of its fingerprint can be tracked"""
+    json_plan = query.json_plan(analyze)
+    plan = parse_plan(json_plan)
+    return PlanSnapshot.objects.create(
+        fingerprint=query.fingerprint,
+        fingerprint_hash=fingerprint_hash(query.fingerprint),
+        db_alias=query.db_alias,
+        shape_hash=plan.shape_hash,
+        analyzed=plan.analyzed,
+        total_cost=plan.root.total_cost,
+        execution_time=plan.execution_time,
+        plan=json_plan,
+        sql=query.interpolated_sql,
+        url=url,
+    )
+
+
+def record_plans(explain_set: "ExplainSet", analyze: bool = False, top_n: int | None = None) -> list[PlanSnapshot]:
+    """Stores the plan of the slowest query of each fingerprint, the `top_n` most expensive ones if set.
+
+    Run it from a scheduled job or a test over the important pages to keep a history of their plans:
+    >>> with explain(url="/dashboard/") as e:
+    >>>     client.get("/dashboard/")
+    >>> record_plans(e, top_n=20)
+    """
+    stats = sorted(explain_set.stats.values(), key=lambda s: s.total_duration, reverse=True)
+    if top_n is not None:
+        stats = stats[:top_n]
+    return [record_plan(s.slowest, analyze=analyze, url=explain_set.url) for s in stats]
+
+
+def get_plan_history(fingerprint: str) -> list[PlanSnapshot]:
+    """Returns the recorded plans of a fingerprint, most recent first"""
+    return list(PlanSnapshot.objects.filter(fingerprint_hash=fingerprint_hash(fingerprint)))
+
+
+def get_fingerprints(limit: int = 200) -> list[dict[str, Any]]:
+    """Returns the fingerprints with recorded plans, the number of plans and of distinct shapes"""
+    with connections[router.db_for_read(PlanSnapshot)].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT fingerprint_hash, max(fingerprint), count(*), count(DISTINCT shape_hash), max(created)
+            FROM {PlanSnapshot._meta.db_table}
+            GROUP BY fingerprint_hash
+            ORDER BY max(created) DESC
+            LIMIT %s
+            """,
+            [limit],
+        )
+        fields = ("fingerprint_hash", "fingerprint", "count", "shapes", "last_recorded")
+        return [dict(zip(fields, row)) for row in cursor.fetchall()]
+
+
+def diff_snapshots(old: PlanSnapshot, new: PlanSnapshot, cost_jump: float = 2.0) -> list[PlanChange]:
+    """Compares two recorded plans of the same fingerprint, see `plans.diff_plans`"""
+    return diff_plans(parse_plan(old.plan), parse_plan(new.plan), cost_jump=cost_jump)
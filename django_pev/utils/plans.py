@@ -0,0 +1,291 @@
+"""A parsed model of `EXPLAIN (FORMAT JSON)` plans, to triage plans without uploading them.
+
+Times are in milliseconds as reported by PostgreSQL. Actual rows and times of a node are averages per
+loop, the `total_*` and `inclusive_time` values multiply them by the number of loops.
+"""
+
+import hashlib
+import json
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Literal
+
+FindingKind = Literal["misestimate", "seq_scan", "nested_loop"]
+ChangeKind = Literal["node_type", "cost", "spill"]
+
+
+class PlanNode:
+    """A node of a query plan"""
+
+    __slots__ = (
+        "node_type",
+        "relation_name",
+        "index_name",
+        "join_type",
+        "strategy",
+        "parent_relationship",
+        "startup_cost",
+        "total_cost",
+        "plan_rows",
+        "actual_rows",
+        "actual_loops",
+        "actual_total_time",
+        "rows_removed",
+        "spill",
+        "children",
+        "exclusive_time",
+        "exclusive_cost",
+    )
+
+    def __init__(self, data: dict[str, Any]):
+        self.node_type: str = data.get("Node Type", "")
+        self.relation_name: str | None = data.get("Relation Name")
+        self.index_name: str | None = data.get("Index Name")
+        self.join_type: str | None = data.get("Join Type")
+        self.strategy: str | None = data.get("Strategy")
+        self.parent_relationship: str | None = data.get("Parent Relationship")
+        self.startup_cost: float = data.get("Startup Cost", 0.0)
+        self.total_cost: float = data.get("Total Cost", 0.0)
+        self.plan_rows: float = data.get("Plan Rows", 0.0)
+        self.actual_rows: float | None = data.get("Actual Rows")
+        self.actual_loops: float = data.get("Actual Loops", 1) or 0
+        self.actual_total_time: float | None = data.get("Actual Total Time")
+        self.rows_removed: float = data.get("Rows Removed by Filter", 0) + data.get("Rows Removed by Join Filter", 0)
+        self.spill = _spill(data)
+        self.children: tuple[PlanNode, ...] = tuple(PlanNode(child) for child in data.get("Plans", ()))
+
+        # Time and cost spent in this node alone, excluding its children
+        self.exclusive_cost = max(0.0, self.total_cost - sum(child.total_cost for child in self.children))
+        self.exclusive_time = max(0.0, self.inclusive_time - sum(child.inclusive_time for child in self.children))
+
+    @property
+    def label(self) -> str:
+        label = self.node_type
+        if self.index_name:
+            label += f" using {self.index_name}"
+        if self.relation_name:
+            label += f" on {self.relation_name}"
+        return label
+
+    @property
+    def analyzed(self) -> bool:
+        return self.actual_rows is not None
+
+    @property
+    def inclusive_time(self) -> float:
+        """Time spent in this node and its children over all loops"""
+        return (self.actual_total_time or 0.0) * self.actual_loops
+
+    @property
+    def total_rows(self) -> float:
+        """Rows returned over all loops, estimated when the plan was not analyzed"""
+        if self.actual_rows is None:
+            return self.plan_rows
+        return self.actual_rows * self.actual_loops
+
+    @property
+    def rows_scanned(self) -> float:
+        """Rows read by the node over all loops, including rows removed by a filter"""
+        if self.actual_rows is None:
+            return self.plan_rows
+        return (self.actual_rows + self.rows_removed) * self.actual_loops
+
+    @property
+    def misestimate(self) -> float:
+        """How many times more (above 1) or fewer (below 1) rows were returned than the planner estimated"""
+        if self.actual_rows is None or not self.actual_loops:
+            return 1.0
+        return max(self.actual_rows, 1) / max(self.plan_rows, 1)
+
+    @property
+    def shape(self) -> tuple:
+        """The operations of this node and its children, regardless of their costs and rows"""
+        return (
+            self.node_type,
+            self.relation_name,
+            self.index_name,
+            self.join_type,
+            self.strategy,
+            tuple(child.shape for child in self.children),
+        )
+
+    def __repr__(self) -> str:
+        return f"PlanNode({self.label})"
+
+
+def _spill(data: dict[str, Any]) -> str | None:
+    """Describes how a sort, hash or aggregate node spilled to disk, if it did"""
+    if data.get("Sort Space Type") == "Disk":
+        return f"sort spilled {data.get('Sort Space Used', 0)}kB to disk"
+    if data.get("Hash Batches", 1) > 1:
+        return f"hash split into {data['Hash Batches']} batches"
+    if data.get("Disk Usage", 0) > 0:
+        return f"{data.get('Node Type', '').lower()} spilled {data['Disk Usage']}kB to disk"
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class PlanFinding:
+    kind: FindingKind
+    node: PlanNode
+    message: str
+
+
+class Plan:
+    """A parsed query plan.
+
+    >>> plan = query.plan(analyze=True)
+    >>> plan.hotspots(3)
+    >>> plan.findings()
+    """
+
+    __slots__ = ("root", "planning_time", "execution_time")
+
+    def __init__(self, root: PlanNode, planning_time: float | None = None, execution_time: float | None = None):
+        self.root = root
+        self.planning_time = planning_time
+        self.execution_time = execution_time
+
+    @property
+    def analyzed(self) -> bool:
+        return self.root.analyzed
+
+    @property
+    def shape_hash(self) -> str:
+        """A hash of the plan shape, which changes when the planner picks different operations"""
+        return hashlib.sha1(repr(self.root.shape).encode()).hexdigest()
+
+    def nodes(self) -> Iterator[PlanNode]:
+        """Every node of the plan, depth first"""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def hotspots(self, n: int = 5) -> list[PlanNode]:
+        """The `n` nodes with the highest exclusive time, or exclusive cost when not analyzed"""
+        if self.analyzed:
+            return sorted(self.nodes(), key=lambda node: node.exclusive_time, reverse=True)[:n]
+        return sorted(self.nodes(), key=lambda node: node.exclusive_cost, reverse=True)[:n]
+
+    def findings(
+        self,
+        misestimate_magnitude: int = 1,
+        large_relation_rows: int = 10_000,
+        nested_loop_outer_rows: int = 1_000,
+    ) -> list[PlanFinding]:
+        """Flags likely causes of a slow plan.
+
+        - misestimate: rows returned differ from the estimate by `misestimate_magnitude` orders of
+          magnitude or more (only for analyzed plans)
+        - seq_scan: a sequential scan reading at least `large_relation_rows` rows
+        - nested_loop: a nested loop whose outer side returns at least `nested_loop_outer_rows` rows
+        """
+        findings = []
+        for node in self.nodes():
+            if node.analyzed and node.actual_loops:
+                magnitude = math.log10(node.misestimate)
+                if abs(magnitude) >= misestimate_magnitude:
+                    direction = "under" if magnitude > 0 else "over"
+                    findings.append(
+                        PlanFinding(
+                            "misestimate",
+                            node,
+                            f"{node.label}: rows {direction}estimated by {abs(magnitude):.1f} orders of magnitude "
+                            f"({node.plan_rows:,.0f} estimated, {node.actual_rows:,.0f} actual)",
+                        )
+                    )
+
+            if node.node_type in ("Seq Scan", "Parallel Seq Scan") and node.rows_scanned >= large_relation_rows:
+                findings.append(
+                    PlanFinding("seq_scan", node, f"{node.label}: sequential scan of {node.rows_scanned:,.0f} rows")
+                )
+
+            if node.node_type == "Nested Loop" and node.children:
+                outer = next((c for c in node.children if c.parent_relationship == "Outer"), node.children[0])
+                if outer.total_rows >= nested_loop_outer_rows:
+                    findings.append(
+                        PlanFinding(
+                            "nested_loop",
+                            node,
+                            f"{node.label}: nested loop over {outer.total_rows:,.0f} outer rows ({outer.label})",
+                        )
+                    )
+        return findings
+
+    def __repr__(self) -> str:
+        return f"Plan({self.root.label})"
+
+
+def parse_plan(data: Any) -> Plan:
+    """Parses the output of `EXPLAIN (FORMAT JSON)`, either as text or as decoded by psycopg"""
+    if isinstance(data, str):
+        data = json.loads(data)
+    if isinstance(data, list):
+        data = data[0]
+    return Plan(
+        root=PlanNode(data["Plan"]),
+        planning_time=data.get("Planning Time"),
+        execution_time=data.get("Execution Time"),
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class PlanChange:
+    kind: ChangeKind
+    message: str
+
+
+def diff_plans(old: Plan, new: Plan, cost_jump: float = 2.0) -> list[PlanChange]:
+    """Compares two plans of the same query.
+
+    Nodes are matched by their position in the plans. Reports nodes whose operation changed (eg. an
+    index scan becoming a sequential scan), total, execution time and per node exclusive costs that
+    grew by a factor of `cost_jump` or more, and sorts or hashes that newly spill to disk.
+    """
+    changes: list[PlanChange] = []
+
+    if _jumped(old.root.total_cost, new.root.total_cost, cost_jump):
+        changes.append(PlanChange("cost", f"Total cost {old.root.total_cost:,.2f} -> {new.root.total_cost:,.2f}"))
+    if old.execution_time and new.execution_time and _jumped(old.execution_time, new.execution_time, cost_jump):
+        changes.append(PlanChange("cost", f"Execution time {old.execution_time:,.3f}ms -> {new.execution_time:,.3f}ms"))
+
+    old_spills = {(node.label, node.spill) for node in old.nodes() if node.spill}
+    for node in new.nodes():
+        if node.spill and (node.label, node.spill) not in old_spills:
+            changes.append(PlanChange("spill", f"{node.label}: {node.spill}"))
+
+    pairs = [(old.root, new.root)]
+    while pairs:
+        old_node, new_node = pairs.pop()
+        if old_node.shape[:5] != new_node.shape[:5]:
+            changes.append(PlanChange("node_type", f"{_describe(old_node)} -> {_describe(new_node)}"))
+        elif _jumped(old_node.exclusive_cost, new_node.exclusive_cost, cost_jump):
+            changes.append(
+                PlanChange(
+                    "cost",
+                    f"{new_node.label}: cost {old_node.exclusive_cost:,.2f} -> {new_node.exclusive_cost:,.2f}",
+                )
+            )
+        if len(old_node.children) != len(new_node.children):
+            # The subtrees can not be matched by position
+            if old_node.shape[:5] == new_node.shape[:5]:
+                changes.append(PlanChange("node_type", f"{_describe(old_node)}: inputs changed"))
+            continue
+        pairs.extend(reversed(list(zip(old_node.children, new_node.children))))
+    return changes
+
+
+def _jumped(old: float, new: float, factor: float) -> bool:
+    return new > 0 and new >= max(old, 0.01) * factor
+
+
+def _describe(node: PlanNode) -> str:
+    label = node.label
+    if node.join_type and node.node_type != "Hash":
+        label = f"{label} ({node.join_type})"
+    if node.strategy:
+        label = f"{label} ({node.strategy})"
+    return label
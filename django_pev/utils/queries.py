@@ -1,7 +1,15 @@
 import dataclasses
+import hashlib
+import re
+import time
+import weakref
+from collections.abc import Iterable
 from datetime import datetime
+from typing import Any
 
-from django.db import DatabaseError, connection
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections, transaction
 
 TIME_DURATION_UNITS = (
     ("week", 60 * 60 * 24 * 7 * 1000),
@@ -113,11 +121,54 @@ class QueryStatInfo:
         return human_time_duration(self.stddev_time)
 
 
+@dataclasses.dataclass(frozen=True)
+class PgStatStatementsCapabilities:
+    """What the pg_stat_statements extension of a database supports, probed once per connection"""
+
+    installed: bool
+    # pg_stat_statements 1.11 (PostgreSQL 17) renamed blk_read_time to shared_blk_read_time
+    blk_read_time_column: str = "blk_read_time"
+
+
+# Keyed by the psycopg connection, so the capabilities are probed again after reconnecting
+_capabilities: "weakref.WeakKeyDictionary[Any, PgStatStatementsCapabilities]" = weakref.WeakKeyDictionary()
+
+
+def get_capabilities(using: str | None = None) -> PgStatStatementsCapabilities:
+    """Returns the pg_stat_statements capabilities of a connection (the default one), in a single round trip.
+
+    The renamed read time column is detected rather than compared by extension version, as
+    ``float('1.11') < float('1.9')`` makes numeric version comparison unreliable.
+    """
+    database = connections[using] if using else connection
+    database.ensure_connection()
+    capabilities = _capabilities.get(database.connection)
+    if capabilities is None:
+        with database.cursor() as cursor:
+            cursor.execute(
+                """
+SELECT
+    EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'),
+    EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'pg_stat_statements' AND column_name = 'shared_blk_read_time'
+    )
+"""
+            )
+            installed, has_shared_blk_read_time = cursor.fetchone()
+        capabilities = PgStatStatementsCapabilities(
+            installed=installed,
+            blk_read_time_column="shared_blk_read_time" if has_shared_blk_read_time else "blk_read_time",
+        )
+        _capabilities[database.connection] = capabilities
+    return capabilities
+
+
 def is_pg_stat_statements_installed() -> bool:
+    if not get_capabilities().installed:
+        return False
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
-            assert cursor.fetchone()
+        with transaction.atomic(), connection.cursor() as cursor:
             cursor.execute("SELECT 1 FROM pg_stat_statements limit 1")
             assert cursor.fetchone()
         return True
@@ -133,45 +184,257 @@ def is_pg_stat_statements_installed() -> bool:
 def enable_pg_stat_statements():
     with connection.cursor() as cursor:
         cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+    _capabilities.pop(connection.connection, None)
 
 
 def reset_pg_stat_statements():
     with connection.cursor() as cursor:
         cursor.execute("SELECT pg_stat_statements_reset()")
+    clear_query_stats_cache()
 
 
 def _shared_blk_read_time_column() -> str:
-    """Return the pg_stat_statements column name for shared block read time.
-
-    pg_stat_statements 1.11 (shipped with PostgreSQL 17) renamed
-    ``blk_read_time`` to ``shared_blk_read_time`` (and ``blk_write_time`` to
-    ``shared_blk_write_time``). To keep supporting both older PostgreSQL
-    (< 17, column ``blk_read_time``) and newer PostgreSQL (>= 17, column
-    ``shared_blk_read_time``), detect which column is actually present rather
-    than relying on the extension version string (``float('1.11') < float('1.9')``
-    makes numeric version comparison unreliable).
+    """Return the pg_stat_statements column name for shared block read time, see `get_capabilities()`"""
+    return get_capabilities().blk_read_time_column
+
+
+def get_query_stats_cache_key() -> str:
+    """Prefix of the cached pages of statements of the current database, see `clear_query_stats_cache()`"""
+    generation = cache.get_or_set(f"DJANGO_PEV:QUERY_STATS:{connection.alias}", time.time_ns, timeout=None)
+    return f"DJANGO_PEV:QUERY_STATS:{connection.alias}:{generation}"
+
+
+def clear_query_stats_cache() -> None:
+    """Drops the cached pages of statements of the current database, by starting a new key prefix"""
+    cache.delete(f"DJANGO_PEV:QUERY_STATS:{connection.alias}")
+
+
+# Columns the statements can be sorted by, descending
+QUERY_STATS_ORDERINGS = {
+    "total_time": "query_stats.total_time",
+    "mean_time": "mean_time",
+    "stddev_time": "stddev_time",
+    "calls": "calls",
+    "rows": "rows",
+    "shared_blks": "shared_blks_hit + shared_blks_dirtied",
+    "blk_read_time": "blk_read_time",
+    "temp_blks_written": "temp_blks_written",
+}
+
+# Length of the text of the statements listed, the full text is read with `get_query_text()`
+QUERY_SNIPPET_LENGTH = 300
+
+
+@dataclasses.dataclass
+class QueryStatsPage:
+    """A page of the statements matching a `search_query_stats()`"""
+
+    queries: list[QueryStatInfo]
+    total: int
+    page: int
+    page_size: int
+    installed: bool = True
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, -(-self.total // self.page_size))
+
+    @property
+    def has_previous(self) -> bool:
+        return self.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.num_pages
+
+
+def search_query_stats(
+    user: str = "",
+    min_calls: int | None = None,
+    table: str = "",
+    search: str = "",
+    order_by: str = "total_time",
+    page: int = 1,
+    page_size: int = 50,
+) -> QueryStatsPage:
+    """Filters, sorts and paginates the statements of the current database in the database.
+
+    - user: the role which ran the statements
+    - min_calls: statements called at least this many times
+    - table: statements mentioning the table (as a whole word)
+    - search: statements containing the text, case insensitively
+    - order_by: one of `QUERY_STATS_ORDERINGS`, descending
+
+    The text of the statements is truncated to `QUERY_SNIPPET_LENGTH` characters. Pages are cached for
+    `DJANGO_PEV_QUERY_STATS_CACHE_TIMEOUT` seconds (10), so the dashboard stays cheap when refreshed by
+    several people at once.
     """
+    if order_by not in QUERY_STATS_ORDERINGS:
+        raise ValueError(f"Can not sort by {order_by}, expected one of {', '.join(QUERY_STATS_ORDERINGS)}")
+    page = max(1, page)
+    filters: list[str] = []
+    params: list[Any] = []
+    if user:
+        filters.append("AND rolname = %s")
+        params.append(user)
+    if min_calls:
+        filters.append("AND calls >= %s")
+        params.append(min_calls)
+    if table:
+        # Word boundaries of postgres regular expressions, table names are matched quoted or not
+        filters.append("AND query ~* %s")
+        params.append(rf"\m{re.escape(table)}\M")
+    if search:
+        filters.append("AND query ILIKE %s")
+        params.append(f"%{_escape_like(search)}%")
+
+    key = _query_stats_page_key(" ".join(filters), params, order_by, page, page_size)
+    result = cache.get(key)
+    if result is None:
+        result = _search_query_stats(" ".join(filters), params, order_by, page, page_size)
+        cache.set(key, result, timeout=getattr(settings, "DJANGO_PEV_QUERY_STATS_CACHE_TIMEOUT", 10))
+    return result
+
+
+def _query_stats_page_key(filters: str, params: list, order_by: str, page: int, page_size: int) -> str:
+    """The cache key of a page of statements, the same params may be bound to different filters"""
+    digest = hashlib.sha1(repr((filters, params, order_by, page, page_size)).encode()).hexdigest()
+    return f"{get_query_stats_cache_key()}:{digest}"
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_query_stats(filters: str, params: list, order_by: str, page: int, page_size: int) -> QueryStatsPage:
+    capabilities = get_capabilities()
+    if not capabilities.installed:
+        return QueryStatsPage(queries=[], total=0, page=page, page_size=page_size, installed=False)
+    sql = _query_stats_sql(
+        capabilities.blk_read_time_column,
+        filters=filters,
+        order_by=QUERY_STATS_ORDERINGS[order_by],
+        text_length=QUERY_SNIPPET_LENGTH,
+    )
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [*params, page_size, (page - 1) * page_size])
+            rows = cursor.fetchall()
+    except DatabaseError:
+        # See is_pg_stat_statements_installed()
+        return QueryStatsPage(queries=[], total=0, page=page, page_size=page_size, installed=False)
+    total = rows[0][-1] if rows else 0
+    return QueryStatsPage(
+        queries=[QueryStatInfo(*row[:-1]) for row in rows], total=total, page=page, page_size=page_size
+    )
+
+
+def get_query_text(query_id: int) -> str | None:
+    """The full text of a statement of the current database, None when it is not in pg_stat_statements"""
     with connection.cursor() as cursor:
         cursor.execute(
-            "SELECT 1 FROM information_schema.columns "
-            "WHERE table_name = 'pg_stat_statements' "
-            "AND column_name = 'shared_blk_read_time'"
+            """
+SELECT query FROM pg_stat_statements
+INNER JOIN pg_database ON pg_database.oid = pg_stat_statements.dbid
+WHERE queryid = %s AND pg_database.datname = current_database()
+LIMIT 1
+""",
+            [query_id],
         )
-        if cursor.fetchone():
-            return "shared_blk_read_time"
-    return "blk_read_time"
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+@dataclasses.dataclass
+class StatementStats:
+    """The statistics of a statement summed over the roles which ran it. Times are in milliseconds"""
+
+    query_id: int
+    calls: int
+    total_time: float
+    # Share of the time spent on all the statements of the database
+    percent_time: float
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    @property
+    def total_time_formatted(self) -> str:
+        return human_time_duration(self.total_time)
+
+    @property
+    def mean_time_formatted(self) -> str:
+        return human_time_duration(self.mean_time)
+
+
+def get_statement_stats(query_ids: Iterable[int], using: str | None = None) -> dict[int, StatementStats]:
+    """The statistics of the statements of a database (the default one) by queryid, in a single query.
+
+    Statements missing from pg_stat_statements (never run, or evicted) are left out, and nothing is
+    returned when pg_stat_statements is not installed.
+    """
+    query_ids = list(query_ids)
+    database = connections[using] if using else connection
+    if not query_ids or not get_capabilities(database.alias).installed:
+        return {}
+    try:
+        with transaction.atomic(using=database.alias), database.cursor() as cursor:
+            cursor.execute(
+                """
+WITH statements AS (
+    SELECT queryid, calls, total_exec_time
+    FROM pg_stat_statements
+    INNER JOIN pg_database ON pg_database.oid = pg_stat_statements.dbid
+    WHERE pg_database.datname = current_database()
+)
+SELECT
+    queryid,
+    SUM(calls),
+    SUM(total_exec_time),
+    SUM(total_exec_time) * 100.0 / NULLIF((SELECT SUM(total_exec_time) FROM statements), 0)
+FROM statements
+WHERE queryid = ANY(%s)
+GROUP BY queryid
+""",
+                [query_ids],
+            )
+            rows = cursor.fetchall()
+    except DatabaseError:
+        # See is_pg_stat_statements_installed()
+        return {}
+    return {
+        query_id: StatementStats(
+            query_id=query_id, calls=int(calls), total_time=float(total_time), percent_time=float(percent_time or 0)
+        )
+        for query_id, calls, total_time, percent_time in rows
+    }
 
 
 def get_query_stats() -> list[QueryStatInfo]:
-    if not is_pg_stat_statements_installed():
+    """The 100 statements that took the most time in the current database"""
+    capabilities = get_capabilities()
+    if not capabilities.installed:
+        return []
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(_query_stats_sql(capabilities.blk_read_time_column), [100, 0])
+            return [QueryStatInfo(*c[:-1]) for c in cursor.fetchall()]
+    except DatabaseError:
+        # See is_pg_stat_statements_installed()
         return []
 
-    blk_read_time_column = _shared_blk_read_time_column()
 
-    sql = f"""
+def _query_stats_sql(
+    blk_read_time_column: str, filters: str = "", order_by: str = "query_stats.total_time", text_length: int = 10000
+) -> str:
+    """The statistics of the statements of the current database, with the number of statements matching the
+    `filters` as last column. Takes the params of the filters followed by the limit and offset.
+    """
+    return f"""
 WITH query_stats AS (
     SELECT
-        LEFT(query, 10000) AS query,
+        LEFT(query, {int(text_length)}) AS query,
         queryid as query_id,
         md5(query) as query_md5,
         rolname AS user,
@@ -195,6 +458,7 @@ WITH query_stats AS (
         calls > 0
     AND
         pg_database.datname = current_database()
+    {filters}
 ), totals AS (
     SELECT
         SUM(total_exec_time) as total_time,
@@ -226,13 +490,11 @@ SELECT
     (shared_blks_hit + shared_blks_dirtied)::float / total_seconds as shared_blks_per_second,
     rows::float / total_seconds as rows_per_second,
     (shared_blks_hit + shared_blks_dirtied)::float / calls as shared_blks_per_call,
-    rows::float/ calls as rows_per_call
+    rows::float/ calls as rows_per_call,
+    COUNT(*) OVER () AS total_count
 FROM
     query_stats
 CROSS JOIN totals
-ORDER BY query_stats.TOTAL_TIME desc
-LIMIT 100
+ORDER BY {order_by} DESC NULLS LAST, query_id
+LIMIT %s OFFSET %s
 """
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        return list(QueryStatInfo(*c) for c in cursor.fetchall())
@@ -0,0 +1,295 @@
+"""Samples of the pg_stat_statements counters, to measure the load of each statement over a recent window.
+
+pg_stat_statements only keeps cumulative counters since `pg_stat_statements_info.stats_reset`, which
+can be weeks ago. Record samples periodically (`python manage.py pev_sample_query_stats`) and the
+difference between the live counters and a sample gives the load of the window since the sample.
+"""
+
+import dataclasses
+import datetime
+import operator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.utils import timezone
+
+from django_pev.models import QueryStatsSample
+
+from .queries import QUERY_SNIPPET_LENGTH, get_capabilities, human_time_duration
+
+# Windows offered by the queries page
+WINDOWS = {
+    "5m": datetime.timedelta(minutes=5),
+    "1h": datetime.timedelta(hours=1),
+    "24h": datetime.timedelta(days=1),
+    "7d": datetime.timedelta(days=7),
+}
+
+# The counters of each statement by queryid: [calls, total_time, rows, shared_blks_hit, shared_blks_dirtied]
+Counters = dict[str, list[float]]
+
+
+@dataclasses.dataclass
+class LiveCounters:
+    """The cumulative counters of every statement of a database"""
+
+    taken_at: datetime.datetime
+    stats_reset: datetime.datetime | None
+    counters: Counters
+
+
+def read_counters(using: str = DEFAULT_DB_ALIAS) -> LiveCounters | None:
+    """Reads the counters of the statements of the database, None when pg_stat_statements is not installed"""
+    if not get_capabilities(using).installed:
+        return None
+    try:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute("SELECT stats_reset FROM pg_stat_statements_info")
+            (stats_reset,) = cursor.fetchone()
+            cursor.execute(
+                """
+SELECT
+    queryid::text,
+    SUM(calls),
+    SUM(total_exec_time),
+    SUM(rows),
+    SUM(shared_blks_hit),
+    SUM(shared_blks_dirtied)
+FROM
+    pg_stat_statements
+INNER JOIN
+    pg_database ON pg_database.oid = pg_stat_statements.dbid
+WHERE
+    pg_database.datname = current_database()
+AND
+    queryid IS NOT NULL
+GROUP BY queryid
+"""
+            )
+            rows = cursor.fetchall()
+    except DatabaseError:
+        # See queries.is_pg_stat_statements_installed()
+        return None
+    return LiveCounters(
+        taken_at=timezone.now(),
+        stats_reset=stats_reset,
+        counters={row[0]: [float(value) for value in row[1:]] for row in rows},
+    )
+
+
+def record_query_stats_sample(using: str = DEFAULT_DB_ALIAS) -> QueryStatsSample | None:
+    """Stores the current counters of the database, None when pg_stat_statements is not installed"""
+    live = read_counters(using)
+    if live is None:
+        return None
+    return QueryStatsSample.objects.create(db_alias=using, stats_reset=live.stats_reset, counters=live.counters)
+
+
+def prune_query_stats_samples(older_than: datetime.timedelta | None = None) -> int:
+    """Deletes samples older than `DJANGO_PEV_QUERY_STATS_RETENTION_DAYS` (7) days, returns how many"""
+    if older_than is None:
+        older_than = datetime.timedelta(days=getattr(settings, "DJANGO_PEV_QUERY_STATS_RETENTION_DAYS", 7))
+    deleted, _ = QueryStatsSample.objects.filter(created__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+def diff_counters(begin: Counters, end: Counters) -> Counters:
+    """The counters accumulated by each statement between two samples.
+
+    A statement whose counters went down was reset or evicted and recorded again in between, its
+    counters since then are used.
+    """
+    deltas = {}
+    for query_id, end_values in end.items():
+        begin_values = begin.get(query_id)
+        if begin_values is None or any(e < b for e, b in zip(end_values, begin_values)):
+            delta = end_values
+        else:
+            delta = [e - b for e, b in zip(end_values, begin_values)]
+        if delta[0] > 0:
+            deltas[query_id] = delta
+    return deltas
+
+
+@dataclasses.dataclass
+class QueryStatsDelta:
+    """The load of a statement over a window. Times are in milliseconds"""
+
+    query_id: str
+    # Only loaded for the statements shown, see `get_recent_load()`
+    query: str
+    calls: int
+    total_time: float
+    rows: int
+    shared_blks: int
+    seconds: float
+    # Total time of the statement over the window of the same length before, when sampled
+    previous_total_time: float | None = None
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls
+
+    @property
+    def calls_per_second(self) -> float:
+        return self.calls / self.seconds if self.seconds else 0.0
+
+    @property
+    def shared_blks_per_second(self) -> float:
+        return self.shared_blks / self.seconds if self.seconds else 0.0
+
+    @property
+    def rows_per_call(self) -> float:
+        return self.rows / self.calls
+
+    @property
+    def total_time_change(self) -> float:
+        """How much more time the statement took than over the previous window"""
+        return self.total_time - (self.previous_total_time or 0.0)
+
+    @property
+    def total_time_formatted(self) -> str:
+        return human_time_duration(self.total_time)
+
+    @property
+    def mean_time_formatted(self) -> str:
+        return human_time_duration(self.mean_time)
+
+
+@dataclasses.dataclass
+class QueryStatsWindow:
+    """The load of every statement between a sample (`start`) and `end`"""
+
+    start: datetime.datetime
+    end: datetime.datetime
+    deltas: list[QueryStatsDelta]
+    # Whether the window of the same length before this one was sampled, for `movers()`
+    has_previous: bool = False
+
+    @property
+    def seconds(self) -> float:
+        return (self.end - self.start).total_seconds()
+
+    @property
+    def total_time(self) -> float:
+        return sum(delta.total_time for delta in self.deltas)
+
+    def sorted_by(self, metric: str, limit: int | None = 100) -> list[QueryStatsDelta]:
+        """The statements sorted by a `QueryStatsDelta` attribute, eg. `total_time` or `mean_time`"""
+        return sorted(self.deltas, key=operator.attrgetter(metric), reverse=True)[:limit]
+
+    def movers(self, limit: int | None = 20) -> list[QueryStatsDelta]:
+        """The statements whose total time grew the most compared to the previous window"""
+        return [delta for delta in self.sorted_by("total_time_change", limit) if delta.total_time_change > 0]
+
+    def top(self, limit: int = 20) -> "QueryStatsWindow":
+        """A copy of the window with only the `limit` statements which took the most time and the `limit`
+        top movers.
+        """
+        top = {delta.query_id: delta for delta in self.sorted_by("total_time", limit)}
+        if self.has_previous:
+            top.update((delta.query_id, delta) for delta in self.movers(limit))
+        return dataclasses.replace(self, deltas=list(top.values()))
+
+
+def get_query_stats_window(
+    since: datetime.datetime | datetime.timedelta, using: str = DEFAULT_DB_ALIAS
+) -> QueryStatsWindow | None:
+    """The load of every statement since a time (eg. a deploy) or over the last `since`.
+
+    The window starts at the last sample recorded at or before `since` (or the first one after it) and
+    ends now. Returns None when pg_stat_statements is not installed or no sample was recorded.
+    """
+    now = timezone.now()
+    if isinstance(since, datetime.timedelta):
+        since = now - since
+    samples = QueryStatsSample.objects.filter(db_alias=using)
+    begin = samples.filter(created__lte=since).first() or samples.filter(created__gt=since).last()
+    live = read_counters(using) if begin is not None else None
+    if begin is None or live is None:
+        return None
+
+    previous = samples.filter(created__lte=begin.created - (live.taken_at - begin.created)).first()
+    return build_query_stats_window(begin, live, previous)
+
+
+def build_query_stats_window(
+    begin: QueryStatsSample, live: LiveCounters, previous: QueryStatsSample | None = None
+) -> QueryStatsWindow:
+    """The load of every statement between a sample and the live counters, compared to the load between
+    the `previous` sample and `begin` when given.
+    """
+    start = begin.created
+    counters = diff_counters(begin.counters, live.counters)
+    if begin.stats_reset != live.stats_reset:
+        # The counters were reset within the window, they only cover the time since the reset
+        start = live.stats_reset or start
+        counters = diff_counters({}, live.counters)
+
+    previous_counters = None
+    if previous is not None and previous.stats_reset == begin.stats_reset:
+        previous_counters = diff_counters(previous.counters, begin.counters)
+
+    seconds = (live.taken_at - start).total_seconds()
+    deltas = [
+        QueryStatsDelta(
+            query_id=query_id,
+            query="",
+            calls=int(calls),
+            total_time=total_time,
+            rows=int(rows),
+            shared_blks=int(shared_blks_hit + shared_blks_dirtied),
+            seconds=seconds,
+            previous_total_time=(
+                previous_counters.get(query_id, [0.0, 0.0])[1] if previous_counters is not None else None
+            ),
+        )
+        for query_id, (calls, total_time, rows, shared_blks_hit, shared_blks_dirtied) in counters.items()
+    ]
+    return QueryStatsWindow(start=start, end=live.taken_at, deltas=deltas, has_previous=previous_counters is not None)
+
+
+def load_query_texts(deltas: list[QueryStatsDelta], using: str = DEFAULT_DB_ALIAS) -> None:
+    """Sets the text of the statements, truncated to `QUERY_SNIPPET_LENGTH`, in a single query"""
+    if not deltas:
+        return
+    try:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(
+                """
+SELECT DISTINCT ON (queryid) queryid::text, LEFT(query, %s)
+FROM pg_stat_statements
+INNER JOIN pg_database ON pg_database.oid = pg_stat_statements.dbid
+WHERE pg_database.datname = current_database() AND queryid = ANY(%s::bigint[])
+""",
+                [QUERY_SNIPPET_LENGTH, [delta.query_id for delta in deltas]],
+            )
+            texts = dict(cursor.fetchall())
+    except DatabaseError:
+        # See queries.is_pg_stat_statements_installed()
+        return
+    for delta in deltas:
+        delta.query = texts.get(delta.query_id, "")
+
+
+def get_recent_load(
+    since: datetime.datetime | datetime.timedelta, limit: int = 20, using: str = DEFAULT_DB_ALIAS
+) -> QueryStatsWindow | None:
+    """The `limit` statements which took the most time since `since` and the `limit` top movers, with
+    their text, see `get_query_stats_window()`.
+
+    Windows are cached for `DJANGO_PEV_QUERY_STATS_CACHE_TIMEOUT` seconds (10) like the statements of the
+    queries page.
+    """
+    since_key = f"last:{int(since.total_seconds())}" if isinstance(since, datetime.timedelta) else since.isoformat()
+    key = f"DJANGO_PEV:QUERY_STATS_WINDOW:{using}:{since_key}:{limit}"
+    window = cache.get(key)
+    if window is None:
+        window = get_query_stats_window(since, using)
+        if window is None:
+            return None
+        window = window.top(limit)
+        load_query_texts(window.deltas, using)
+        cache.set(key, window, timeout=getattr(settings, "DJANGO_PEV_QUERY_STATS_CACHE_TIMEOUT", 10))
+    return window
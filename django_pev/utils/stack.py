@@ -0,0 +1,103 @@
+import sys
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass
+from types import CodeType
+from typing import Literal
+
+StackCaptureMode = Literal["lazy", "eager", "hash", "off"]
+
+Frames = tuple[tuple[CodeType, int], ...]
+
+
+def default_stack_filter(filename: str) -> bool:
+    """Hide frames belonging to django_pev and the django db layer"""
+    return not ("django_pev" in filename or "django/db" in filename)
+
+
+class CapturedStack:
+    """The call stack of a recorded query.
+
+    Only the code object and line number of each frame are held, source lines are read and
+    formatted the first time `formatted` is accessed. When pickled (eg. into the django cache) the
+    formatted text is stored instead of the frames as code objects can not be pickled.
+    """
+
+    __slots__ = ("frames", "limit", "stack_filter", "call_site", "_formatted")
+
+    def __init__(
+        self,
+        frames: Frames = (),
+        limit: int = 10,
+        stack_filter: Callable[[str], bool] = default_stack_filter,
+        call_site: int = 0,
+        formatted: str | None = None,
+    ):
+        self.frames = frames
+        self.limit = limit
+        self.stack_filter = stack_filter
+        self.call_site = call_site
+        self._formatted = formatted
+
+    @property
+    def formatted(self) -> str:
+        if self._formatted is None:
+            summaries = [
+                traceback.FrameSummary(code.co_filename, lineno, code.co_name)
+                for code, lineno in reversed(self.frames)
+                if self.stack_filter(code.co_filename)
+            ][-self.limit :]
+            self._formatted = "".join(traceback.format_list(summaries))
+            self.frames = ()
+        return self._formatted
+
+    def __str__(self) -> str:
+        return self.formatted
+
+    def __repr__(self) -> str:
+        return f"CapturedStack(call_site={self.call_site})"
+
+    def __reduce__(self) -> tuple:
+        return (_restore_stack, (self.formatted, self.call_site))
+
+
+def _restore_stack(formatted: str, call_site: int) -> CapturedStack:
+    return CapturedStack(call_site=call_site, formatted=formatted)
+
+
+EMPTY_STACK = CapturedStack(formatted="")
+
+
+@dataclass(frozen=True)
+class StackCapture:
+    """How the call stack is captured for each recorded query.
+
+    - lazy: keep (code, line number) per frame and format the stack trace on first access
+    - eager: format the stack trace immediately (slowest, reads source lines for every query)
+    - hash: keep only a hash of the call site chain, the stack trace is empty
+    - off: do not capture the stack
+    """
+
+    mode: StackCaptureMode = "lazy"
+    depth: int = 100
+    limit: int = 10
+    stack_filter: Callable[[str], bool] = default_stack_filter
+
+    def capture(self) -> CapturedStack:
+        if self.mode == "off":
+            return EMPTY_STACK
+
+        frames: list[tuple[CodeType, int]] = []
+        frame = sys._getframe(1)
+        while frame is not None and len(frames) < self.depth:
+            frames.append((frame.f_code, frame.f_lineno))
+            frame = frame.f_back  # type: ignore[assignment]
+        call_site = hash(tuple((id(code), lineno) for code, lineno in frames))
+
+        if self.mode == "hash":
+            return CapturedStack(call_site=call_site, formatted="")
+
+        stack = CapturedStack(tuple(frames), self.limit, self.stack_filter, call_site)
+        if self.mode == "eager":
+            stack.formatted  # noqa: B018
+        return stack
@@ -1,5 +1,4 @@
 import logging
-import uuid
 from contextlib import suppress
 from typing import Any
 
@@ -7,20 +6,33 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.core.cache import cache
-from django.http import HttpRequest, HttpResponseRedirect
+from django.http import HttpRequest, HttpResponseRedirect, JsonResponse
 from django.http.response import HttpResponse as HttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils.module_loading import import_string
 from django.views.generic import FormView, TemplateView
 
-from .utils import ExplainSet, explain, indexes, live_connections, maintenance, queries, space
+from .local_pev import store_local_plan
+from .models import PlanSnapshot
+from .utils import (
+    ExplainSet,
+    explain,
+    indexes,
+    live_connections,
+    maintenance,
+    plan_history,
+    queries,
+    query_history,
+    space,
+)
+from .utils.captured_requests import get_cache_key, get_captured_requests, store_explain_set
+from .utils.plans import diff_plans, parse_plan
 
 logger = logging.getLogger(__name__)
 
-
-def get_cache_key(explainset_id: Any) -> str:
-    return f"DJANGO_PEV:EXPLAIN:{explainset_id}"
+# Fingerprints of the explain page looked up in pg_stat_statements, each costs an EXPLAIN the first time
+STATEMENT_STATS_TOP_N = 50
 
 
 def index(request):
@@ -65,7 +77,7 @@ class IndexesView(BaseView):
 
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         ctx = super().get_context_data(**kwargs)
-        all_indexes = indexes.get_indexes()
+        all_indexes = indexes.get_catalog_snapshot().indexes
         ctx["all_indexes"] = all_indexes
         ctx["unused_indexes"] = sorted(
             [i for i in all_indexes if i.is_unused],
@@ -78,7 +90,7 @@ class IndexesView(BaseView):
             reverse=True,
         )
 
-        ctx.update(indexes.get_index_stats())
+        ctx.update(indexes.get_index_stats(all_indexes))
         return ctx
 
 
@@ -100,15 +112,123 @@ class LiveQueriesView(BaseView):
         return ctx
 
 
+class QueryStatsFilterForm(forms.Form):
+    user = forms.CharField(required=False)
+    min_calls = forms.IntegerField(required=False, min_value=0)
+    table = forms.RegexField(regex=r"^[\w.]*$", required=False)
+    search = forms.CharField(required=False)
+    order_by = forms.ChoiceField(choices=[(o, o) for o in queries.QUERY_STATS_ORDERINGS], required=False)
+    page = forms.IntegerField(required=False, min_value=1)
+    window = forms.ChoiceField(choices=[(w, w) for w in query_history.WINDOWS], required=False)
+    since = forms.DateTimeField(required=False)
+
+
 class QueriesView(BaseView):
     template_name = "django_pev/queries.html"
 
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         ctx = super().get_context_data(**kwargs)
-        ctx["queries"] = queries.get_query_stats()
-        ctx["is_pg_stats_enabled"] = queries.is_pg_stat_statements_installed()
-        ctx["queries_by_io"] = sorted(queries.get_query_stats(), key=lambda i: i.shared_blks_hit, reverse=True)
-        ctx["queries_by_slowest"] = sorted(queries.get_query_stats(), key=lambda i: i.mean_time, reverse=True)
+        form = QueryStatsFilterForm(self.request.GET)
+        filters = form.cleaned_data if form.is_valid() else {}
+        order_by = filters.get("order_by") or "total_time"
+        stats_page = queries.search_query_stats(
+            user=filters.get("user", ""),
+            min_calls=filters.get("min_calls"),
+            table=filters.get("table", ""),
+            search=filters.get("search", ""),
+            order_by=order_by,
+            page=filters.get("page") or 1,
+        )
+        ctx["form"] = form
+        ctx["stats_page"] = stats_page
+        ctx["order_by"] = order_by
+        ctx["orderings"] = [
+            ("total_time", "Total Time"),
+            ("mean_time", "Average Time"),
+            ("calls", "Calls"),
+            ("shared_blks", "Most IO"),
+            ("blk_read_time", "Read Time"),
+            ("temp_blks_written", "Temp Blocks"),
+        ]
+        ctx["snippet_length"] = queries.QUERY_SNIPPET_LENGTH
+        ctx["queries"] = stats_page.queries
+        ctx["is_pg_stat_statements"] = ctx["is_pg_stats_enabled"] = stats_page.installed
+        # Query string of the filters, to paginate and sort with the same filters
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        ctx["filter_params"] = params.urlencode()
+        params.pop("order_by", None)
+        ctx["sort_params"] = params.urlencode()
+
+        ctx["windows"] = query_history.WINDOWS
+        ctx["window_name"] = filters.get("window") or "1h"
+        # The recent load reads the counters of every statement, it is only computed when asked for
+        ctx["show_window"] = "window" in self.request.GET or "since" in self.request.GET
+        if ctx["show_window"] and form.is_valid():
+            window = query_history.get_recent_load(
+                filters.get("since") or query_history.WINDOWS[ctx["window_name"]], limit=20
+            )
+            ctx["window"] = window
+            if window is not None:
+                ctx["window_tables"] = [("Most Time", window.sorted_by("total_time", 20))]
+                if window.has_previous:
+                    # Compared to the window of the same length before
+                    ctx["window_tables"].insert(0, ("Top Movers", window.movers()))
+        return ctx
+
+
+class QueryTextView(BaseView):
+    """The full text of a statement of pg_stat_statements, loaded when a row of the queries page is expanded"""
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        try:
+            query_id = int(request.GET.get("query_id", ""))
+        except ValueError:
+            return JsonResponse({"error": "Invalid query_id"}, status=400)
+        text = queries.get_query_text(query_id)
+        if text is None:
+            return JsonResponse({"error": "Unknown statement"}, status=404)
+        return JsonResponse({"query": text})
+
+
+class CapturedRequestsView(BaseView):
+    """Live requests captured by the ExplainMiddleware"""
+
+    template_name = "django_pev/captured_requests.html"
+
+    def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
+        ctx = super().get_context_data(**kwargs)
+        ctx["captured_requests"] = get_captured_requests()
+        return ctx
+
+
+class PlanHistoryView(BaseView):
+    """Recorded plans per fingerprint, and the changes between two plans of a fingerprint"""
+
+    template_name = "django_pev/plan_history.html"
+
+    def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
+        ctx = super().get_context_data(**kwargs)
+        fingerprint_hash = self.request.GET.get("fingerprint_hash")
+        if not fingerprint_hash:
+            ctx["fingerprints"] = plan_history.get_fingerprints()
+            return ctx
+
+        snapshots = list(PlanSnapshot.objects.filter(fingerprint_hash=fingerprint_hash)[:100])
+        ctx["snapshots"] = snapshots
+        by_id = {str(snapshot.id): snapshot for snapshot in snapshots}
+        new = by_id.get(self.request.GET.get("new", ""))
+        old = by_id.get(self.request.GET.get("old", ""))
+        if new is None and snapshots:
+            new = snapshots[0]
+        if old is None and new is not None:
+            # Compare with the last plan of a different shape, or the one recorded before
+            older = [s for s in snapshots if s.created < new.created]
+            old = next((s for s in older if s.shape_hash != new.shape_hash), older[0] if older else None)
+        ctx["new"] = new
+        ctx["old"] = old
+        if old is not None and new is not None:
+            ctx["changes"] = plan_history.diff_snapshots(old, new)
         return ctx
 
 
@@ -148,7 +268,7 @@ class ExplainView(FormView, BaseView):
             client = TestClient()
             client.force_login(self.request.user)  # type:ignore
 
-            with explain(url=url) as e:
+            with explain(url=url, measure_result_size=True) as e:
                 try:
                     match http_method:
                         case "GET" | "DELETE":
@@ -166,16 +286,20 @@ class ExplainView(FormView, BaseView):
                     logger.error(f"Error fetching {url}")
                     ctx["error"] = str(exc)
             explain_result = e
+            if explain_result.queries:
+                store_explain_set(explain_result)
+        elif self.request.GET.get("explainset_id"):
+            # Browse a stored ExplainSet, eg. one captured from a live request by the ExplainMiddleware
+            explain_result = cache.get(get_cache_key(self.request.GET["explainset_id"]), None)
+            if explain_result:
+                ctx["url"] = explain_result.url
 
         ctx["explain"] = explain_result
-        ctx["nplusones"] = explain_result.nplusones if explain_result else {}
+        ctx["nplusones"] = explain_result.find_nplusones() if explain_result else []
+        ctx["memoization_candidates"] = explain_result.memoization_candidates() if explain_result else []
+        ctx["statement_stats"] = explain_result.statement_stats(top_n=STATEMENT_STATS_TOP_N) if explain_result else {}
 
         if explain_result and explain_result.queries:
-            cache.set(
-                get_cache_key(explain_result.id),
-                explain_result,
-                timeout=getattr(settings, "DJANGO_PEV_CACHE_TIMEOUT", 60 * 60 * 24),
-            )
             ctx["slowest"] = explain_result.slowest
 
         return ctx
@@ -198,26 +322,12 @@ class ExplainVisualize(FormView, BaseView):
 
         assert isinstance(explain_set, ExplainSet)
 
-        query = explain_set.queries[int(form.cleaned_data["query_index"])]
+        query = explain_set.get_query(int(form.cleaned_data["query_index"]))
         is_analyze = bool(form.cleaned_data["analyze"])
-        explain_plan = query.explain(analyze=is_analyze)
-        explain_id = str(uuid.uuid4())
-
-        context = {
-            "explain_id": explain_id,
-            "explain_set": explain_set,
-            "plan": explain_plan,
-            "query": query,
-            "optimization_prompt": query.optimization_prompt(analyze=is_analyze),
-        }
-
-        cache.set(
-            get_cache_key(explain_id),
-            context,
-            timeout=getattr(settings, "DJANGO_PEV_CACHE_TIMEOUT", 60 * 60 * 24),
-        )
+        # Plans looked at from the dashboard are kept in the plan history
+        response = store_local_plan(query, analyze=is_analyze, url=explain_set.url, record=True)
 
-        return HttpResponseRedirect(f"{reverse('django_pev:embedded-pev')}?explain_id={explain_id}")
+        return HttpResponseRedirect(response.url)
 
 
 class EmbeddedPev(BaseView):
@@ -240,8 +350,25 @@ class EmbeddedPev(BaseView):
         explain_context: dict = cache.get(get_cache_key(self.request.GET["explain_id"]))
         ctx["query"] = explain_context["query"].sql
         ctx["plan"] = explain_context["plan"]
-        ctx["url"] = explain_context["explain_set"].url
+        ctx["url"] = explain_context["url"]
+        ctx["title"] = explain_context["title"]
         ctx["duration"] = explain_context["query"].duration
         ctx["ai_prompt"] = explain_context["optimization_prompt"]
+        parsed_plan = explain_context["parsed_plan"]
+        ctx["parsed_plan"] = parsed_plan
+        ctx["hotspots"] = parsed_plan.hotspots()
+        ctx["findings"] = parsed_plan.findings()
+
+        # The last recorded plan of another shape, before this plan when it was recorded
+        snapshot = explain_context["snapshot"]
+        fingerprint_hash = plan_history.fingerprint_hash(explain_context["query"].fingerprint)
+        previous_snapshots = PlanSnapshot.objects.filter(fingerprint_hash=fingerprint_hash)
+        if snapshot is not None:
+            previous_snapshots = previous_snapshots.filter(created__lt=snapshot.created)
+        previous = previous_snapshots.exclude(shape_hash=parsed_plan.shape_hash).first()
+        ctx["snapshot"] = snapshot
+        ctx["fingerprint_hash"] = fingerprint_hash
+        ctx["previous_snapshot"] = previous
+        ctx["plan_changes"] = diff_plans(parse_plan(previous.plan), parsed_plan) if previous else []
 
         return ctx
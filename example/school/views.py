@@ -1 +1,15 @@
-# Create your views here.
+from django.http import HttpRequest, JsonResponse
+
+from .models import Student
+
+
+def students(request: HttpRequest) -> JsonResponse:
+    """Lists students and their subjects, with an N+1 query per student"""
+    return JsonResponse(
+        {
+            "students": [
+                {"name": student.name, "subjects": [subject.name for subject in student.subjects.all()]}
+                for student in Student.objects.all()
+            ]
+        }
+    )
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.humanize",
     "django_pev",
 ]
 
@@ -82,7 +83,16 @@ DATABASES = {
         "USER": "postgres",
         "PORT": 5435,
         "ENGINE": "django.db.backends.postgresql",
-    }
+    },
+    # A read replica of the default database, for multi-database tests
+    "replica": {
+        "NAME": "example",
+        "HOST": "localhost",
+        "USER": "postgres",
+        "PORT": 5435,
+        "ENGINE": "django.db.backends.postgresql",
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
 # Password validation
@@ -125,3 +135,11 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# The benchmarks report their timings through this logger, see `mise run benchmark`
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"tests.test_benchmarks": {"handlers": ["console"], "level": "INFO"}},
+}
@@ -15,8 +15,12 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from example.school import views as school_views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("django-pev/", include(("django_pev.urls", "django_pev"), namespace="django_pev")),
+    path("students/", school_views.students, name="students"),
 ]
@@ -0,0 +1,41 @@
+import io
+import tempfile
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from django_pev.assets import ASSETS, asset_url, is_vendored, missing_assets
+
+
+class TestAssets(SimpleTestCase):
+    def setUp(self):
+        is_vendored.cache_clear()
+        self.addCleanup(is_vendored.cache_clear)
+
+    def test_assets_fall_back_to_their_cdn(self):
+        for name, asset in ASSETS.items():
+            if not is_vendored(name):
+                assert asset_url(name) == asset.cdn_url
+
+    def test_cdn_urls_are_pinned(self):
+        for asset in ASSETS.values():
+            package = asset.cdn_url.removeprefix("https://unpkg.com/").split("/")[0]
+            assert "@" in package, f"{asset.cdn_url} should pin a version"
+
+    @override_settings(DJANGO_PEV_OFFLINE_ASSETS=True)
+    def test_offline_assets_are_served_as_static_files(self):
+        assert asset_url("pev2.js") == "/static/django_pev/vendor/pev2/pev2.umd.js"
+
+    def test_missing_assets_fail_the_build_check(self):
+        with tempfile.TemporaryDirectory() as directory:
+            assert len(missing_assets(Path(directory))) == len(ASSETS)
+            with self.assertRaises(CommandError):
+                call_command("pev_vendor_assets", check=True, output=Path(directory))
+
+            for asset in ASSETS.values():
+                path = Path(directory) / asset.path
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text("")
+            assert missing_assets(Path(directory)) == []
+            call_command("pev_vendor_assets", check=True, output=Path(directory), stdout=io.StringIO())
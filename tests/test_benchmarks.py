@@ -0,0 +1,181 @@
+import functools
+import logging
+import time
+import traceback
+from collections.abc import Callable
+from unittest import mock
+
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase, tag
+
+import sqlglot
+
+from django_pev import explain
+from django_pev.utils import _new_execute, generate_fingerprint, parse_template
+from django_pev.utils.fingerprint import normalize_sql
+from django_pev.utils.indexes import CatalogSnapshot
+from django_pev.utils.stack import CapturedStack, StackCapture
+from example.school.models import Student
+
+logger = logging.getLogger(__name__)
+
+N_QUERIES = 2000
+
+
+def _timeit(fn: Callable[[], None], repeat: int = 3) -> float:
+    """Best wall time of `repeat` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _run_queries() -> None:
+    with connection.cursor() as cursor:
+        for _ in range(N_QUERIES):
+            cursor.execute("SELECT 1")
+
+
+def _extract_stack_capture(self: StackCapture) -> CapturedStack:
+    """The stack capture replaced by the capture modes, formatting `traceback.extract_stack()` per query"""
+    frames = [
+        f for f in traceback.extract_stack(limit=100) if not ("django_pev" in f.filename or "django/db" in f.filename)
+    ]
+    return CapturedStack(formatted="".join(traceback.format_list(frames)))
+
+
+def _run_captured_queries(mode: str) -> None:
+    if mode == "extract_stack":
+        with mock.patch.object(StackCapture, "capture", _extract_stack_capture), explain():
+            _run_queries()
+    else:
+        with explain(stack_capture=mode):  # type: ignore[arg-type]
+            _run_queries()
+
+
+@tag("benchmark")
+class BenchmarkStackCapture(TestCase):
+    """Per query overhead of each stack capture mode, and of the `traceback.extract_stack()` they replaced.
+
+    Run with `python manage.py test tests.test_benchmarks --tag=benchmark`, the timings are logged by the
+    `tests.test_benchmarks` logger. They are not asserted on, as they depend on the machine running them.
+    """
+
+    def test_stack_capture_overhead(self):
+        variants: dict[str, Callable[[], None]] = {"baseline": _run_queries}
+        for mode in ("extract_stack", "eager", "lazy", "hash", "off"):
+            variants[mode] = functools.partial(_run_captured_queries, mode)
+
+        # Rounds interleave the variants so that they are equally affected by the load of the machine
+        timings: dict[str, list[float]] = {name: [] for name in variants}
+        for _ in range(5):
+            for name, run in variants.items():
+                timings[name].append(_timeit(run, repeat=1))
+        baseline = min(timings.pop("baseline"))
+        overhead = {mode: (min(mode_timings) - baseline) / N_QUERIES for mode, mode_timings in timings.items()}
+
+        logger.info(
+            "Stack capture overhead per query (%d queries, baseline %.1fus):\n%s",
+            N_QUERIES,
+            baseline / N_QUERIES * 1e6,
+            "\n".join(f"  {mode:>13}: {seconds * 1e6:8.1f}us" for mode, seconds in overhead.items()),
+        )
+
+
+@tag("benchmark")
+class BenchmarkIdleHook(TestCase):
+    """Per query overhead of the installed execute hook for queries outside of `explain()`"""
+
+    def test_idle_hook_overhead(self):
+        hooked = _timeit(_run_queries, repeat=5)
+
+        CursorWrapper._execute = CursorWrapper._original_execute  # type:ignore
+        try:
+            original = _timeit(_run_queries, repeat=5)
+        finally:
+            CursorWrapper._execute = _new_execute  # type:ignore
+
+        logger.info("Idle hook overhead per query: %.2fus", (hooked - original) / N_QUERIES * 1e6)
+
+
+@tag("benchmark")
+class BenchmarkPostProcessing(TestCase):
+    """Post processing time of a 5,000 query N+1 capture.
+
+    Compares parsing every interpolated query twice with sqlglot (transpiling and fingerprinting) with
+    parsing each distinct template once through the `parse_template` cache.
+    """
+
+    def test_post_processing(self):
+        n_queries = 5000
+
+        def run():
+            with explain() as e:
+                for i in range(n_queries):
+                    list(Student.objects.filter(name=str(i), id__in=[i, i + 1]))
+                block_end = time.perf_counter()
+            for query in e.queries:
+                query.sql  # noqa: B018
+            return e, time.perf_counter() - block_end
+
+        parse_template.cache_clear()
+        e, cached = run()
+        assert e.n_queries == n_queries
+
+        start = time.perf_counter()
+        for query in e.queries:
+            sqlglot.transpile(query.interpolated_sql, read="postgres", pretty=True)
+            sqlglot.parse_one(query.interpolated_sql, read="postgres")
+        parse_every_query = time.perf_counter() - start
+
+        logger.info(
+            "Post processing %d queries:\n  parsing every query twice: %8.1fms\n  cached template parse:     %8.1fms",
+            n_queries,
+            parse_every_query * 1000,
+            cached * 1000,
+        )
+
+
+@tag("benchmark")
+class BenchmarkFingerprint(SimpleTestCase):
+    """Fingerprinting with the tokenizer based normalizer compared with the sqlglot AST"""
+
+    def test_fingerprint(self):
+        queries = [
+            str(Student.objects.filter(name=str(i), id__in=list(range(i % 20 + 1)))[:21].query) for i in range(500)
+        ]
+
+        sqlglot_time = _timeit(lambda: [generate_fingerprint(q) for q in queries], repeat=1)
+        normalize_time = _timeit(lambda: [normalize_sql.__wrapped__(q) for q in queries])
+
+        logger.info(
+            "Fingerprinting %d queries:\n  sqlglot:    %8.1fms\n  normalizer: %8.1fms",
+            len(queries),
+            sqlglot_time * 1000,
+            normalize_time * 1000,
+        )
+
+
+@tag("benchmark")
+class BenchmarkDuplicatedIndexes(SimpleTestCase):
+    """Finding the duplicated indexes of a schema with tens of thousands of indexes"""
+
+    def test_duplicated_indexes(self):
+        from tests.test_indexes import make_index
+
+        n_tables, per_table = 1000, 40
+        all_indexes = [
+            make_index(f"table_{t}", f"index_{t}_{i}", [f"column_{c}" for c in range(i % 8 + 1)])
+            for i in range(per_table)
+            for t in range(n_tables)
+        ]
+
+        elapsed = _timeit(lambda: CatalogSnapshot.from_indexes("default", all_indexes), repeat=1)
+
+        logger.info("Duplicated indexes of %d indexes: %8.1fms", len(all_indexes), elapsed * 1000)
+
+        # Every index but the longest one of each table and the first of the identical longest ones
+        assert sum(1 for index in all_indexes if index.is_duplicated) == n_tables * (per_table - 1)
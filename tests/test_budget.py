@@ -0,0 +1,61 @@
+import warnings
+
+from django.test import TestCase
+
+from django_pev import QueryBudget, explain
+from django_pev.exceptions import QueryBudgetExceeded, QueryBudgetWarning
+from django_pev.testing import QueryBudgetMixin, query_budget
+from example.school.models import Student
+
+
+def list_students(n: int) -> None:
+    for i in range(n):
+        list(Student.objects.filter(name=str(i)))
+
+
+class TestQueryBudget(QueryBudgetMixin, TestCase):
+    def test_within_budget(self):
+        with explain(budget=QueryBudget(max_queries=3, max_db_time=10, max_duplicates=3)) as e:
+            list_students(3)
+
+        assert e.n_queries == 3
+
+    def test_exceeding_max_queries_raises_with_offending_fingerprints(self):
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            with explain(budget=QueryBudget(max_queries=2)):
+                list_students(3)
+
+        report = str(ctx.exception)
+        assert "3 queries (max 2)" in report
+        assert "3x" in report and '"school_student"."name" = $1' in report
+        assert "list_students" in report, "The report should include the stack trace of the offending query"
+
+    def test_exceeding_max_duplicates_warns(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with explain(budget=QueryBudget(max_duplicates=2, action="warn")):
+                list_students(3)
+
+        assert [w.category for w in caught] == [QueryBudgetWarning]
+        assert "executed more than 2 times" in str(caught[0].message)
+
+    def test_exceeding_max_db_time_logs(self):
+        with self.assertLogs("django_pev.utils.budget", level="WARNING"):
+            with explain(budget=QueryBudget(max_db_time=0, action="log")):
+                list_students(1)
+
+    def test_assert_query_budget(self):
+        with self.assertQueryBudget(max_queries=1):
+            list_students(1)
+
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(max_queries=1):
+                list_students(2)
+
+    def test_query_budget_decorator(self):
+        @query_budget(max_duplicates=1)
+        def n_plus_one():
+            list_students(2)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            n_plus_one()
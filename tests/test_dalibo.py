@@ -0,0 +1,137 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase, override_settings
+
+from django_pev import explain
+from django_pev.dalibo import PevResponse, delete_plans, pev_client, upload_sql_plan, upload_sql_plans
+from django_pev.exceptions import PevUploadError
+from example.school.models import Student
+
+
+class StandInPev(BaseHTTPRequestHandler):
+    """A local stand-in for explain.dalibo.com"""
+
+    protocol_version = "HTTP/1.1"
+    plans: dict[str, dict] = {}
+    failures: list[int] = []
+    connections: set[int] = set()
+
+    def handle(self):
+        self.connections.add(id(self.connection))
+        super().handle()
+
+    def respond(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.failures:
+            status = self.failures.pop()
+            if status == 0:
+                # Takes the plan and drops the connection before answering
+                self.plans[str(len(self.plans))] = payload
+                self.close_connection = True
+                return
+            return self.respond(status)
+        plan_id = str(len(self.plans))
+        self.plans[plan_id] = payload
+        self.respond(200, json.dumps({"id": plan_id, "deleteKey": f"key{plan_id}"}).encode())
+
+    def do_GET(self):
+        _, _, plan_id, delete_key = self.path.split("/")
+        if delete_key != f"key{plan_id}" or self.plans.pop(plan_id, None) is None:
+            return self.respond(404)
+        self.respond(200)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPevUpload(SimpleTestCase):
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInPev)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.pev_url = f"http://127.0.0.1:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StandInPev.plans.clear()
+        StandInPev.failures.clear()
+        StandInPev.connections.clear()
+        pev_client.close()
+        self.addCleanup(pev_client.close)
+        settings = override_settings(DJANGO_PEV_PEV_URL=self.pev_url, DJANGO_PEV_UPLOAD_TIMEOUT=5)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_upload_and_delete_plan(self):
+        response = upload_sql_plan("SELECT 1", [{"Plan": {}}], "A title")
+
+        assert response.url == f"{self.pev_url}plan/0"
+        assert StandInPev.plans["0"]["title"] == "A title"
+        response.delete()
+        assert StandInPev.plans == {}
+        assert len(StandInPev.connections) == 1, "The connection should be kept alive between requests"
+
+    def test_upload_is_retried(self):
+        StandInPev.failures.append(503)
+
+        upload_sql_plan("", [], "")
+        assert len(StandInPev.plans) == 1
+
+    def test_uploads_are_not_retried_once_sent(self):
+        for status in (0, 502):
+            StandInPev.failures.append(status)
+            with self.assertRaises(PevUploadError):
+                upload_sql_plan("", [], "")
+        assert len(StandInPev.plans) == 1, "The plan taken before the connection dropped is not uploaded again"
+
+    @override_settings(DJANGO_PEV_UPLOAD_RETRIES=0)
+    def test_failed_upload_raises(self):
+        StandInPev.failures.append(503)
+
+        with self.assertRaises(PevUploadError):
+            upload_sql_plan("", [], "")
+
+    def test_deleting_an_unknown_plan_raises(self):
+        with self.assertRaises(PevUploadError):
+            PevResponse(id="1", delete_key="nope", pev_url=self.pev_url.rstrip("/")).delete()
+
+    @override_settings(DJANGO_PEV_UPLOAD_RETRIES=0)
+    def test_upload_plans_concurrently(self):
+        StandInPev.failures.append(400)
+
+        with self.assertLogs("django_pev.dalibo", "WARNING"):
+            responses = upload_sql_plans([("", [], f"plan {i}") for i in range(10)], workers=4)
+
+        assert len(responses) == 10
+        assert sum(isinstance(response, PevUploadError) for response in responses) == 1
+        assert len(StandInPev.plans) == 9
+
+        delete_plans([response for response in responses if isinstance(response, PevResponse)])
+        assert StandInPev.plans == {}
+
+    def test_visualize_uploads_each_query(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+            list(Student.objects.filter(name="b"))
+        first, second = (query.visualize(upload_query=True, analyze=False, local=False) for query in e.queries)
+
+        assert first.url != second.url, "Queries of the same fingerprint are uploaded with their own SQL"
+        assert "'b'" in StandInPev.plans[second.id]["query"]
+        first.delete()
+        assert e.queries[0].visualize(analyze=False, local=False).url != first.url, "Deleted plans are not reused"
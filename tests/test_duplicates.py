@@ -0,0 +1,76 @@
+from django.test import TestCase
+
+from django_pev import explain
+from django_pev.utils.duplicates import classify_statement
+from example.school.models import Student, Subject, Teacher
+
+
+class TestDuplicates(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Teacher.objects.create(name="Teacher")
+        Subject.objects.create(name="Maths", teacher=cls.teacher)
+
+    def test_identical_queries_are_duplicates(self):
+        with explain() as e:
+            for _ in range(3):
+                Teacher.objects.get(id=self.teacher.id)
+            Teacher.objects.filter(name="other").first()
+
+        (duplicate,) = e.duplicates()
+        assert duplicate.count == 3
+        assert duplicate.duplicates == 2
+        assert duplicate.tables == {"school_teacher"}
+        assert 0 < duplicate.wasted_duration < duplicate.total_duration
+
+    def test_different_params_are_not_duplicates(self):
+        with explain() as e:
+            Teacher.objects.filter(id=self.teacher.id).first()
+            Teacher.objects.filter(id=self.teacher.id + 1).first()
+
+        assert e.duplicates() == []
+
+    def test_writes_invalidate_reads_of_their_tables(self):
+        with explain() as e:
+            Teacher.objects.get(id=self.teacher.id)
+            list(Subject.objects.all())
+            Teacher.objects.filter(id=self.teacher.id).update(name="Renamed")
+            Teacher.objects.get(id=self.teacher.id)
+            list(Subject.objects.all())
+
+        (duplicate,) = e.duplicates()
+        assert duplicate.tables == {"school_subject"}
+        assert duplicate.duplicates == 1
+
+    def test_memoization_candidates_group_by_fingerprint(self):
+        other = Teacher.objects.create(name="Other")
+        with explain() as e:
+            for _ in range(2):
+                Teacher.objects.get(id=self.teacher.id)
+                Teacher.objects.get(id=other.id)
+            list(Student.objects.all())
+
+        (candidate,) = e.memoization_candidates()
+        assert candidate.duplicates == 2
+        assert len(candidate.queries) == 2
+
+    def test_classify_statement(self):
+        assert classify_statement('SELECT * FROM "t" WHERE "id" = $1') == ("read", {"t"})
+        assert classify_statement('SELECT * FROM "t" FOR UPDATE')[0] == "ignore"
+        assert classify_statement("SELECT nextval($1)")[0] == "ignore"
+        assert classify_statement('UPDATE "t" SET "a" = $1') == ("write", {"t"})
+        assert classify_statement('SAVEPOINT "s1"')[0] == "ignore"
+        assert classify_statement('RELEASE SAVEPOINT "s1"')[0] == "ignore"
+        assert classify_statement('ROLLBACK TO SAVEPOINT "s1"') == ("write", None)
+
+    def test_volatile_functions_are_not_memoizable(self):
+        assert classify_statement('SELECT * FROM "t" ORDER BY RANDOM() LIMIT $1')[0] == "ignore"
+        assert classify_statement("SELECT random()")[0] == "ignore"
+        assert classify_statement("SELECT gen_random_uuid()")[0] == "ignore"
+        assert classify_statement('SELECT * FROM "t" WHERE "created" < now()')[0] == "ignore"
+        assert classify_statement('SELECT lower("name") FROM "t"') == ("read", {"t"})
+
+        with explain() as e:
+            for _ in range(2):
+                list(Student.objects.order_by("?")[:1])
+        assert e.duplicates() == []
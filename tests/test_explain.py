@@ -1,8 +1,17 @@
-from django.db import connection
-from django.test import TestCase, tag
+import pickle
+import threading
+
+import sqlglot
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, override_settings, tag
 from time import sleep
 
 from django_pev import explain
+from django_pev.local_pev import LocalPevResponse
+from django_pev.models import PlanSnapshot
+from django_pev.utils import parse_template
 from example.school.models import Student, Subject, Teacher
 
 
@@ -35,6 +44,39 @@ class TestExplain(TestCase):
 
         assert "'lol'" in e.queries[0].sql, "Query params should be interpolated into the captured SQL"
 
+    def test_interpolation_is_deferred(self):
+        with explain() as e:
+            list(Student.objects.filter(name="lol"))
+
+        query = e.queries[0]
+        assert "sql" not in query.__dict__, "Params should only be interpolated when the sql is read"
+        assert query.params == ("lol",)
+        assert "'lol'" in query.sql
+
+    def test_sql_is_pretty_printed_from_the_cached_template(self):
+        with explain() as e:
+            list(Student.objects.filter(name="lol", id__in=[1, 2]))
+
+        query = e.queries[0]
+        assert query.sql == sqlglot.transpile(query.interpolated_sql, read="postgres", pretty=True)[0]
+
+    def test_reordered_placeholders_are_not_bound_to_the_template(self):
+        with explain() as e:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id FROM school_student OFFSET %s LIMIT %s", [5, 1])
+
+        query = e.queries[0]
+        assert not parse_template(query.raw_sql).can_interpolate(query.params), "sqlglot prints LIMIT before OFFSET"
+        assert "LIMIT 1" in query.sql and "OFFSET 5" in query.sql
+
+    def test_interpolation_can_be_disabled(self):
+        with explain(interpolate=False) as e:
+            list(Student.objects.filter(name="lol"))
+
+        assert "'lol'" not in e.queries[0].sql
+        assert "%s" in e.queries[0].sql
+        assert e.queries[0].explain(analyze=False), "Explaining should still bind the params"
+
     def test_executemany_is_captured(self):
         with explain() as e:
             with connection.cursor() as cursor:
@@ -48,6 +90,144 @@ class TestExplain(TestCase):
         assert e.n_queries == 2, "Both the executemany and the following query should be captured"
         assert "%s" in e.queries[0].sql, "Batch queries stay parameterised as mogrify cannot bind a batch"
 
+    def test_max_queries_keeps_exact_counts(self):
+        with explain(max_queries=5) as e:
+            for i in range(20):
+                list(Student.objects.filter(name=str(i)))
+            list(Student.objects.raw("select school_student.*, pg_sleep(0.01) from school_student"))
+
+        assert len(e.queries) == 5, "Only the most recent queries should be retained"
+        assert e.queries[-1].index == 20
+        assert e.n_queries == 21
+        assert list(e.nplusones.values()) == [20]
+        assert "PG_SLEEP" in e.slowest.sql
+
+    def test_sampled_out_queries_are_counted(self):
+        with explain(sample_rate=0) as e:
+            for i in range(5):
+                list(Student.objects.filter(name=str(i)))
+
+        assert e.queries == []
+        assert e.n_queries == 5
+        assert list(e.nplusones.values()) == [5]
+        assert e.get_query(e.slowest.index) == e.slowest
+
+    def test_nested_explain_blocks(self):
+        with explain() as outer:
+            list(Student.objects.filter(name="outer"))
+            with explain() as inner:
+                list(Student.objects.filter(name="inner"))
+
+        assert inner.n_queries == 1
+        assert outer.n_queries == 2, "Outer blocks should also capture queries of nested blocks"
+
+    def test_other_threads_are_not_captured(self):
+        barrier = threading.Barrier(2)
+        thread_results = {}
+
+        def run_in_thread():
+            with explain() as e:
+                barrier.wait()
+                for _ in range(3):
+                    list(Student.objects.filter(name="thread"))
+                barrier.wait()
+            thread_results["explain"] = e
+            connections.close_all()
+
+        thread = threading.Thread(target=run_in_thread)
+        thread.start()
+        with explain() as e:
+            barrier.wait()
+            list(Student.objects.filter(name="main"))
+            barrier.wait()
+        thread.join()
+
+        assert e.n_queries == 1, "Queries from a concurrent explain in another thread should not be captured"
+        assert thread_results["explain"].n_queries == 3
+
+    def test_sync_to_async_queries_are_captured(self):
+        def query_in_executor_thread():
+            try:
+                return list(Student.objects.filter(name="async"))
+            finally:
+                connections.close_all()
+
+        async def view():
+            return await sync_to_async(query_in_executor_thread, thread_sensitive=False)()
+
+        with explain() as e:
+            async_to_sync(view)()
+
+        assert e.n_queries == 1, "Queries made from sync_to_async threads should be captured"
+
+    def test_parallel_post_processing(self):
+        def run_queries():
+            for i in range(5):
+                list(Student.objects.filter(name=str(i))[: i + 1])
+
+        with explain() as in_process:
+            run_queries()
+        with explain(workers=2, parallel_threshold=1) as parallel:
+            run_queries()
+
+        assert all(q.template for q in parallel.queries), "Templates should be parsed by the worker processes"
+        assert [q.sql for q in parallel.queries] == [q.sql for q in in_process.queries]
+        assert [q.fingerprint for q in parallel.queries] == [q.fingerprint for q in in_process.queries]
+
+    def test_fetch_time_rows_and_bytes_are_recorded(self):
+        with explain(measure_result_size=True) as e:
+            list(Student.objects.all())
+            Student.objects.filter(name="a").update(name="b")
+
+        select, update = e.queries
+        assert select.rows == 10, "Fetched rows should be counted"
+        assert select.bytes_received > 0
+        assert select.fetch_time > 0
+        self.assertAlmostEqual(select.duration, select.execute_time + select.fetch_time)
+        assert update.rows == 10, "Statements without a result should count the affected rows"
+        assert update.fetch_time == 0
+
+    def test_server_side_cursor_fetches_are_recorded(self):
+        with explain(measure_result_size=True) as e:
+            list(Student.objects.iterator(chunk_size=3))
+
+        [query] = [q for q in e.queries if "school_student" in q.raw_sql]
+        assert query.rows == 10, "Rows of every chunk should be counted"
+        assert query.bytes_received > 0
+
+    def test_result_size_is_opt_in(self):
+        with explain(measure_result_size=True) as measured, explain() as e:
+            list(Student.objects.all())
+            list(Student.objects.iterator(chunk_size=3))
+
+        assert all(q.bytes_received == 0 for q in e.queries)
+        assert e.alias_stats["default"].total_bytes_received == 0
+        assert all(q.bytes_received > 0 for q in measured.queries if "school_student" in q.raw_sql)
+
+    def test_fetches_of_uncaptured_queries_are_not_recorded(self):
+        with connection.cursor() as cursor:
+            with explain() as e:
+                cursor.execute("SELECT 1")
+            cursor.execute("SELECT * FROM generate_series(1, 100)")
+            with explain() as after:
+                cursor.fetchall()
+
+        assert e.queries[0].rows == 0
+        assert after.n_queries == 0
+
+    def test_heaviest_ranks_fingerprints_by_total_cost(self):
+        with explain() as e:
+            list(Student.objects.raw("select school_student.*, pg_sleep(0.01) from school_student limit 1"))
+            for i in range(5):
+                list(
+                    Student.objects.raw(
+                        "select school_student.*, pg_sleep(0.01) from school_student where id = %s", [i]
+                    )
+                )
+
+        assert e.heaviest.count == 5
+        assert e.heaviest.total_duration > e.slowest.duration
+
     def test_upload_plan_to_dalibo(self):
         # We can upload results to dalibo
         with explain() as e:
@@ -59,6 +239,32 @@ class TestExplain(TestCase):
         # We can delete the results
         pev_result.delete()
 
+    def test_visualize_locally(self):
+        with explain() as e:
+            list(Student.objects.filter(name="1"))
+
+        # The plan is rendered by the embedded PEV page rather than uploaded
+        pev_result = e.slowest.visualize(title="Some test query", local=True)
+        assert isinstance(pev_result, LocalPevResponse)
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        response = self.client.get(pev_result.url)
+        assert response.status_code == 200
+        assert b"Some test query" in response.content
+        assert not PlanSnapshot.objects.exists(), "Viewing a plan does not record it"
+
+        pev_result.delete()
+        assert self.client.get(pev_result.url).status_code == 302, "Deleted plans redirect to the explain page"
+
+    @override_settings(DJANGO_PEV_LOCAL_VISUALIZE=True, DJANGO_PEV_BASE_URL="https://example.com/")
+    def test_visualize_locally_by_default(self):
+        with explain() as e:
+            list(Student.objects.filter(name="1"))
+
+        pev_result = e.slowest.visualize(analyze=False)
+        assert isinstance(pev_result, LocalPevResponse)
+        assert pev_result.url.startswith("https://example.com/django-pev/embedded-pev")
+
     @tag("browser")
     def test_open_visualization_in_browser(self):
         # We can upload results to dalibo
@@ -77,6 +283,15 @@ class TestExplain(TestCase):
 
         e.slowest.optimization_prompt(analyze=True)
 
+    def test_optimization_prompt_embeds_its_own_query(self):
+        with explain() as e:
+            list(Student.objects.filter(name="first name"))
+            list(Student.objects.filter(name="second name"))
+
+        first, second = (query.optimization_prompt(analyze=False) for query in e.queries)
+        assert "first name" in first and "second name" not in first
+        assert "second name" in second, "The prompt is not shared by the queries of a fingerprint"
+
     def test_savepoint_parsing_error_handling(self):
         """Test that SAVEPOINT queries that can't be parsed by sqlglot are handled gracefully"""
         with explain() as e:
@@ -88,4 +303,115 @@ class TestExplain(TestCase):
                 # SQL GLOT can't parse
                 cursor.execute("RELEASE SAVEPOINT test_savepoint")
 
-        self.assertEqual(len(e.queries), 1)
+                cursor.execute("SAVEPOINT other_savepoint")
+                cursor.execute("RELEASE SAVEPOINT other_savepoint")
+
+        self.assertEqual(len(e.queries), 4)
+        self.assertEqual(e.queries[1].sql, "RELEASE SAVEPOINT test_savepoint")
+        self.assertEqual(e.queries[0].fingerprint, "SAVEPOINT $1")
+        self.assertEqual(e.queries[1].fingerprint, "RELEASE SAVEPOINT $1")
+        self.assertEqual(e.queries[3].fingerprint, e.queries[1].fingerprint, "Savepoint names are constants")
+
+    def test_fingerprint_matches_pg_stat_statements_normalization(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a", id__in=[1, 2, 3])[:5])
+            list(Student.objects.filter(name="b", id__in=[4, 5])[:5])
+
+        assert e.queries[0].fingerprint == e.queries[1].fingerprint
+        assert '"school_student"."id" IN ($1 /*, ... */)' in e.queries[0].fingerprint
+        assert '"school_student"."name" = $2' in e.queries[0].fingerprint
+        assert e.queries[0].fingerprint.endswith("LIMIT $3")
+
+    def test_stack_trace_is_formatted_lazily(self):
+        with explain() as e:
+            list(Student.objects.filter(name="lol"))
+
+        stack = e.queries[0].stack
+        assert stack.frames, "Only raw frames should be held until the stack trace is read"
+        assert "test_stack_trace_is_formatted_lazily" in e.queries[0].stack_trace
+        assert "django_pev" not in e.queries[0].stack_trace, "Internal frames should be filtered out"
+
+        restored = pickle.loads(pickle.dumps(e))
+        assert restored.queries[0].stack_trace == e.queries[0].stack_trace
+        assert restored.queries[0].call_site == e.queries[0].call_site
+
+    def test_stack_capture_hash_mode(self):
+        with explain(stack_capture="hash") as e:
+            for _ in range(2):
+                list(Student.objects.filter(name="lol"))
+            list(Student.objects.filter(name="lol"))
+
+        assert e.queries[0].stack_trace == ""
+        assert e.queries[0].call_site == e.queries[1].call_site, "The same loop should share a call site"
+        assert e.queries[0].call_site != e.queries[2].call_site
+
+
+class TestMultiDatabaseExplain(TestCase):
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpTestData(cls):
+        Student.objects.create(name="a")
+
+    def test_queries_record_the_alias_they_ran_on(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+            list(Student.objects.using("replica").filter(name="a"))
+            list(Student.objects.using("replica").filter(name="b"))
+
+        assert [q.db_alias for q in e.queries] == ["default", "replica", "replica"]
+        assert e.alias_stats["default"].count == 1
+        assert e.alias_stats["replica"].count == 2
+        assert e.alias_stats["default"].total_rows == 1
+        assert "'b'" in e.queries[2].sql
+        assert e.queries[2].explain(analyze=False)
+
+    def test_db_alias_only_captures_its_queries(self):
+        with explain(db_alias="replica") as e:
+            list(Student.objects.filter(name="a"))
+            list(Student.objects.using("replica").filter(name="a"))
+
+        assert e.n_queries == 1
+        assert e.queries[0].db_alias == "replica"
+        assert list(e.alias_stats) == ["replica"]
+
+
+class TestExplainAll(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Student.objects.create(name="a")
+
+    def test_explain_all_explains_each_fingerprint_once(self):
+        with explain() as e:
+            for i in range(5):
+                list(Student.objects.filter(name=str(i)))
+            list(Teacher.objects.all())
+
+        results = e.explain_all(analyze=False)
+
+        assert [r.count for r in results] == [5, 1], "Fingerprints should be ranked by their total time"
+        assert all(r.plan and not r.error for r in results)
+        assert "school_student" in results[0].plan
+        assert len(e.explain_all(top_n=1)) == 1
+        assert len(e.explain_all(analyze=False, dedupe_by_fingerprint=False)) == 6
+
+    def test_explain_all_applies_a_statement_timeout(self):
+        with explain() as e:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(0.01)")
+
+        [result] = e.explain_all(analyze=True, statement_timeout=0.001)
+
+        assert "statement timeout" in result.error
+        assert result.plan == ""
+
+    def test_explain_all_rolls_back_analyzed_statements(self):
+        with explain() as e:
+            Student.objects.create(name="explain_all")
+
+        [result] = e.explain_all(analyze=True)
+
+        assert "Insert on" in result.plan
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM school_student WHERE name = 'explain_all'")
+            assert cursor.fetchone()[0] == 1
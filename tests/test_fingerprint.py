@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from django_pev.utils.fingerprint import normalize_sql
+
+
+class TestNormalizeSql(SimpleTestCase):
+    def test_constants_and_placeholders_are_numbered(self):
+        self.assertEqual(
+            normalize_sql("SELECT 'a''b', E'c\\'d', $$e$$, 1.5e3, -1, x - 2 FROM t WHERE y = %s::jsonb"),
+            "SELECT $1, $2, $3, $4, $5, x - $6 FROM t WHERE y = $7::jsonb",
+        )
+
+    def test_identifiers_comments_and_operators_are_kept(self):
+        self.assertEqual(
+            normalize_sql('SELECT "t1"."c 2" FROM t1 -- note 1\nWHERE data ? %s /* 3 */'),
+            'SELECT "t1"."c 2" FROM t1 -- note 1\nWHERE data ? $1 /* 3 */',
+        )
+
+    def test_in_lists_are_squashed(self):
+        self.assertEqual(
+            normalize_sql("SELECT 1 FROM t WHERE a IN (%s, %s, %s) AND b IN (%s) AND c IN (SELECT 2)"),
+            "SELECT $1 FROM t WHERE a IN ($2 /*, ... */) AND b IN ($3) AND c IN (SELECT $4)",
+        )
+
+    def test_values_batches_are_squashed(self):
+        self.assertEqual(
+            normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s) RETURNING "t"."id"'),
+            'INSERT INTO "t" ("a", "b") VALUES ($1, $2) /*, ... */ RETURNING "t"."id"',
+        )
+        self.assertEqual(
+            normalize_sql('INSERT INTO "t" ("a") VALUES (%s)'),
+            normalize_sql('INSERT INTO "t" ("a") VALUES (%s), (%s), (%s)').replace(" /*, ... */", ""),
+        )
+        self.assertEqual(
+            normalize_sql('INSERT INTO "t" ("a") VALUES (%s), (%s)'),
+            normalize_sql('INSERT INTO "t" ("a") VALUES (%s), (%s), (%s)'),
+        )
+
+    def test_percent_escapes(self):
+        self.assertEqual(normalize_sql("SELECT a %% 2 FROM t WHERE b = %s"), "SELECT a % $1 FROM t WHERE b = $2")
+        self.assertEqual(normalize_sql("SELECT a %% 2", unescape_percent=False), "SELECT a %% $1")
+
+    def test_placeholders_without_spaces(self):
+        self.assertEqual(normalize_sql("SELECT a FROM t WHERE a=%s"), "SELECT a FROM t WHERE a=$1")
+        self.assertEqual(
+            normalize_sql("SELECT a+%s FROM t WHERE a<>%s AND b=-%s AND c=%(c)s AND d=-1 AND e=%s"),
+            "SELECT a+$1 FROM t WHERE a<>$2 AND b=-$3 AND c=$4 AND d=$5 AND e=$6",
+        )
+        self.assertEqual(normalize_sql("SELECT a->>%s, a%%%s FROM t"), "SELECT a->>$1, a%$2 FROM t")
+
+    def test_savepoint_names(self):
+        self.assertEqual(normalize_sql('SAVEPOINT "s139_x2"'), "SAVEPOINT $1")
+        self.assertEqual(normalize_sql('RELEASE SAVEPOINT "s139_x2"'), "RELEASE SAVEPOINT $1")
+        self.assertEqual(normalize_sql("RELEASE s1"), "RELEASE $1")
+        self.assertEqual(normalize_sql('ROLLBACK TO SAVEPOINT "s139_x2"'), "ROLLBACK TO SAVEPOINT $1")
+        self.assertEqual(normalize_sql("ROLLBACK TRANSACTION TO s1"), "ROLLBACK TRANSACTION TO $1")
+        self.assertEqual(normalize_sql("SELECT savepoint FROM t"), "SELECT savepoint FROM t")
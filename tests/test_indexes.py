@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from django_pev import explain
+from django_pev.utils import indexes
+from django_pev.utils.indexes import CatalogSnapshot, IndexInfo
+
+
+def make_index(table: str, name: str, columns: list[str], **kwargs) -> IndexInfo:
+    defaults = dict(
+        schema="public",
+        table=table,
+        name=name,
+        columns=columns,
+        using="btree",
+        unique=False,
+        primary=False,
+        valid=True,
+        indexprs=None,
+        indpred=None,
+        definition=f"CREATE INDEX {name} ON {table} ({', '.join(columns)})",
+        hit_rate=Decimal(1),
+        index_scans=100,
+        size_bytes=8192,
+        covered_by=None,
+    )
+    return IndexInfo(**{**defaults, **kwargs})
+
+
+class TestDuplicatedIndexes(SimpleTestCase):
+    def test_tables_need_not_be_contiguous(self):
+        wide = make_index("student", "student_name_age", ["name", "age"])
+        narrow = make_index("student", "student_name", ["name"])
+        other = make_index("teacher", "teacher_name", ["name"])
+        snapshot = CatalogSnapshot.from_indexes("default", [wide, other, narrow])
+
+        assert narrow.covered_by is wide
+        assert wide.covered_by is None
+        assert other.covered_by is None
+        assert snapshot.duplicated_indexes == [narrow]
+        assert snapshot.table_indexes("student") == [wide, narrow]
+
+    def test_identical_indexes_keep_one(self):
+        first = make_index("student", "a_name", ["name"])
+        second = make_index("student", "b_name", ["name"])
+        unique = make_index("student", "c_name", ["name"], unique=True)
+        CatalogSnapshot.from_indexes("default", [second, first])
+        assert first.covered_by is None
+        assert second.covered_by is first
+
+        first.covered_by = second.covered_by = None
+        CatalogSnapshot.from_indexes("default", [second, first, unique])
+        assert first.covered_by is unique
+        assert second.covered_by is unique
+        assert unique.covered_by is None
+
+    def test_indexes_must_match(self):
+        btree = make_index("student", "student_name_btree", ["name", "age"])
+        candidates = [
+            make_index("student", "student_name_hash", ["name"], using="hash"),
+            make_index("student", "student_name_partial", ["name"], indpred="(age > 18)"),
+            make_index("student", "student_age", ["age"]),
+            make_index("student", "student_name_invalid", ["name", "age", "id"], valid=False),
+        ]
+        CatalogSnapshot.from_indexes("default", [btree, *candidates])
+        assert all(index.covered_by is None for index in candidates)
+        assert candidates[3].covered_by is None
+
+    def test_indexes_with_prefix(self):
+        wide = make_index("student", "student_name_age", ["name", "age"])
+        narrow = make_index("student", "student_name", ["name"])
+        age = make_index("student", "student_age", ["age"])
+        snapshot = CatalogSnapshot.from_indexes("default", [wide, narrow, age])
+
+        assert {i.name for i in snapshot.indexes_with_prefix("student", ["name"])} == {wide.name, narrow.name}
+        assert snapshot.indexes_with_prefix("student", ["name", "age"]) == [wide]
+        assert snapshot.indexes_with_prefix("student", ["id"]) == []
+        assert snapshot.indexes_with_prefix("teacher", ["name"]) == []
+
+
+class TestCatalogSnapshot(TestCase):
+    def test_snapshot_is_cached(self):
+        snapshot = indexes.get_catalog_snapshot(use_cache=False)
+        assert snapshot.indexes
+        with explain() as e:
+            assert indexes.get_catalog_snapshot() is snapshot
+        assert e.n_queries == 0
+
+    def test_indexes_view_loads_indexes_once(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        indexes._snapshots.clear()
+        with explain(db_alias="default") as e:
+            response = self.client.get("/django-pev/indexes")
+        assert response.status_code == 200
+        lookups = [q for q in e.queries if q.raw_sql == indexes._index_lookup_sql()]
+        assert len(lookups) == 1
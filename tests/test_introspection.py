@@ -0,0 +1,48 @@
+from django.test import TestCase
+
+from django_pev import explain
+from django_pev.utils import introspection
+from django_pev.utils.plan_cache import plan_cache
+from example.school.models import Student, Subject, Teacher
+
+
+class TestIntrospection(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+        self.addCleanup(plan_cache.clear)
+
+    def test_get_tables_in_one_round_trip(self):
+        names = [model._meta.db_table for model in (Student, Subject, Teacher)]
+        with explain() as e:
+            tables = introspection.get_tables([("public", name) for name in names] + [("public", "cte")])
+        lookups = [q for q in e.queries if "pg_attribute" in q.raw_sql]
+        assert len(lookups) == 1
+        assert sorted(name for _, name in tables) == sorted(names)
+
+        subject = tables[("public", Subject._meta.db_table)]
+        assert [c.name for c in subject.columns] == ["id", "name", "teacher_id"]
+        assert not subject.columns[0].nullable
+        assert any(index.primary and index.columns == ["id"] for index in subject.indexes)
+        assert any(index.columns == ["teacher_id"] for index in subject.indexes)
+        assert {constraint.type for constraint in subject.constraints} >= {"p", "f"}
+
+        with explain() as e:
+            assert introspection.get_tables([("public", name) for name in names] + [("public", "cte")]) == tables
+        assert e.n_queries == 0, "Tables, and names which are not tables, are cached"
+
+    def test_optimization_prompt_describes_tables(self):
+        with explain() as e:
+            list(Subject.objects.filter(teacher__name="1"))
+
+        with explain() as prompt_queries:
+            prompt = e.slowest.optimization_prompt(analyze=False)
+        assert "public.school_subject" in prompt and "public.school_teacher" in prompt
+        assert "- teacher_id: bigint" in prompt
+        assert "FOREIGN KEY (teacher_id)" in prompt
+        assert len([q for q in prompt_queries.queries if "pg_attribute" in q.raw_sql]) == 1
+
+    def test_distinct_values(self):
+        column = introspection.ColumnInfo("name", "text", nullable=False, n_distinct=-0.5)
+        assert column.distinct_values(1000) == 500
+        assert introspection.ColumnInfo("name", "text", nullable=False, n_distinct=20).distinct_values(1000) == 20
+        assert introspection.ColumnInfo("name", "text", nullable=False).distinct_values(1000) is None
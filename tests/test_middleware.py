@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, modify_settings, override_settings
+from django.urls import reverse
+
+from django_pev.middleware import CAPTURE_HEADER, sign_capture_header
+from django_pev.utils.captured_requests import get_cache_key, get_captured_requests
+from example.school.models import Student, Subject, Teacher
+
+
+@modify_settings(MIDDLEWARE={"append": "django_pev.middleware.ExplainMiddleware"})
+class TestExplainMiddleware(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = Teacher.objects.create(name="Maths Teacher")
+        maths = Subject.objects.create(name="Maths", teacher=teacher)
+        for _ in range(5):
+            Student.objects.create(name="a").subjects.set([maths])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_requests_are_not_captured_by_default(self):
+        self.client.get("/students/")
+
+        assert get_captured_requests() == []
+
+    @override_settings(DJANGO_PEV_SAMPLE_RATE=1)
+    def test_sampled_requests_are_stored(self):
+        self.client.get("/students/")
+
+        [captured_request] = get_captured_requests()
+        assert captured_request.url == "/students/"
+        assert captured_request.reason == "sampled"
+        assert captured_request.n_queries == 6
+        assert captured_request.n_nplusones == 1
+
+        # The stored ExplainSet can be browsed in the explain view
+        self.client.force_login(User.objects.create_superuser("admin"))
+        response = self.client.get(reverse("django_pev:explain"), {"explainset_id": captured_request.explainset_id})
+        assert response.context["explain"].n_queries == 6
+        assert "N+1 Queries" in response.content.decode()
+
+    @override_settings(DJANGO_PEV_SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_requests_are_stored(self):
+        self.client.get("/students/")
+
+        assert [r.reason for r in get_captured_requests()] == ["slow"]
+
+    def test_signed_header_requests_are_stored(self):
+        self.client.get("/students/", headers={CAPTURE_HEADER: "forged"})
+        assert get_captured_requests() == []
+
+        self.client.get("/students/", headers={CAPTURE_HEADER: sign_capture_header()})
+        assert [r.reason for r in get_captured_requests()] == ["header"]
+
+    @override_settings(DJANGO_PEV_SAMPLE_RATE=1, DJANGO_PEV_CAPTURED_REQUEST_QUERIES=2)
+    def test_stored_requests_are_summarized(self):
+        self.client.get("/students/")
+
+        [captured_request] = get_captured_requests()
+        explain_set = cache.get(get_cache_key(captured_request.explainset_id))
+        assert len(explain_set.queries) == 2
+        assert explain_set.n_queries == 6, "Counts cover every query"
+        assert len(explain_set.nplusones) == 1
+        assert all(q.params is None for q in explain_set.queries), "Params are interpolated into the SQL"
+        assert explain_set.slowest.explain(analyze=False)
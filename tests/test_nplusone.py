@@ -0,0 +1,79 @@
+from django.test import TestCase, override_settings
+
+from django_pev import explain
+from example.school.models import Student, Subject, Teacher
+
+
+class TestNPlusOne(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        subjects = []
+        for i in range(5):
+            teacher = Teacher.objects.create(name=f"Teacher {i}")
+            subjects.append(Subject.objects.create(name=f"Subject {i}", teacher=teacher))
+        for i in range(5):
+            Student.objects.create(name=f"Student {i}").subjects.set(subjects)
+
+    def assert_suggests(self, e, suggestion):
+        (group,) = e.find_nplusones()
+        assert group.count == 5
+        assert [str(s) for s in group.suggestions] == [suggestion]
+
+    def test_foreign_key_suggests_select_related(self):
+        with explain() as e:
+            for subject in Subject.objects.all():
+                subject.teacher  # noqa: B018
+
+        self.assert_suggests(e, 'Subject.objects.select_related("teacher")')
+
+    def test_reverse_foreign_key_suggests_prefetch_related(self):
+        with explain() as e:
+            for teacher in Teacher.objects.all():
+                list(teacher.subject_set.all())
+
+        self.assert_suggests(e, 'Teacher.objects.prefetch_related("subject_set")')
+
+    def test_many_to_many_suggests_prefetch_related(self):
+        with explain() as e:
+            for student in Student.objects.all():
+                list(student.subjects.all())
+
+        self.assert_suggests(e, 'Student.objects.prefetch_related("subjects")')
+
+        with explain() as e:
+            for subject in Subject.objects.all():
+                list(subject.student_set.all())
+
+        self.assert_suggests(e, 'Subject.objects.prefetch_related("student_set")')
+
+    def test_groups_by_call_site(self):
+        with explain() as e:
+            for subject in Subject.objects.all():
+                subject.teacher  # noqa: B018
+            for subject in Subject.objects.all():
+                subject.teacher  # noqa: B018
+
+        groups = e.find_nplusones()
+        assert [group.count for group in groups] == [5, 5]
+        assert groups[0].call_site != groups[1].call_site
+        assert groups[0].wasted_duration < groups[0].total_duration
+        assert list(e.nplusones.values()) == [10], "nplusones still groups by fingerprint only"
+
+    def test_threshold(self):
+        with explain() as e:
+            for subject in Subject.objects.all():
+                subject.teacher  # noqa: B018
+
+        assert e.find_nplusones(threshold=5) == []
+        with override_settings(DJANGO_PEV_NPLUSONE_THRESHOLD=5):
+            assert e.find_nplusones() == []
+            assert e.nplusones == {}
+
+    def test_sampled_queries_are_grouped_by_fingerprint(self):
+        with explain(sample_rate=0) as e:
+            for subject in Subject.objects.all():
+                subject.teacher  # noqa: B018
+
+        (group,) = e.find_nplusones()
+        assert group.call_site is None
+        assert group.count == 5
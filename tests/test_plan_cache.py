@@ -0,0 +1,67 @@
+import gc
+import weakref
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from django_pev import explain
+from django_pev.utils.plan_cache import plan_cache, plan_cache_key
+from example.school.models import Student, Teacher
+
+
+class TestPlanCache(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+    def test_queries_of_a_fingerprint_share_their_plan(self):
+        with explain() as e:
+            for i in range(3):
+                list(Student.objects.filter(name=str(i)))
+
+        first, *others = e.queries
+        plan = first.explain(analyze=False)
+        with self.assertNumQueries(0):
+            assert all(q.explain(analyze=False) == plan for q in others)
+
+    def test_explains_are_not_kept_alive(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+
+        query = e.queries[0]
+        query.explain(analyze=False)
+        ref = weakref.ref(query)
+        del e, query
+        gc.collect()
+
+        assert ref() is None, "The plan cache should not hold a reference to the Explain"
+
+    @override_settings(DJANGO_PEV_PLAN_CACHE_SIZE=1)
+    def test_cache_is_bounded(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+            list(Teacher.objects.filter(name="a"))
+
+        for query in e.queries:
+            query.explain(analyze=False)
+
+        assert len(plan_cache) == 1
+
+    @override_settings(DJANGO_PEV_PLAN_CACHE_TIMEOUT=0)
+    def test_entries_expire(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+
+        e.queries[0].explain(analyze=False)
+        with self.assertNumQueries(1):
+            e.queries[0].explain(analyze=False)
+
+    @override_settings(DJANGO_PEV_PLAN_CACHE_BACKEND="default")
+    def test_plans_are_shared_through_the_django_cache(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+
+        query = e.queries[0]
+        plan = query.explain(analyze=False)
+
+        key = plan_cache_key("explain", query.db_alias, query.fingerprint, False)
+        assert caches["default"].get(key) == plan
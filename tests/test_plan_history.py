@@ -0,0 +1,137 @@
+import copy
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from django_pev import explain
+from django_pev.models import PlanSnapshot
+from django_pev.utils.plan_cache import plan_cache
+from django_pev.utils.plan_history import (
+    diff_snapshots,
+    fingerprint_hash,
+    get_plan_history,
+    record_plan,
+    record_plans,
+)
+from django_pev.utils.plans import diff_plans, parse_plan
+from example.school.models import Student
+
+INDEX_SCAN_PLAN = {
+    "Plan": {
+        "Node Type": "Sort",
+        "Total Cost": 10.0,
+        "Plan Rows": 10,
+        "Actual Rows": 10,
+        "Actual Loops": 1,
+        "Actual Total Time": 1.0,
+        "Sort Space Type": "Memory",
+        "Plans": [
+            {
+                "Node Type": "Index Scan",
+                "Relation Name": "school_student",
+                "Index Name": "school_student_name_idx",
+                "Total Cost": 8.0,
+                "Plan Rows": 10,
+                "Actual Rows": 10,
+                "Actual Loops": 1,
+                "Actual Total Time": 0.5,
+            }
+        ],
+    },
+    "Execution Time": 1.1,
+}
+
+
+def seq_scan_plan():
+    plan = copy.deepcopy(INDEX_SCAN_PLAN)
+    plan["Plan"].update({"Total Cost": 2500.0, "Sort Space Type": "Disk", "Sort Space Used": 2048})
+    plan["Plan"]["Plans"][0].update({"Node Type": "Seq Scan", "Index Name": None, "Total Cost": 2400.0})
+    plan["Execution Time"] = 80.0
+    return plan
+
+
+class TestDiffPlans(SimpleTestCase):
+    def test_identical_plans_have_no_changes(self):
+        assert diff_plans(parse_plan(INDEX_SCAN_PLAN), parse_plan(INDEX_SCAN_PLAN)) == []
+        assert parse_plan(INDEX_SCAN_PLAN).shape_hash == parse_plan(INDEX_SCAN_PLAN).shape_hash
+
+    def test_regressions_are_reported(self):
+        old, new = parse_plan(INDEX_SCAN_PLAN), parse_plan(seq_scan_plan())
+        changes = diff_plans(old, new)
+
+        assert old.shape_hash != new.shape_hash
+        assert [(c.kind, c.message) for c in changes] == [
+            ("cost", "Total cost 10.00 -> 2,500.00"),
+            ("cost", "Execution time 1.100ms -> 80.000ms"),
+            ("spill", "Sort: sort spilled 2048kB to disk"),
+            ("cost", "Sort: cost 2.00 -> 100.00"),
+            ("node_type", "Index Scan using school_student_name_idx on school_student -> Seq Scan on school_student"),
+        ]
+
+
+class TestPlanHistory(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+        Student.objects.create(name="a")
+
+    def test_record_plans(self):
+        with explain(url="/students/") as e:
+            list(Student.objects.filter(name="a"))
+            list(Student.objects.filter(name="b"))
+
+        [first] = record_plans(e)
+        second = record_plan(e.queries[1])
+
+        assert first.url == "/students/"
+        assert first.shape_hash == second.shape_hash
+        assert get_plan_history(e.queries[0].fingerprint) == [second, first]
+        assert diff_snapshots(first, second) == []
+
+    def test_plan_history_view(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+        query = e.queries[0]
+        snapshot = record_plan(query)
+        old = PlanSnapshot.objects.create(
+            fingerprint=snapshot.fingerprint,
+            fingerprint_hash=snapshot.fingerprint_hash,
+            db_alias="default",
+            shape_hash=parse_plan(INDEX_SCAN_PLAN).shape_hash,
+            total_cost=10.0,
+            plan=INDEX_SCAN_PLAN,
+            sql=snapshot.sql,
+        )
+        PlanSnapshot.objects.filter(id=old.id).update(created=snapshot.created.replace(year=2000))
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+        response = self.client.get(reverse("django_pev:plan-history"))
+        assert response.context["fingerprints"][0]["shapes"] == 2
+
+        response = self.client.get(reverse("django_pev:plan-history"), {"fingerprint_hash": snapshot.fingerprint_hash})
+        assert response.context["new"] == snapshot
+        assert response.context["old"] == old
+        assert any(change.kind == "node_type" for change in response.context["changes"])
+
+    def test_local_plans_are_compared_without_recording(self):
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+        query = e.queries[0]
+        old = PlanSnapshot.objects.create(
+            fingerprint=query.fingerprint,
+            fingerprint_hash=fingerprint_hash(query.fingerprint),
+            db_alias="default",
+            shape_hash=parse_plan(INDEX_SCAN_PLAN).shape_hash,
+            total_cost=10.0,
+            plan=INDEX_SCAN_PLAN,
+            sql=query.sql,
+        )
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+        pev_result = query.visualize(analyze=False, local=True)
+        response = self.client.get(pev_result.url)
+        assert response.context["snapshot"] is None
+        assert response.context["previous_snapshot"] == old
+        assert response.context["plan_changes"]
+        assert PlanSnapshot.objects.count() == 1
+        pev_result.delete()
@@ -0,0 +1,95 @@
+from django.test import SimpleTestCase, TestCase
+
+from django_pev import explain
+from django_pev.utils.plan_cache import plan_cache
+from django_pev.utils.plans import parse_plan
+from example.school.models import Student
+
+NESTED_LOOP_PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Nested Loop",
+            "Total Cost": 5000.0,
+            "Plan Rows": 10,
+            "Actual Rows": 20000,
+            "Actual Loops": 1,
+            "Actual Total Time": 105.0,
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Parent Relationship": "Outer",
+                    "Relation Name": "school_student",
+                    "Total Cost": 1000.0,
+                    "Plan Rows": 20000,
+                    "Actual Rows": 20000,
+                    "Actual Loops": 1,
+                    "Actual Total Time": 30.0,
+                    "Rows Removed by Filter": 5000,
+                },
+                {
+                    "Node Type": "Index Scan",
+                    "Parent Relationship": "Inner",
+                    "Relation Name": "school_subject",
+                    "Index Name": "school_subject_pkey",
+                    "Total Cost": 0.2,
+                    "Plan Rows": 1,
+                    "Actual Rows": 1,
+                    "Actual Loops": 20000,
+                    "Actual Total Time": 0.002,
+                },
+            ],
+        },
+        "Planning Time": 0.5,
+        "Execution Time": 101.0,
+    }
+]
+
+
+class TestPlanModel(SimpleTestCase):
+    def test_exclusive_time_and_hotspots(self):
+        plan = parse_plan(NESTED_LOOP_PLAN)
+        nested_loop, seq_scan, index_scan = plan.nodes()
+
+        assert plan.analyzed
+        assert plan.execution_time == 101.0
+        self.assertAlmostEqual(index_scan.inclusive_time, 40.0)
+        self.assertAlmostEqual(nested_loop.exclusive_time, 35.0)
+        assert [node.label for node in plan.hotspots(3)] == [
+            "Index Scan using school_subject_pkey on school_subject",
+            "Nested Loop",
+            "Seq Scan on school_student",
+        ]
+
+    def test_findings(self):
+        findings = parse_plan(NESTED_LOOP_PLAN).findings()
+
+        assert [(f.kind, f.node.node_type) for f in findings] == [
+            ("misestimate", "Nested Loop"),
+            ("nested_loop", "Nested Loop"),
+            ("seq_scan", "Seq Scan"),
+        ]
+        assert "underestimated by 3.3 orders of magnitude" in findings[0].message
+        assert "25,000 rows" in findings[2].message, "Rows removed by the filter are scanned too"
+
+    def test_thresholds(self):
+        plan = parse_plan(NESTED_LOOP_PLAN)
+
+        assert plan.findings(misestimate_magnitude=4, large_relation_rows=10**6, nested_loop_outer_rows=10**6) == []
+
+
+class TestExplainPlan(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+    def test_explain_returns_a_parsed_plan(self):
+        Student.objects.create(name="a")
+        with explain() as e:
+            list(Student.objects.filter(name="a"))
+
+        plan = e.queries[0].plan(analyze=True)
+
+        assert plan.analyzed
+        assert plan.root.relation_name == "school_student"
+        assert plan.root.total_rows == 1
+        assert plan.hotspots(1) == [plan.root]
+        assert not e.queries[0].plan(analyze=False).analyzed
@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_pev import explain
+from django_pev.utils import queries
+
+
+class TestQueryStats(TestCase):
+    def setUp(self):
+        queries.clear_query_stats_cache()
+        self.addCleanup(queries.clear_query_stats_cache)
+
+    def test_capabilities_are_probed_once_per_connection(self):
+        queries.get_capabilities()
+        with explain() as e:
+            capabilities = queries.get_capabilities()
+            queries._shared_blk_read_time_column()
+        assert e.n_queries == 0
+        assert capabilities.blk_read_time_column in ("blk_read_time", "shared_blk_read_time")
+
+    def test_queries_view_reads_statements_once(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        installed = queries.get_capabilities().installed
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/django-pev/queries")
+        assert response.status_code == 200
+        statements = [q for q in context.captured_queries if "pg_stat_statements" in q["sql"]]
+        assert len(statements) == (1 if installed else 0), "The page of statements is read in one query"
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get("/django-pev/queries")
+        assert not [q for q in context.captured_queries if "pg_stat_statements" in q["sql"]], "The page is cached"
+
+    def test_search_reads_pg_stat_statements(self):
+        if not queries.is_pg_stat_statements_installed():
+            self.skipTest("pg_stat_statements is not installed")
+
+        page = queries.search_query_stats(order_by="mean_time")
+        assert page.installed
+        mean_times = [q.mean_time for q in page.queries]
+        assert mean_times == sorted(mean_times, reverse=True)
+
+    def test_search_query_stats(self):
+        with self.assertRaises(ValueError):
+            queries.search_query_stats(order_by="query; DROP TABLE")
+
+        page = queries.search_query_stats(min_calls=1, table="school_student", search="100%", order_by="calls")
+        assert page.page == 1
+        assert page.installed == queries.get_capabilities().installed
+        assert len(page.queries) <= page.page_size
+
+    def test_filters_with_equal_params_are_cached_apart(self):
+        table = queries._query_stats_page_key("AND query ~* %s", [r"\mschool_student\M"], "total_time", 1, 50)
+        user = queries._query_stats_page_key("AND rolname = %s", [r"\mschool_student\M"], "total_time", 1, 50)
+        assert table != user
+
+    def test_queries_page_filters(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+        response = self.client.get("/django-pev/queries?table=school_student&min_calls=2&order_by=mean_time&page=2")
+        assert response.status_code == 200
+        assert response.context["order_by"] == "mean_time"
+        assert response.context["stats_page"].page == 2
+
+        response = self.client.get("/django-pev/queries?table=drop table&order_by=nope")
+        assert response.status_code == 200
+        assert response.context["form"].errors
+
+        assert self.client.get("/django-pev/queries/text?query_id=abc").status_code == 400
+
+    def test_query_id_from_explain_verbose(self):
+        if connection.pg_version < 140000:
+            self.skipTest("Query identifiers are computed by PostgreSQL 14+")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL compute_query_id = on")
+        with explain() as e:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT %s AS query_id_test", [1])
+        query_id = e.queries[0].query_id()
+        assert isinstance(query_id, int)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL compute_query_id = off")
+        assert e.queries[0].query_id() == query_id, "The plan is cached per fingerprint"
+
+    def test_statement_stats(self):
+        with explain() as e:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT %s AS statement_stats_test", [1])
+
+        if not queries.get_capabilities().installed:
+            with explain() as lookups:
+                assert e.statement_stats() == {}
+                assert queries.get_statement_stats([1]) == {}
+            assert lookups.n_queries == 0, "Nothing is explained without pg_stat_statements"
+            return
+
+        query_ids = [int(q.query_id) for q in queries.search_query_stats(page_size=5).queries]
+        stats = queries.get_statement_stats(query_ids)
+        assert set(stats) == set(query_ids)
+        assert all(0 <= s.percent_time <= 100 for s in stats.values())
+        assert set(e.statement_stats()) <= {e.queries[0].fingerprint}
@@ -0,0 +1,123 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from django_pev import explain
+from django_pev.models import QueryStatsSample
+from django_pev.utils.queries import is_pg_stat_statements_installed
+from django_pev.utils.query_history import (
+    LiveCounters,
+    build_query_stats_window,
+    diff_counters,
+    get_query_stats_window,
+    get_recent_load,
+    prune_query_stats_samples,
+    record_query_stats_sample,
+)
+
+NOW = timezone.now()
+RESET = NOW - datetime.timedelta(days=30)
+
+
+def sample(minutes_ago, counters, stats_reset=RESET):
+    return QueryStatsSample(
+        db_alias="default",
+        stats_reset=stats_reset,
+        counters=counters,
+        created=NOW - datetime.timedelta(minutes=minutes_ago),
+    )
+
+
+class TestQueryHistory(TestCase):
+    def test_diff_counters(self):
+        begin = {"1": [10, 100.0, 10, 5, 0], "2": [5, 50.0, 5, 0, 0], "3": [100, 10.0, 0, 0, 0]}
+        end = {"1": [15, 160.0, 20, 5, 1], "2": [5, 50.0, 5, 0, 0], "3": [2, 1.0, 0, 0, 0], "4": [1, 1.0, 1, 0, 0]}
+
+        assert diff_counters(begin, end) == {
+            "1": [5, 60.0, 10, 0, 1],
+            # Statements whose counters went down were reset in between
+            "3": [2, 1.0, 0, 0, 0],
+            "4": [1, 1.0, 1, 0, 0],
+        }
+
+    def test_window_deltas_and_movers(self):
+        previous = sample(120, {"1": [0, 0.0, 0, 0, 0], "2": [0, 0.0, 0, 0, 0]})
+        begin = sample(60, {"1": [10, 100.0, 10, 0, 0], "2": [10, 1000.0, 10, 0, 0]})
+        live = LiveCounters(
+            taken_at=NOW,
+            stats_reset=RESET,
+            counters={"1": [3610, 5100.0, 3610, 0, 0], "2": [20, 2000.0, 20, 0, 0]},
+        )
+
+        window = build_query_stats_window(begin, live, previous)
+
+        assert window.seconds == 3600
+        recent = {delta.query_id: delta for delta in window.deltas}
+        assert recent["1"].calls == 3600
+        assert recent["1"].calls_per_second == 1
+        assert recent["1"].total_time_change == 4900
+        assert recent["2"].total_time_change == 0
+        assert [delta.query_id for delta in window.movers()] == ["1"]
+        assert [delta.query_id for delta in window.sorted_by("mean_time")] == ["2", "1"]
+
+        assert [delta.query_id for delta in window.top(1).deltas] == ["1"]
+        assert len(window.top(1).sorted_by("total_time")) == 1
+
+    def test_window_after_a_reset(self):
+        begin = sample(60, {"1": [10, 100.0, 10, 0, 0]})
+        reset = NOW - datetime.timedelta(minutes=10)
+        live = LiveCounters(taken_at=NOW, stats_reset=reset, counters={"1": [20, 200.0, 20, 0, 0]})
+
+        window = build_query_stats_window(begin, live)
+
+        assert window.start == reset
+        assert window.deltas[0].calls == 20
+        assert not window.has_previous
+
+    def test_prune_samples(self):
+        QueryStatsSample.objects.create(db_alias="default", counters={})
+        QueryStatsSample.objects.filter().update(created=NOW - datetime.timedelta(days=8))
+        QueryStatsSample.objects.create(db_alias="default", counters={})
+
+        assert prune_query_stats_samples() == 1
+        assert QueryStatsSample.objects.count() == 1
+
+    def test_queries_page_without_samples(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        response = self.client.get("/django-pev/queries?window=5m")
+
+        assert response.status_code == 200
+        assert response.context["show_window"]
+        assert get_query_stats_window(datetime.timedelta(minutes=5)) is None
+
+    def test_window_is_computed_when_asked_for(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        QueryStatsSample.objects.create(db_alias="default", counters={})
+
+        with explain(db_alias="default") as e:
+            response = self.client.get("/django-pev/queries")
+        assert response.status_code == 200
+        assert not response.context["show_window"]
+        assert "window" not in response.context
+        assert not [q for q in e.queries if "query_stats_sample" in q.raw_sql], "Samples should not be read"
+
+        response = self.client.get("/django-pev/queries?since=2024-13-45T00:00")
+        assert response.status_code == 200
+        assert "since" in response.context["form"].errors
+        assert "window" not in response.context
+
+    def test_record_sample(self):
+        if not is_pg_stat_statements_installed():
+            self.skipTest("pg_stat_statements is not installed")
+
+        begin = record_query_stats_sample()
+        assert begin is not None
+        assert get_query_stats_window(datetime.timedelta(minutes=5)) is not None
+
+        window = get_recent_load(datetime.timedelta(minutes=5), limit=5)
+        assert window is not None
+        assert len(window.deltas) <= 10
+        assert all(delta.query for delta in window.deltas)
+        assert get_recent_load(datetime.timedelta(minutes=5), limit=5) == window